@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark delle funzioni OPC UA contro un asyncua.Server locale.
+
+Avvia un server su localhost con uno spazio indirizzi sintetico (profondità,
+fan-out e numero di variabili configurabili), misura i tempi delle funzioni di
+src/plc_opcua_reader.py e conta i round trip per tipo di richiesta, con una
+latenza artificiale opzionale. Il risultato è un JSON su stdout o su file.
+
+Modalità (--mode):
+    read          browse, letture singole e massive, risoluzione dei percorsi
+    subscription  notifiche al secondo di SessionSupervisor.subscribe mentre il
+                  server aggiorna tutte le variabili
+    history       history_read_raw_window ed export_history su uno storico
+                  sintetico (il server tronca a NumValuesPerNode)
+    all           tutte le precedenti (default)
+
+Esempio:
+    python benchmarks/bench_opcua.py --depth 2 --fanout 4 --variables 50 --latency-ms 5
+    python benchmarks/bench_opcua.py --mode history --history-nodes 20 --history-samples 10000
+"""
+import argparse
+import asyncio
+import builtins
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from asyncua import Server, ua  # noqa: E402
+
+import plc_opcua_reader  # noqa: E402
+from plc_opcua_history import export_history, history_read_raw_window  # noqa: E402
+from plc_opcua_reader import (  # noqa: E402
+    BackgroundEventLoop,
+    NodeRegistry,
+    browse_nodes,
+    connect_to_opcua_server,
+    disconnect_from_server,
+    export_variables_to_file,
+    read_node_value,
+    read_nodes_values_bulk,
+)
+from plc_opcua_session import SessionSupervisor  # noqa: E402
+
+BENCH_NAMESPACE = "urn:py-plc-utils:bench"
+MODES = ("read", "subscription", "history", "all")
+# Inizio dello storico sintetico: i campioni cadono a metà secondo, mai sui bordi delle finestre
+HISTORY_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def find_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def build_address_space(server, depth, fanout, variables):
+    """Crea Objects/Bench con un albero di oggetti e variabili Double; restituisce le foglie."""
+    idx = await server.register_namespace(BENCH_NAMESPACE)
+    root = await server.nodes.objects.add_object(ua.NodeId("Bench", idx), ua.QualifiedName("Bench", idx))
+    leaves = []
+
+    async def _populate(parent, path, level):
+        variable_ids = []
+        for i in range(variables):
+            name = f"Var{i}"
+            node_id = ua.NodeId(f"{path}.{name}", idx)
+            await parent.add_variable(node_id, ua.QualifiedName(name, idx), float(i))
+            variable_ids.append((node_id, f"{path.replace('.', '/')}/{name}"))
+        if level == depth:
+            leaves.append((parent.nodeid, path, variable_ids))
+            return
+        for j in range(fanout):
+            name = f"Obj{j}"
+            child_path = f"{path}.{name}"
+            child = await parent.add_object(ua.NodeId(child_path, idx), ua.QualifiedName(name, idx))
+            await _populate(child, child_path, level + 1)
+
+    await _populate(root, "Bench", 0)
+    return idx, leaves
+
+
+def start_server(depth, fanout, variables):
+    """Avvia il server su un thread dedicato e restituisce (endpoint, loop, server, foglie)."""
+    endpoint = f"opc.tcp://127.0.0.1:{find_free_port()}"
+    server_loop = BackgroundEventLoop(name="bench-server")
+
+    async def _start():
+        server = Server()
+        await server.init()
+        server.set_endpoint(endpoint)
+        idx, leaves = await build_address_space(server, depth, fanout, variables)
+        await server.start()
+        return server, idx, leaves
+
+    server, idx, leaves = server_loop.run_until_complete(_start())
+    return endpoint, server_loop, server, idx, leaves
+
+
+def install_round_trip_counter(client, latency_s):
+    """Conta le richieste inviate per tipo e aggiunge una latenza artificiale a ciascuna."""
+    protocol = client.uaclient.protocol
+    original_send_request = protocol.send_request
+    counts = Counter()
+
+    async def _send_request(request, *args, **kwargs):
+        counts[type(request).__name__] += 1
+        if latency_s:
+            await asyncio.sleep(latency_s)
+        return await original_send_request(request, *args, **kwargs)
+
+    protocol.send_request = _send_request
+    return counts
+
+
+def run_operation(name, counts, repeat, func, items=None):
+    """Esegue func repeat volte in silenzio e restituisce tempi e round trip medi."""
+    timings = []
+    round_trips = Counter()
+    for _ in range(repeat):
+        counts.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        round_trips.update(counts)
+
+    per_run = {request: total / repeat for request, total in sorted(round_trips.items())}
+    return {
+        'operation': name,
+        'items': items,
+        'repeat': repeat,
+        'seconds_min': min(timings),
+        'seconds_mean': sum(timings) / len(timings),
+        'round_trips': per_run,
+        'round_trips_total': sum(per_run.values()),
+    }
+
+
+class NotificationCounter:
+    """Handler di sottoscrizione che conta le notifiche e segnala il raggiungimento di un obiettivo."""
+
+    def __init__(self):
+        self.count = 0
+        self.target = None
+        self.reached = threading.Event()
+        self._lock = threading.Lock()
+
+    def expect(self, target):
+        with self._lock:
+            self.count = 0
+            self.target = target
+            self.reached.clear()
+
+    def datachange_notification(self, node, value, data):
+        with self._lock:
+            self.count += 1
+            if self.target is not None and self.count >= self.target:
+                self.reached.set()
+
+
+def write_round(server_loop, server, node_ids, value):
+    """Aggiorna lato server tutte le variabili con valori diversi dal giro precedente."""
+    async def _write():
+        for offset, node_id in enumerate(node_ids):
+            await server.write_attribute_value(
+                node_id, ua.DataValue(ua.Variant(float(value + offset), ua.VariantType.Double)))
+
+    server_loop.run_until_complete(_write())
+
+
+def run_subscription_benchmark(endpoint, server_loop, server, node_ids, args):
+    """Misura il throughput delle notifiche ricevute tramite SessionSupervisor.subscribe."""
+    supervisor = SessionSupervisor(endpoint)
+    if not _quiet(supervisor.start):
+        raise SystemExit("Connessione del supervisore al server di benchmark fallita.")
+
+    handler = NotificationCounter()
+    timeout = max(10.0, args.updates * args.publish_ms / 1000.0 * 4)
+    try:
+        counts = install_round_trip_counter(supervisor.client, args.latency_ms / 1000.0)
+        # Le notifiche iniziali (valore corrente di ogni nodo) non rientrano nella misura
+        handler.expect(len(node_ids))
+        if _quiet(supervisor.subscribe, [node_id.to_string() for node_id in node_ids], handler,
+                  args.publish_ms) is None:
+            raise SystemExit("Creazione della sottoscrizione fallita.")
+        handler.reached.wait(timeout)
+
+        expected = len(node_ids) * args.updates
+        handler.expect(expected)
+        counts.clear()
+        start = time.perf_counter()
+        for update in range(1, args.updates + 1):
+            write_round(server_loop, server, node_ids, update * 1000)
+            # Aggiornamenti più fitti del publishing interval verrebbero accorpati dal server
+            time.sleep(args.publish_ms / 1000.0)
+        handler.reached.wait(timeout)
+        elapsed = time.perf_counter() - start
+        received = handler.count
+        round_trips = dict(sorted(counts.items()))
+    finally:
+        _quiet(supervisor.stop)
+
+    return {
+        'operation': "SessionSupervisor.subscribe",
+        'items': len(node_ids),
+        'updates': args.updates,
+        'publish_ms': args.publish_ms,
+        'notifications': received,
+        'notifications_expected': expected,
+        'seconds': elapsed,
+        'notifications_per_second': received / elapsed if elapsed else None,
+        'round_trips': round_trips,
+        'round_trips_total': sum(round_trips.values()),
+    }
+
+
+def populate_history(server_loop, server, node_ids, samples):
+    """Storicizza i nodi e carica direttamente nello storage samples campioni per nodo, uno al secondo."""
+    async def _populate():
+        storage = server.iserver.history_manager.storage
+        for node_id in node_ids:
+            await server.historize_node_data_change(server.get_node(node_id), period=None)
+            for i in range(samples):
+                timestamp = HISTORY_START + timedelta(seconds=i + 0.5)
+                await storage.save_node_value(node_id, ua.DataValue(
+                    ua.Variant(float(i), ua.VariantType.Double), SourceTimestamp=timestamp, ServerTimestamp=timestamp))
+
+    server_loop.run_until_complete(_populate())
+
+
+def run_history_benchmarks(client, loop, counts, node_ids, args):
+    """Misura la lettura dello storico grezzo, in una sola finestra e con l'esportazione a finestre parallele."""
+    end = HISTORY_START + timedelta(seconds=args.history_samples)
+    items = len(node_ids) * args.history_samples
+    received = Counter()
+
+    def _read_window():
+        received.clear()
+        loop.run_until_complete(history_read_raw_window(
+            client, node_ids, HISTORY_START, end,
+            lambda node_id, data_values: received.update({'samples': len(data_values)}),
+            args.values_per_node))
+        if received['samples'] != items:
+            raise RuntimeError(f"Campioni letti {received['samples']} invece di {items}")
+
+    def _export():
+        written = export_history(client, loop, [node_id.to_string() for node_id in node_ids],
+                                 HISTORY_START, end, "history.csv",
+                                 window=timedelta(seconds=max(1, args.history_samples // 4)),
+                                 values_per_node=args.values_per_node)
+        if written != items:
+            raise RuntimeError(f"Campioni esportati {written} invece di {items}")
+
+    return [
+        run_operation("history_read_raw_window", counts, args.repeat, _read_window, items=items),
+        run_operation("export_history", counts, args.repeat, _export, items=items),
+    ]
+
+
+def run_read_benchmarks(client, loop, counts, args, leaf_node_id_str, leaf_variables, single_reads,
+                        node_id_strings, browse_paths):
+    """Browse, letture singole e massive, risoluzione dei percorsi simbolici."""
+    results = [
+        run_operation(
+            "browse_nodes", counts, args.repeat,
+            lambda: browse_nodes(client, loop, leaf_node_id_str, show_values=False),
+            items=len(leaf_variables)),
+        run_operation(
+            "browse_nodes(show_values)", counts, args.repeat,
+            lambda: browse_nodes(client, loop, leaf_node_id_str, show_values=True),
+            items=len(leaf_variables)),
+    ]
+    with mock.patch.object(builtins, "input", return_value=leaf_node_id_str):
+        results.append(run_operation(
+            "export_variables_to_file", counts, args.repeat,
+            lambda: export_variables_to_file(client, loop),
+            items=len(leaf_variables)))
+    results.append(run_operation(
+        "read_node_value", counts, args.repeat,
+        lambda: [read_node_value(client, loop, node_id) for node_id in single_reads],
+        items=len(single_reads)))
+    results.append(run_operation(
+        "read_nodes_values_bulk", counts, args.repeat,
+        lambda: read_nodes_values_bulk(client, loop, node_id_strings),
+        items=len(node_id_strings)))
+    results.append(run_operation(
+        "NodeRegistry.resolve", counts, args.repeat,
+        lambda: NodeRegistry(client, loop, register_nodes=False).resolve(browse_paths),
+        items=len(browse_paths)))
+    results.append(run_operation(
+        "read_nodes_values_bulk(browse_paths)", counts, args.repeat,
+        lambda: read_nodes_values_bulk(client, loop, browse_paths),
+        items=len(browse_paths)))
+    return results
+
+
+def run_benchmarks(args):
+    endpoint, server_loop, server, idx, leaves = start_server(args.depth, args.fanout, args.variables)
+    # I messaggi delle funzioni sono soppressi per non sporcare il JSON su stdout
+    client, loop = _quiet(connect_to_opcua_server, endpoint)
+    if client is None:
+        raise SystemExit("Connessione al server di benchmark fallita.")
+
+    counts = install_round_trip_counter(client, args.latency_ms / 1000.0)
+    leaf_node_id, leaf_path, leaf_variables = leaves[0]
+    leaf_node_id_str = leaf_node_id.to_string()
+    all_variables = [variable for _, _, variables in leaves for variable in variables]
+    node_id_strings = [node_id.to_string() for node_id, _ in all_variables]
+    browse_paths = [f"Objects/{idx}:" + path.replace("/", f"/{idx}:") for _, path in all_variables]
+    single_reads = node_id_strings[:args.single_reads]
+
+    modes = ("read", "subscription", "history") if args.mode == "all" else (args.mode,)
+    history_nodes = [node_id for node_id, _ in all_variables[:args.history_nodes]]
+    if "history" in modes:
+        populate_history(server_loop, server, history_nodes, args.history_samples)
+
+    results = []
+    # La cartella temporanea (file esportati) viene rimossa alla fine
+    previous_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bench_opcua_") as workdir:
+        os.chdir(workdir)
+        try:
+            if "read" in modes:
+                results.extend(run_read_benchmarks(client, loop, counts, args, leaf_node_id_str, leaf_variables,
+                                                   single_reads, node_id_strings, browse_paths))
+            if "history" in modes:
+                results.extend(run_history_benchmarks(client, loop, counts, history_nodes, args))
+            if "subscription" in modes:
+                results.append(run_subscription_benchmark(
+                    endpoint, server_loop, server, [node_id for node_id, _ in all_variables], args))
+        finally:
+            os.chdir(previous_cwd)
+            _quiet(disconnect_from_server, client, loop)
+            server_loop.run_until_complete(server.stop())
+            server_loop.close()
+
+    return {
+        'config': {
+            'depth': args.depth,
+            'fanout': args.fanout,
+            'variables': args.variables,
+            'latency_ms': args.latency_ms,
+            'repeat': args.repeat,
+            'mode': args.mode,
+            'total_variables': len(all_variables),
+            'numpy': plc_opcua_reader.np is not None,
+        },
+        'results': results,
+    }
+
+
+def _quiet(func, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark OPC UA contro un server asyncua locale.")
+    parser.add_argument("--mode", choices=MODES, default="all", help="operazioni da misurare (default all)")
+    parser.add_argument("--depth", type=int, default=2, help="profondità dell'albero di oggetti")
+    parser.add_argument("--fanout", type=int, default=3, help="oggetti figli per livello")
+    parser.add_argument("--variables", type=int, default=20, help="variabili per oggetto")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latenza artificiale per richiesta")
+    parser.add_argument("--repeat", type=int, default=3, help="ripetizioni per operazione")
+    parser.add_argument("--single-reads", type=int, default=100, help="letture singole da eseguire")
+    parser.add_argument("--publish-ms", type=float, default=100.0,
+                        help="publishing interval della sottoscrizione (modalità subscription)")
+    parser.add_argument("--updates", type=int, default=20,
+                        help="aggiornamenti di tutte le variabili lato server (modalità subscription)")
+    parser.add_argument("--history-nodes", type=int, default=10, help="nodi storicizzati (modalità history)")
+    parser.add_argument("--history-samples", type=int, default=5000,
+                        help="campioni di storico per nodo (modalità history)")
+    parser.add_argument("--values-per-node", type=int, default=1000,
+                        help="NumValuesPerNode delle letture di storico (modalità history)")
+    parser.add_argument("--output", help="file JSON di output (default stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmarks(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Misura il tempo di avvio del punto di ingresso plc-utils e lo confronta con un budget.
+
+Ogni comando viene eseguito più volte in un processo nuovo; si riporta la
+mediana del tempo totale. Per ogni comando si verifica inoltre che gli stack
+dei protocolli (snap7, pymodbus, asyncua) non vengano importati. Il risultato
+è un JSON su stdout o su file; l'uscita è 1 se il budget non è rispettato.
+
+Esempio:
+    python benchmarks/bench_startup.py --runs 10 --budget-ms 150
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ENTRY_POINT = os.path.join(ROOT, "plc-utils")
+SRC = os.path.join(ROOT, "src")
+
+# Moduli pesanti che non devono essere importati dai comandi misurati
+HEAVY_MODULES = ("snap7", "pymodbus", "asyncua", "numpy", "pyarrow", "yaml")
+
+# Comandi che devono restare entro il budget senza toccare la rete
+COMMANDS = (
+    ("--help",),
+    ("scan", "--help"),
+    ("poll", "--help"),
+)
+
+LOADED_MODULES_PROBE = """
+import json, sys
+sys.path.insert(0, {src!r})
+import plc_utils
+try:
+    plc_utils.main({argv!r})
+except SystemExit:
+    pass
+print(json.dumps(sorted(name for name in {heavy!r} if name in sys.modules)), file=sys.stderr)
+"""
+
+
+def time_command(argv, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, ENTRY_POINT, *argv], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=False)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def time_command_python(runs):
+    """Tempo di avvio dell'interprete vuoto, come riferimento."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=False)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def heavy_modules_loaded(argv):
+    probe = LOADED_MODULES_PROBE.format(src=SRC, argv=list(argv), heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", probe], stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True, check=False)
+    return json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def run_benchmarks(args):
+    baseline = time_command_python(args.runs)
+    results = []
+    for argv in COMMANDS:
+        timings = time_command(argv, args.runs)
+        median = statistics.median(timings)
+        loaded = heavy_modules_loaded(argv)
+        results.append({
+            'command': " ".join(("plc-utils",) + argv),
+            'runs': args.runs,
+            'seconds_median': median,
+            'seconds_min': min(timings),
+            'heavy_modules_loaded': loaded,
+            'within_budget': median * 1000 <= args.budget_ms and not loaded,
+        })
+    return {
+        'config': {'runs': args.runs, 'budget_ms': args.budget_ms, 'python': sys.version.split()[0]},
+        'python_startup_seconds_median': baseline,
+        'results': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo di avvio di plc-utils rispetto a un budget.")
+    parser.add_argument("--runs", type=int, default=10, help="esecuzioni per comando")
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="budget per la mediana di ogni comando")
+    parser.add_argument("--output", help="file JSON di output (default stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmarks(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+    return 0 if all(result['within_budget'] for result in report['results']) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""
+Registrazione e riproduzione delle risposte grezze dei protocolli.
+
+In registrazione i reader passano al CaptureRecorder attivo il payload di ogni
+risposta (byte di read_area, registri e bit Modbus, DataValue OPC UA nella
+codifica binaria OPC UA) con timestamp e chiave della richiesta. I record
+finiscono in un file binario compatto:
+
+    intestazione  MAGIC (8 byte)
+    record        <timestamp f64><protocollo u8><operazione u8><len chiave u16><len payload u32>
+                  chiave UTF-8, payload
+
+La chiave è "sorgente|richiesta": la sorgente è il nome del dispositivo
+registrato dal collector per quella connessione (vuota nei reader interattivi),
+la richiesta identifica area/indirizzo/quantità o il NodeId letto. Prima di
+ogni lettura S7 o Modbus il collector registra anche un record "members" con
+la stessa chiave e i nomi dei tag che decodificherà dalla risposta, così un
+blocco riprodotto produce campioni solo per i tag letti davvero.
+
+In riproduzione il file viene mappato in memoria e ogni payload ripassa per le
+stesse funzioni di decodifica del collector (read_tag dei dispositivi S7 e
+Modbus, conversione dei DataValue OPC UA) e poi ai listener/sink, alla
+velocità originale o il più veloce possibile.
+
+Esempio:
+    python src/plc_collector.py tags.json --capture impianto.cap --output /dev/null
+    python src/plc_capture.py impianto.cap tags.json --fast --sqlite replay.db
+"""
+import argparse
+import mmap
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b"PLCCAP01"
+RECORD_HEADER = struct.Struct("<dBBHI")
+
+PROTOCOLS = ("s7", "modbus", "opcua")
+# L'operazione 'alias' associa un riferimento simbolico OPC UA al NodeId risolto,
+# 'members' elenca i tag decodificati dalla prossima risposta con la stessa chiave
+OPERATIONS = ("read_area", "read_coils", "read_discrete_inputs", "read_holding_registers",
+              "read_input_registers", "read", "alias", "members")
+PROTOCOL_CODES = {name: code for code, name in enumerate(PROTOCOLS)}
+OPERATION_CODES = {name: code for code, name in enumerate(OPERATIONS)}
+
+# Campioni accumulati in riproduzione veloce prima di passarli ai listener
+REPLAY_BATCH_SIZE = 1000
+
+_recorder = None
+
+
+def s7_request_key(area, db_number, start_offset, size):
+    area_name = getattr(area, "name", str(area))
+    return f"{area_name}:{db_number}:{start_offset}:{size}"
+
+
+def modbus_request_key(unit_id, address, count):
+    return f"{unit_id}:{address}:{count}"
+
+
+def encode_bits(bits):
+    return bytes(1 if bit else 0 for bit in bits)
+
+
+def encode_registers(registers):
+    return struct.pack(f"<{len(registers)}H", *registers)
+
+
+def decode_registers(payload):
+    return list(struct.unpack(f"<{len(payload) // 2}H", payload))
+
+
+class CaptureRecorder:
+    """Scrive i record su file; thread-safe, usato dai reader tramite get_recorder()."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._lock = threading.RLock()
+        self._aliases = set()
+        self._sources = {}
+
+    def register_source(self, connection, name):
+        """Associa una connessione (client snap7, pymodbus o asyncua) al nome del dispositivo."""
+        self._sources[id(connection)] = name
+
+    def record(self, protocol, operation, connection, request_key, payload, timestamp=None):
+        key_bytes = f"{self._sources.get(id(connection), '')}|{request_key}".encode("utf-8")
+        header = RECORD_HEADER.pack(time.time() if timestamp is None else timestamp,
+                                    PROTOCOL_CODES[protocol], OPERATION_CODES[operation],
+                                    len(key_bytes), len(payload))
+        with self._lock:
+            self._file.write(header)
+            self._file.write(key_bytes)
+            self._file.write(payload)
+            self.records += 1
+
+    def record_alias(self, protocol, connection, reference, node_id):
+        """Registra una sola volta l'associazione riferimento -> NodeId."""
+        with self._lock:
+            alias = (id(connection), reference, node_id)
+            if alias in self._aliases:
+                return
+            self._aliases.add(alias)
+            self.record(protocol, "alias", connection, reference, node_id.encode("utf-8"))
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def start_capture(path):
+    """Attiva la registrazione su path e restituisce il recorder."""
+    global _recorder
+    _recorder = CaptureRecorder(path)
+    return _recorder
+
+
+def stop_capture():
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close()
+    return recorder
+
+
+def get_recorder():
+    """Recorder attivo, o None se la registrazione è disattivata."""
+    return _recorder
+
+
+def register_source(connection, name):
+    """Se la registrazione è attiva, associa la connessione al nome del dispositivo."""
+    if _recorder is not None and connection is not None:
+        _recorder.register_source(connection, name)
+
+
+def record_members(protocol, connection, request_key, tag_names):
+    """Se la registrazione è attiva, registra i tag che la prossima risposta a request_key decodifica."""
+    if _recorder is not None and connection is not None:
+        _recorder.record(protocol, "members", connection, request_key, "\n".join(tag_names).encode("utf-8"))
+
+
+class CaptureReader:
+    """Legge un file di cattura mappato in memoria; i payload sono memoryview senza copia."""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # File vuoto: mmap non accetta lunghezza zero
+            self._file.close()
+            raise ValueError(f"File di cattura vuoto: {path}")
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} non è un file di cattura valido.")
+
+    def __iter__(self):
+        """Genera (timestamp, protocollo, operazione, chiave, payload) in ordine di registrazione."""
+        data = self._map
+        view = memoryview(data)
+        offset = len(MAGIC)
+        end = len(data)
+        try:
+            while offset + RECORD_HEADER.size <= end:
+                timestamp, protocol, operation, key_length, payload_length = RECORD_HEADER.unpack_from(data, offset)
+                offset += RECORD_HEADER.size
+                key = bytes(view[offset:offset + key_length]).decode("utf-8")
+                offset += key_length
+                if offset + payload_length > end:
+                    # Record troncato (registrazione interrotta)
+                    break
+                yield timestamp, PROTOCOLS[protocol], OPERATIONS[operation], key, view[offset:offset + payload_length]
+                offset += payload_length
+        finally:
+            view.release()
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # Restano memoryview sui payload: la mappatura si chiude quando vengono rilasciate
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReplayS7Client:
+    """Sostituisce snap7.client.Client: read_area restituisce il payload corrente."""
+
+    def __init__(self):
+        self.payload = b""
+
+    def read_area(self, area, db_number, start_offset, size):
+        return bytearray(self.payload)
+
+    def disconnect(self):
+        pass
+
+
+class ReplayModbusResponse:
+    def __init__(self, bits=None, registers=None):
+        self.bits = bits
+        self.registers = registers
+
+    def isError(self):
+        return False
+
+
+class ReplayModbusClient:
+    """Sostituisce ModbusTcpClient: ogni read_* restituisce il payload corrente decodificato."""
+
+    def __init__(self):
+        self.payload = b""
+
+    def _bits(self, *args, **kwargs):
+        return ReplayModbusResponse(bits=[bool(bit) for bit in self.payload])
+
+    def _registers(self, *args, **kwargs):
+        return ReplayModbusResponse(registers=decode_registers(self.payload))
+
+    read_coils = _bits
+    read_discrete_inputs = _bits
+    read_holding_registers = _registers
+    read_input_registers = _registers
+
+    def close(self):
+        pass
+
+
+# Byte del payload registrato per ogni unità di indirizzo (byte S7, bit o registro Modbus)
+PAYLOAD_UNIT_BYTES = {
+    "read_area": 1,
+    "read_coils": 1,
+    "read_discrete_inputs": 1,
+    "read_holding_registers": 2,
+    "read_input_registers": 2,
+}
+
+
+def build_replay_routes(config):
+    """
+    Indicizza i tag della configurazione per riconoscere i record che li
+    contengono. OPC UA: {(protocollo, operazione, chiave): [bersagli]}. S7 e
+    Modbus: {(protocollo, operazione, sorgente, ambito): [(inizio, dimensione,
+    bersaglio)]}, dove l'ambito è "area:db" o l'unit id, perché il collector può
+    leggere più tag vicini con un'unica richiesta a blocco.
+    Un bersaglio è (nome dispositivo, dispositivo di riproduzione, tag).
+    """
+    import plc_collector
+
+    routes = {}
+    ranges = {}
+    for device_config in config["devices"]:
+        protocol = device_config["protocol"]
+        if protocol == "s7":
+            device = plc_collector.S7Device(device_config)
+            device.plc = ReplayS7Client()
+        elif protocol == "modbus":
+            device = plc_collector.ModbusDevice(device_config)
+            device.client = ReplayModbusClient()
+        else:
+            device = None
+
+        source = device_config["name"]
+        for tag in device_config["tags"]:
+            target = (source, device, tag)
+            if protocol == "s7":
+                area = getattr(device.reader.snap7.Area, tag.get("area", "DB"))
+                scope = f"{getattr(area, 'name', area)}:{tag.get('db', 0)}"
+                ranges.setdefault(("s7", "read_area", source, scope), []).append(
+                    (tag["offset"], plc_collector.s7_request_size(tag), target))
+            elif protocol == "modbus":
+                operation = plc_collector.MODBUS_READ_FUNCTIONS[tag["table"]]
+                scope = str(tag.get("unit_id", device_config.get("unit_id", 1)))
+                ranges.setdefault(("modbus", operation, source, scope), []).append(
+                    (tag["address"], plc_collector.modbus_request_count(tag), target))
+            else:
+                routes.setdefault(("opcua", "read", f"{source}|{tag['node_id']}"), []).append(target)
+    return routes, ranges
+
+
+def range_targets(ranges, protocol, operation, key):
+    """
+    Bersagli di un record S7/Modbus: i tag il cui intervallo è contenuto in
+    quello letto, con la posizione in byte della loro porzione di payload.
+    Il record "members" che precede la risposta restringe poi la scelta ai tag
+    letti davvero (le catture senza questi record usano solo il contenimento).
+    """
+    source, request = key.split("|", 1)
+    if protocol == "s7":
+        area_name, db_number, start, size = request.split(":")
+        scope = f"{area_name}:{db_number}"
+    else:
+        scope, start, size = request.split(":")
+    start, size = int(start), int(size)
+    unit_bytes = PAYLOAD_UNIT_BYTES[operation]
+
+    targets = []
+    for tag_start, tag_size, target in ranges.get((protocol, operation, source, scope), ()):
+        if tag_start >= start and tag_start + tag_size <= start + size:
+            offset = (tag_start - start) * unit_bytes
+            targets.append((target, offset, offset + tag_size * unit_bytes))
+    return targets
+
+
+def decode_record(protocol, node_id, device, tag, payload):
+    """Decodifica un payload per un tag con le stesse funzioni usate in acquisizione."""
+    if protocol == "opcua":
+        import plc_opcua_reader
+        item = plc_opcua_reader.data_value_from_binary(node_id, payload)
+        return item['value'], item['status']
+    client = device.plc if protocol == "s7" else device.client
+    client.payload = payload
+    try:
+        return device.read_tag(tag)
+    finally:
+        client.payload = b""
+
+
+def replay_capture(path, config, listeners, speed=1.0):
+    """
+    Riproduce una cattura attraverso decodifica e listener. speed=1 rispetta i
+    tempi originali, speed=N è N volte più veloce, speed=0 non attende mai.
+    Restituisce (record letti, campioni prodotti).
+    """
+    from plc_collector import make_sample
+
+    routes, ranges = build_replay_routes(config)
+    # Bersagli S7/Modbus già calcolati per ogni chiave registrata
+    range_cache = {}
+    # Tag letti nella prossima risposta di ogni chiave S7/Modbus, dai record "members"
+    members = {}
+    aliases = set()
+    records = 0
+    samples = []
+    produced = 0
+
+    def _emit():
+        nonlocal samples, produced
+        if not samples:
+            return
+        for listener in listeners:
+            try:
+                listener(samples)
+            except Exception as e:
+                print(f"Errore in un listener dei campioni: {e}")
+        produced += len(samples)
+        samples = []
+
+    with CaptureReader(path) as reader:
+        first_timestamp = None
+        started = time.monotonic()
+        for timestamp, protocol, operation, key, payload in reader:
+            records += 1
+            if operation == "alias":
+                # Il riferimento simbolico letto in acquisizione diventa raggiungibile dal NodeId
+                source = key.split("|", 1)[0]
+                node_id_key = f"{source}|{bytes(payload).decode('utf-8')}"
+                targets = routes.get((protocol, "read", key))
+                if targets and (key, node_id_key) not in aliases:
+                    aliases.add((key, node_id_key))
+                    routes.setdefault((protocol, "read", node_id_key), []).extend(targets)
+                continue
+            if operation == "members":
+                members[(protocol, key)] = set(bytes(payload).decode("utf-8").split("\n"))
+                continue
+
+            if protocol == "opcua":
+                targets = [(target, 0, len(payload)) for target in routes.get((protocol, operation, key), ())]
+            else:
+                route = (protocol, operation, key)
+                if route not in range_cache:
+                    range_cache[route] = range_targets(ranges, protocol, operation, key)
+                targets = range_cache[route]
+                names = members.pop((protocol, key), None)
+                if names is not None:
+                    targets = [target for target in targets if target[0][2]["name"] in names]
+            if not targets:
+                continue
+
+            if speed > 0:
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                delay = started + (timestamp - first_timestamp) / speed - time.monotonic()
+                if delay > 0:
+                    _emit()
+                    time.sleep(delay)
+
+            node_id = key.split("|", 1)[1]
+            for (device_name, device, tag), begin, end in targets:
+                value, quality = decode_record(protocol, node_id, device, tag, payload[begin:end])
+                samples.append(make_sample(device_name, tag["name"], value, quality, timestamp))
+            if len(samples) >= REPLAY_BATCH_SIZE:
+                _emit()
+        payload = None
+        _emit()
+    return records, produced
+
+
+def main(argv=None):
+    import plc_collector
+
+    parser = argparse.ArgumentParser(description="Riproduce una cattura attraverso decodifica e sink.")
+    parser.add_argument("capture", help="file di cattura registrato con plc_collector.py --capture")
+    parser.add_argument("config", help="file dei tag usato in acquisizione")
+    parser.add_argument("--speed", type=float, default=1.0, help="fattore di velocità (default 1 = tempo reale)")
+    parser.add_argument("--fast", action="store_true", help="riproduce il più veloce possibile")
+    parser.add_argument("--output", help="file JSON Lines dei campioni (default stdout se nessun sink)")
+    parser.add_argument("--sqlite", help="database SQLite in cui salvare i campioni")
+    parser.add_argument("--csv-dir", help="cartella dei file CSV a rotazione")
+    parser.add_argument("--parquet", help="file Parquet dei campioni (richiede pyarrow)")
+    parser.add_argument("--sink-block-timeout", type=float, default=None,
+                        help="secondi di attesa con la coda di un sink piena prima di scartare i campioni "
+                             "(default: attende sempre, la riproduzione non scarta campioni)")
+    args = parser.parse_args(argv)
+
+    try:
+        config = plc_collector.load_tag_config(args.config)
+        sinks = plc_collector.create_sinks(args)
+    except (OSError, ValueError) as exc:
+        print(f"Errore nella configurazione: {exc}", file=sys.stderr)
+        return 1
+
+    listeners = list(sinks)
+    output = None
+    if args.output:
+        output = open(args.output, "a", encoding="utf-8")
+    elif not sinks:
+        output = sys.stdout
+    if output is not None:
+        listeners.append(plc_collector.JsonLinesWriter(output))
+
+    began = time.perf_counter()
+    try:
+        records, produced = replay_capture(args.capture, config, listeners, 0.0 if args.fast else args.speed)
+    except (OSError, ValueError) as exc:
+        print(f"Errore durante la riproduzione: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        for sink in sinks:
+            sink.close()
+        if args.output:
+            output.close()
+
+    elapsed = time.perf_counter() - began
+    rate = produced / elapsed if elapsed > 0 else 0.0
+    print(f"Riprodotti {records} record, {produced} campioni in {elapsed:.2f} s ({rate:.0f} campioni/s)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,848 @@
+# -*- coding: utf-8 -*-
+"""
+Collector headless multi-protocollo.
+
+Legge un file di configurazione dei tag (JSON, TOML o YAML) con dispositivi
+S7, Modbus TCP e OPC UA e li interroga a cadenza fissa, riusando le funzioni
+di connessione, lettura e parsing dei tre reader. Ogni dispositivo gira su un
+thread dedicato; i campioni vengono passati ai listener registrati (di default
+una riga JSON per campione su stdout o su file).
+
+Esempio:
+    python src/plc_collector.py tags.json --output campioni.jsonl
+"""
+import argparse
+import json
+import math
+import os
+import signal
+import sys
+import threading
+import time
+
+from plc_capture import (modbus_request_key, record_members, register_source, s7_request_key, start_capture,
+                          stop_capture)
+
+SUPPORTED_PROTOCOLS = ("s7", "modbus", "opcua")
+# "fixed": cadenze fisse per gruppo; "adaptive": plc_scheduler.AdaptiveDevicePoller
+SCHEDULERS = ("fixed", "adaptive")
+# Classi di priorità dei tag, dalla più alta alla più bassa
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+
+# Cadenza di default dei tag senza "rate" (secondi)
+DEFAULT_POLL_RATE = 1.0
+# Letture fallite consecutive prima di forzare una riconnessione
+MAX_CONSECUTIVE_ERRORS = 3
+# Attesa massima tra due tentativi di riconnessione (secondi)
+MAX_RECONNECT_DELAY = 60.0
+
+QUALITY_GOOD = "Good"
+QUALITY_BAD = "Bad"
+QUALITY_NOT_CONNECTED = "BadNotConnected"
+
+S7_AREAS = ("DB", "PE", "PA", "MK", "CT", "TM")
+S7_TYPE_SIZES = {'bool': 1, 'int': 2, 'real': 4, 'udint': 4}
+
+MODBUS_TABLES = ("coil", "discrete", "holding", "input")
+MODBUS_REGISTER_COUNTS = {'int16': 1, 'uint16': 1, 'int32': 2, 'uint32': 2, 'dword': 2, 'float32': 2}
+MODBUS_READ_FUNCTIONS = {
+    'coil': 'read_coils',
+    'discrete': 'read_discrete_inputs',
+    'holding': 'read_holding_registers',
+    'input': 'read_input_registers',
+}
+# Tabelle scrivibili: input e discrete sono in sola lettura
+MODBUS_WRITE_FUNCTIONS = {
+    'coil': 'write_coils',
+    'holding': 'write_registers',
+}
+
+# Tag vicini vengono letti con un'unica richiesta: byte massimi di una read_area
+# (un PDU S7 da 240 byte) e distanza massima tra due tag dello stesso blocco
+S7_MAX_BLOCK_BYTES = 222
+S7_MAX_GAP_BYTES = 16
+# Limiti di una singola richiesta Modbus e distanza massima tra due tag (bit o registri)
+MODBUS_MAX_REGISTERS = 125
+MODBUS_MAX_BITS = 2000
+MODBUS_MAX_GAP = 8
+
+
+def load_tag_config(path):
+    """Carica il file dei tag in base all'estensione (.json, .toml, .yaml/.yml)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path, "r", encoding="utf-8") as config_file:
+            config = json.load(config_file)
+    elif extension == ".toml":
+        # Parser TOML e YAML importati solo quando servono, per non rallentare l'avvio
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            raise ValueError("Il formato TOML richiede Python 3.11 o superiore.")
+        with open(path, "rb") as config_file:
+            config = tomllib.load(config_file)
+    elif extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:  # PyYAML è opzionale
+            raise ValueError("Il formato YAML richiede il pacchetto PyYAML.")
+        with open(path, "r", encoding="utf-8") as config_file:
+            config = yaml.safe_load(config_file)
+    else:
+        raise ValueError(f"Estensione del file dei tag non supportata: {extension}")
+
+    expand_rate_classes(config)
+    validate_tag_config(config)
+    return config
+
+
+def expand_rate_classes(config):
+    """Copia nei tag con "class" i campi (rate, priority) della classe definita in "rate_classes"."""
+    if not isinstance(config, dict):
+        return
+    rate_classes = config.get("rate_classes") or {}
+    for device in config.get("devices") or []:
+        for tag in device.get("tags") or []:
+            class_name = tag.get("class")
+            if class_name is None:
+                continue
+            if class_name not in rate_classes:
+                raise ValueError(f"Tag {device.get('name')}/{tag.get('name')}: classe di cadenza "
+                                 f"sconosciuta '{class_name}'.")
+            # I campi scritti direttamente nel tag hanno la precedenza sulla classe
+            for key, value in rate_classes[class_name].items():
+                tag.setdefault(key, value)
+
+
+def validate_tag_config(config):
+    """Controlla la struttura della configurazione e solleva ValueError se non valida."""
+    if not isinstance(config, dict) or not isinstance(config.get("devices"), list):
+        raise ValueError("La configurazione deve contenere una lista 'devices'.")
+    if config.get("scheduler", "fixed") not in SCHEDULERS:
+        raise ValueError(f"Scheduler non supportato '{config.get('scheduler')}'.")
+
+    names = set()
+    for device in config["devices"]:
+        name = device.get("name")
+        protocol = device.get("protocol")
+        if not name:
+            raise ValueError("Ogni dispositivo deve avere un 'name'.")
+        if name in names:
+            raise ValueError(f"Nome dispositivo duplicato: {name}")
+        names.add(name)
+        if protocol not in SUPPORTED_PROTOCOLS:
+            raise ValueError(f"Dispositivo {name}: protocollo non supportato '{protocol}'.")
+        if protocol == "opcua" and not device.get("endpoint"):
+            raise ValueError(f"Dispositivo {name}: manca 'endpoint'.")
+        if protocol in ("s7", "modbus") and not device.get("ip"):
+            raise ValueError(f"Dispositivo {name}: manca 'ip'.")
+        if not device.get("tags"):
+            raise ValueError(f"Dispositivo {name}: nessun tag configurato.")
+
+        for tag in device["tags"]:
+            validate_tag(name, protocol, tag)
+
+
+def validate_tag(device_name, protocol, tag):
+    tag_name = tag.get("name")
+    if not tag_name:
+        raise ValueError(f"Dispositivo {device_name}: ogni tag deve avere un 'name'.")
+    prefix = f"Tag {device_name}/{tag_name}"
+
+    rate = tag.get("rate", DEFAULT_POLL_RATE)
+    if not isinstance(rate, (int, float)) or rate <= 0:
+        raise ValueError(f"{prefix}: 'rate' deve essere un numero positivo di secondi.")
+    if tag.get("priority", DEFAULT_PRIORITY) not in PRIORITIES:
+        raise ValueError(f"{prefix}: 'priority' deve essere uno tra {', '.join(PRIORITIES)}.")
+
+    if protocol == "s7":
+        if tag.get("area", "DB") not in S7_AREAS:
+            raise ValueError(f"{prefix}: area S7 non valida '{tag.get('area')}'.")
+        data_type = tag.get("type")
+        if data_type not in S7_TYPE_SIZES and data_type not in ("string", "bool_array"):
+            raise ValueError(f"{prefix}: tipo S7 non supportato '{data_type}'.")
+        if data_type in ("string", "bool_array") and not tag.get("length"):
+            raise ValueError(f"{prefix}: il tipo '{data_type}' richiede 'length'.")
+        if "offset" not in tag:
+            raise ValueError(f"{prefix}: manca 'offset'.")
+    elif protocol == "modbus":
+        table = tag.get("table")
+        if table not in MODBUS_TABLES:
+            raise ValueError(f"{prefix}: tabella Modbus non valida '{table}'.")
+        if "address" not in tag:
+            raise ValueError(f"{prefix}: manca 'address'.")
+        if table in ("holding", "input"):
+            data_type = tag.get("type", "int16")
+            if data_type not in MODBUS_REGISTER_COUNTS and data_type != "string":
+                raise ValueError(f"{prefix}: tipo Modbus non supportato '{data_type}'.")
+            if data_type == "string" and not tag.get("length"):
+                raise ValueError(f"{prefix}: il tipo 'string' richiede 'length'.")
+    elif protocol == "opcua":
+        if not tag.get("node_id"):
+            raise ValueError(f"{prefix}: manca 'node_id'.")
+        if tag.get("type") is not None:
+            # Import pigro: asyncua serve solo se ci sono tag OPC UA con un tipo esplicito
+            from asyncua import ua
+            if tag["type"] not in ua.VariantType.__members__:
+                raise ValueError(f"{prefix}: tipo OPC UA non valido '{tag['type']}' (atteso un nome di VariantType).")
+
+
+def s7_request_size(tag):
+    """Byte da leggere con read_area per un tag S7."""
+    data_type = tag["type"]
+    if data_type == "string":
+        return tag["length"]
+    if data_type == "bool_array":
+        return math.ceil(tag["length"] / 8)
+    return S7_TYPE_SIZES[data_type]
+
+
+def modbus_request_count(tag):
+    """Bit o registri da leggere per un tag Modbus."""
+    if tag["table"] in ("coil", "discrete"):
+        return tag.get("count", 1)
+    data_type = tag.get("type", "int16")
+    if data_type == "string":
+        return (tag["length"] + 1) // 2
+    return MODBUS_REGISTER_COUNTS[data_type]
+
+
+def coalesce_ranges(items, max_gap, max_size):
+    """
+    Unisce le richieste (inizio, dimensione, indice) in blocchi contigui: una
+    richiesta entra nel blocco precedente se ne dista al più max_gap e il blocco
+    resta entro max_size. Restituisce [(inizio, dimensione, [richieste]), ...].
+    """
+    blocks = []
+    for start, size, index in sorted(items):
+        if blocks:
+            block_start, block_size, members = blocks[-1]
+            end = max(block_start + block_size, start + size)
+            if start - (block_start + block_size) <= max_gap and end - block_start <= max_size:
+                members.append((start, size, index))
+                blocks[-1] = (block_start, end - block_start, members)
+                continue
+        blocks.append((start, size, [(start, size, index)]))
+    return blocks
+
+
+def to_jsonable(value):
+    """
+    Default per json.dumps: array NumPy, array.array e scalari NumPy diventano
+    liste e numeri Python (str() darebbe "array('d', [...])" o un array troncato
+    da NumPy); gli altri tipi (es. datetime) diventano testo.
+    """
+    tolist = getattr(value, "tolist", None)
+    if tolist is not None:
+        return tolist()
+    return str(value)
+
+
+def make_sample(device, tag, value, quality, timestamp=None):
+    """Crea il dizionario di un campione raccolto."""
+    return {
+        'timestamp': time.time() if timestamp is None else timestamp,
+        'device': device,
+        'tag': tag,
+        'value': value,
+        'quality': quality,
+    }
+
+
+class S7Device:
+    """Dispositivo Siemens S7 basato su plc_s7_reader."""
+
+    def __init__(self, config):
+        import plc_s7_reader
+        self.reader = plc_s7_reader
+        self.config = config
+        self.plc = None
+
+    def connect(self):
+        self.plc = self.reader.connect_to_plc(self.config["ip"], self.config.get("rack", 0),
+                                              self.config.get("slot", 0), self.config.get("port", 102))
+        register_source(self.plc, self.config["name"])
+        return self.plc is not None
+
+    def close(self):
+        if self.plc is not None:
+            try:
+                self.plc.disconnect()
+            except Exception:
+                pass
+            self.plc = None
+
+    def read_tag(self, tag):
+        area = getattr(self.reader.snap7.Area, tag.get("area", "DB"))
+        size = s7_request_size(tag)
+        record_members("s7", self.plc, s7_request_key(area, tag.get("db", 0), tag["offset"], size), [tag["name"]])
+        data = self.reader.read_plc_data(self.plc, area, tag.get("db", 0), tag["offset"], size, verbose=False)
+        if data is None:
+            return None, QUALITY_BAD
+        return self.decode_tag(tag, data)
+
+    def decode_tag(self, tag, data):
+        """Decodifica i byte letti per un tag (a partire dal suo offset)."""
+        data_type = tag["type"]
+        if data_type == "bool_array":
+            value = [self.reader.parse_data(data, 'bool', i % 8, byte_index=i // 8) for i in range(tag["length"])]
+        elif data_type == "bool":
+            value = self.reader.parse_data(data, 'bool', tag.get("bit", 0))
+        else:
+            value = self.reader.parse_data(data, data_type, 0, tag.get("length"))
+        return value, QUALITY_GOOD if value is not None else QUALITY_BAD
+
+    def read(self, tags):
+        """Legge i tag con una read_area per ogni blocco di tag vicini della stessa area/DB."""
+        readings = [None] * len(tags)
+        requests = {}
+        for index, tag in enumerate(tags):
+            requests.setdefault((tag.get("area", "DB"), tag.get("db", 0)), []).append(
+                (tag["offset"], s7_request_size(tag), index))
+
+        for (area_name, db_number), items in requests.items():
+            area = getattr(self.reader.snap7.Area, area_name)
+            for start, size, members in coalesce_ranges(items, S7_MAX_GAP_BYTES, S7_MAX_BLOCK_BYTES):
+                data = None
+                if len(members) > 1:
+                    # In registrazione, la replica decodifica dal blocco solo questi tag
+                    record_members("s7", self.plc, s7_request_key(area, db_number, start, size),
+                                   [tags[index]["name"] for _, _, index in members])
+                    data = self.reader.read_plc_data(self.plc, area, db_number, start, size, verbose=False)
+                for offset, tag_size, index in members:
+                    if data is None:
+                        # Tag singolo, o blocco fallito per un indirizzo non valido: lettura tag per tag
+                        readings[index] = self.read_tag(tags[index])
+                    else:
+                        readings[index] = self.decode_tag(tags[index], data[offset - start:offset - start + tag_size])
+        return readings
+
+    def encode_tag(self, tag, value, data):
+        """Codifica value nei byte del tag (data parte dal suo offset), all'inverso di decode_tag."""
+        data_type = tag["type"]
+        if data_type == "bool_array":
+            bits = list(value)
+            if len(bits) != tag["length"]:
+                print(f"Tag {tag['name']}: attesi {tag['length']} bit, ricevuti {len(bits)}.")
+                return False
+            return all(self.reader.encode_data(data, 'bool', bit, i % 8, byte_index=i // 8)
+                       for i, bit in enumerate(bits))
+        if data_type == "bool":
+            return self.reader.encode_data(data, 'bool', value, tag.get("bit", 0))
+        return self.reader.encode_data(data, data_type, value, 0, tag.get("length"))
+
+    def expected_value(self, tag, value):
+        """Valore che una rilettura deve restituire dopo aver scritto value (codifica e decodifica)."""
+        data = bytearray(s7_request_size(tag))
+        if not self.encode_tag(tag, value, data):
+            return None
+        return self.decode_tag(tag, data)[0]
+
+    def write(self, tags, values):
+        """
+        Scrive i valori dei tag. I tag contigui della stessa area/DB formano un
+        unico blocco e i blocchi partono insieme con write_multi_vars, un PDU
+        alla volta. I blocchi con tag bool vengono prima riletti, per non
+        alterare gli altri bit degli stessi byte. Restituisce la qualità di
+        ogni scrittura.
+        """
+        qualities = [QUALITY_BAD] * len(tags)
+        encoded = {}
+        requests = {}
+        for index, tag in enumerate(tags):
+            data = bytearray(s7_request_size(tag))
+            if not self.encode_tag(tag, values[index], data):
+                continue
+            encoded[index] = data
+            requests.setdefault((tag.get("area", "DB"), tag.get("db", 0)), []).append(
+                (tag["offset"], len(data), index))
+
+        writes = []
+        written_tags = []
+        for (area_name, db_number), items in requests.items():
+            area = getattr(self.reader.snap7.Area, area_name)
+            # Distanza zero: i byte tra due tag non vengono mai sovrascritti
+            for start, size, members in coalesce_ranges(items, 0, S7_MAX_BLOCK_BYTES):
+                bit_members = [member for member in members if tags[member[2]]["type"] in ("bool", "bool_array")]
+                if bit_members:
+                    data = self.reader.read_plc_data(self.plc, area, db_number, start, size, verbose=False)
+                    if data is None:
+                        continue
+                    data = bytearray(data)
+                else:
+                    data = bytearray(size)
+                for offset, tag_size, index in members:
+                    if (offset, tag_size, index) not in bit_members:
+                        data[offset - start:offset - start + tag_size] = encoded[index]
+                for offset, tag_size, index in bit_members:
+                    chunk = data[offset - start:offset - start + tag_size]
+                    self.encode_tag(tags[index], values[index], chunk)
+                    data[offset - start:offset - start + tag_size] = chunk
+                writes.append((area, db_number, start, data))
+                written_tags.append([index for _, _, index in members])
+
+        results = self.reader.write_multi_plc_data(self.plc, writes, verbose=False)
+        for indexes, ok in zip(written_tags, results):
+            for index in indexes:
+                qualities[index] = QUALITY_GOOD if ok else QUALITY_BAD
+        return qualities
+
+
+class ModbusDevice:
+    """Dispositivo Modbus TCP basato su plc_modbus_reader."""
+
+    def __init__(self, config):
+        import plc_modbus_reader
+        self.reader = plc_modbus_reader
+        self.config = config
+        self.client = None
+
+    def connect(self):
+        self.client = self.reader.connect_to_plc(self.config["ip"], self.config.get("port", 502), exit_on_error=False)
+        register_source(self.client, self.config["name"])
+        return self.client is not None
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def read_tag(self, tag):
+        unit_id = tag.get("unit_id", self.config.get("unit_id", 1))
+        table = tag["table"]
+        address = tag["address"]
+        count = modbus_request_count(tag)
+        read_function = getattr(self.reader, MODBUS_READ_FUNCTIONS[table])
+
+        record_members("modbus", self.client, modbus_request_key(unit_id, address, count), [tag["name"]])
+        values = read_function(self.client, address, count, unit_id, verbose=False)
+        if values is None:
+            return None, QUALITY_BAD
+        return self.decode_tag(tag, values)
+
+    def decode_tag(self, tag, values):
+        """Decodifica i bit o i registri letti per un tag (a partire dal suo indirizzo)."""
+        if tag["table"] in ("coil", "discrete"):
+            return (values[0] if modbus_request_count(tag) == 1 else list(values)), QUALITY_GOOD
+
+        value = self.reader.parse_register_data(values, tag.get("type", "int16"), tag.get("order", "big"))
+        return value, QUALITY_GOOD if value is not None else QUALITY_BAD
+
+    def read(self, tags):
+        """Legge i tag con una richiesta per ogni blocco di indirizzi vicini della stessa tabella."""
+        readings = [None] * len(tags)
+        requests = {}
+        for index, tag in enumerate(tags):
+            unit_id = tag.get("unit_id", self.config.get("unit_id", 1))
+            requests.setdefault((unit_id, tag["table"]), []).append(
+                (tag["address"], modbus_request_count(tag), index))
+
+        for (unit_id, table), items in requests.items():
+            read_function = getattr(self.reader, MODBUS_READ_FUNCTIONS[table])
+            max_size = MODBUS_MAX_BITS if table in ("coil", "discrete") else MODBUS_MAX_REGISTERS
+            for start, count, members in coalesce_ranges(items, MODBUS_MAX_GAP, max_size):
+                values = None
+                if len(members) > 1:
+                    record_members("modbus", self.client, modbus_request_key(unit_id, start, count),
+                                   [tags[index]["name"] for _, _, index in members])
+                    values = read_function(self.client, start, count, unit_id, verbose=False)
+                for address, tag_count, index in members:
+                    if values is None:
+                        # Tag singolo, o blocco fallito per un indirizzo non valido: lettura tag per tag
+                        readings[index] = self.read_tag(tags[index])
+                    else:
+                        readings[index] = self.decode_tag(tags[index],
+                                                          values[address - start:address - start + tag_count])
+        return readings
+
+    def encode_tag(self, tag, value):
+        """Codifica value in bit o registri, all'inverso di decode_tag; None se non codificabile."""
+        count = modbus_request_count(tag)
+        if tag["table"] in ("coil", "discrete"):
+            encoded = [bool(bit) for bit in value] if isinstance(value, (list, tuple)) else [bool(value)]
+        else:
+            encoded = self.reader.encode_register_data(value, tag.get("type", "int16"), tag.get("order", "big"),
+                                                       tag.get("length"))
+        if encoded is not None and len(encoded) != count:
+            print(f"Tag {tag['name']}: attesi {count} elementi, codificati {len(encoded)}.")
+            return None
+        return encoded
+
+    def expected_value(self, tag, value):
+        """Valore che una rilettura deve restituire dopo aver scritto value (codifica e decodifica)."""
+        encoded = self.encode_tag(tag, value)
+        return None if encoded is None else self.decode_tag(tag, encoded)[0]
+
+    def write(self, tags, values):
+        """
+        Scrive i valori dei tag: gli indirizzi contigui della stessa tabella
+        partono con un'unica write_coils/write_registers, fino al massimo del
+        protocollo. Restituisce la qualità di ogni scrittura.
+        """
+        qualities = [QUALITY_BAD] * len(tags)
+        encoded = {}
+        requests = {}
+        for index, tag in enumerate(tags):
+            table = tag["table"]
+            if table not in MODBUS_WRITE_FUNCTIONS:
+                print(f"Tag {tag['name']}: la tabella '{table}' è in sola lettura.")
+                continue
+            values_to_write = self.encode_tag(tag, values[index])
+            if values_to_write is None:
+                continue
+            encoded[index] = values_to_write
+            unit_id = tag.get("unit_id", self.config.get("unit_id", 1))
+            requests.setdefault((unit_id, table), []).append((tag["address"], len(values_to_write), index))
+
+        for (unit_id, table), items in requests.items():
+            write_function = getattr(self.reader, MODBUS_WRITE_FUNCTIONS[table])
+            max_size = self.reader.MAX_WRITE_COILS if table == "coil" else self.reader.MAX_WRITE_REGISTERS
+            # Distanza zero: gli indirizzi tra due tag non vengono mai sovrascritti
+            for start, count, members in coalesce_ranges(items, 0, max_size):
+                block = [0] * count
+                for address, _, index in members:
+                    block[address - start:address - start + len(encoded[index])] = encoded[index]
+                ok = write_function(self.client, start, block, unit_id, verbose=False)
+                for _, _, index in members:
+                    qualities[index] = QUALITY_GOOD if ok else QUALITY_BAD
+        return qualities
+
+
+class OpcUaDevice:
+    """Dispositivo OPC UA: ogni gruppo di tag è letto con un'unica lettura massiva."""
+
+    def __init__(self, config):
+        import plc_opcua_session
+        self.session_module = plc_opcua_session
+        self.config = config
+        self.supervisor = None
+
+    def connect(self):
+        # Il supervisore gestisce da solo le riconnessioni successive
+        self.supervisor = self.session_module.SessionSupervisor(self.config["endpoint"])
+        if not self.supervisor.start():
+            self.supervisor = None
+            return False
+        register_source(self.supervisor.client, self.config["name"])
+        return True
+
+    def close(self):
+        if self.supervisor is not None:
+            self.supervisor.stop()
+            self.supervisor = None
+
+    def read(self, tags):
+        results = self.supervisor.read_values([tag["node_id"] for tag in tags])
+        # I nodi non risolti mancano dai risultati: solo i loro tag diventano Bad
+        by_reference = {item['reference']: (item['value'], item['status']) for item in results}
+        return [by_reference.get(str(tag["node_id"]), (None, QUALITY_BAD)) for tag in tags]
+
+    def expected_value(self, tag, value):
+        return value
+
+    def write(self, tags, values):
+        """Scrive i valori dei nodi con richieste Write a blocchi di MaxNodesPerWrite."""
+        results = self.supervisor.write_values([tag["node_id"] for tag in tags], values,
+                                               [tag.get("type") for tag in tags])
+        return [item['status'] for item in results]
+
+
+DEVICE_CLASSES = {
+    "s7": S7Device,
+    "modbus": ModbusDevice,
+    "opcua": OpcUaDevice,
+}
+
+
+def group_tags_by_rate(tags):
+    """Raggruppa i tag per cadenza: {rate: [tag, ...]}."""
+    groups = {}
+    for tag in tags:
+        groups.setdefault(float(tag.get("rate", DEFAULT_POLL_RATE)), []).append(tag)
+    return groups
+
+
+class DevicePoller(threading.Thread):
+    """Thread che interroga un dispositivo a cadenza fissa, gruppo per gruppo."""
+
+    def __init__(self, device_config, emit, stop_event):
+        super().__init__(name=f"poll-{device_config['name']}", daemon=True)
+        self.device_config = device_config
+        self.name_tag = device_config["name"]
+        self.emit = emit
+        self.stop_event = stop_event
+        self.device = DEVICE_CLASSES[device_config["protocol"]](device_config)
+        self.groups = group_tags_by_rate(device_config["tags"])
+        self.connected = False
+        self.consecutive_errors = 0
+        self.overruns = 0
+        self.cycles = 0
+        self.reconnect_delay = 1.0
+        self.next_reconnect = 0.0
+
+    def _try_connect(self):
+        """Tenta la connessione se è scaduto il backoff; non blocca il ciclo di polling."""
+        if time.monotonic() < self.next_reconnect:
+            return
+        if self.device.connect():
+            self.connected = True
+            self.consecutive_errors = 0
+            self.reconnect_delay = 1.0
+            return
+        print(f"[{self.name_tag}] Connessione fallita, nuovo tentativo tra {self.reconnect_delay:.0f} s")
+        self.next_reconnect = time.monotonic() + self.reconnect_delay
+        self.reconnect_delay = min(self.reconnect_delay * 2, MAX_RECONNECT_DELAY)
+
+    def _poll_group(self, tags):
+        """Legge i tag con una chiamata a device.read ed emette i campioni; restituisce le letture."""
+        timestamp = time.time()
+        if not self.connected:
+            self.emit([make_sample(self.name_tag, tag["name"], None, QUALITY_NOT_CONNECTED, timestamp)
+                       for tag in tags])
+            return None
+
+        try:
+            readings = self.device.read(tags)
+        except Exception as e:
+            print(f"[{self.name_tag}] Errore durante la lettura: {e}")
+            readings = [(None, QUALITY_BAD)] * len(tags)
+
+        self.emit([make_sample(self.name_tag, tag["name"], value, quality, timestamp)
+                   for tag, (value, quality) in zip(tags, readings)])
+
+        if all(quality != QUALITY_GOOD for _, quality in readings):
+            self.consecutive_errors += 1
+        else:
+            self.consecutive_errors = 0
+
+        if self.consecutive_errors >= MAX_CONSECUTIVE_ERRORS and self.device_config["protocol"] != "opcua":
+            print(f"[{self.name_tag}] Troppi errori consecutivi, riconnessione...")
+            self.device.close()
+            self.connected = False
+        return readings
+
+    def run(self):
+        start = time.monotonic()
+        next_due = {rate: start for rate in self.groups}
+
+        while not self.stop_event.is_set():
+            # Mentre il dispositivo è irraggiungibile i tag continuano a produrre
+            # campioni BadNotConnected, così il buco nei dati resta visibile
+            if not self.connected:
+                self._try_connect()
+
+            now = time.monotonic()
+            for rate, tags in self.groups.items():
+                if next_due[rate] > now:
+                    continue
+                self._poll_group(tags)
+                self.cycles += 1
+                # Cadenza fissa senza deriva; i cicli persi per sovraccarico vengono saltati
+                next_due[rate] += rate
+                if next_due[rate] <= time.monotonic():
+                    missed = math.floor((time.monotonic() - next_due[rate]) / rate) + 1
+                    self.overruns += missed
+                    next_due[rate] += missed * rate
+
+            self.stop_event.wait(max(0.0, min(next_due.values()) - time.monotonic()))
+
+        self.device.close()
+
+
+class Collector:
+    """Esegue un DevicePoller per ogni dispositivo della configurazione."""
+
+    def __init__(self, config):
+        self.config = config
+        self.stop_event = threading.Event()
+        self.listeners = []
+        self._emit_lock = threading.Lock()
+        self.pollers = []
+
+    def add_listener(self, listener):
+        """Registra una funzione che riceve ogni lista di campioni raccolti."""
+        self.listeners.append(listener)
+
+    def emit(self, samples):
+        # I listener sono chiamati da più thread: l'ordine dei blocchi è serializzato.
+        # Il lock resta preso mentre un sink con block_timeout attende posto in coda,
+        # quindi in quel tempo si fermano i poller di tutti i dispositivi, non solo
+        # quello che ha prodotto il blocco.
+        with self._emit_lock:
+            for listener in self.listeners:
+                try:
+                    listener(samples)
+                except Exception as e:
+                    print(f"Errore in un listener dei campioni: {e}")
+
+    def start(self):
+        poller_class = DevicePoller
+        if self.config.get("scheduler") == "adaptive":
+            from plc_scheduler import AdaptiveDevicePoller
+            poller_class = AdaptiveDevicePoller
+        self.pollers = [poller_class(device, self.emit, self.stop_event) for device in self.config["devices"]]
+        for poller in self.pollers:
+            poller.start()
+
+    def stop(self, timeout=10.0):
+        self.stop_event.set()
+        for poller in self.pollers:
+            poller.join(timeout)
+
+    def run_forever(self):
+        """Avvia la raccolta e la mantiene attiva fino a SIGINT/SIGTERM."""
+        def _handle_signal(signum, frame):
+            self.stop_event.set()
+
+        signal.signal(signal.SIGINT, _handle_signal)
+        if hasattr(signal, "SIGTERM"):
+            signal.signal(signal.SIGTERM, _handle_signal)
+
+        self.start()
+        while not self.stop_event.is_set():
+            self.stop_event.wait(1.0)
+        self.stop()
+
+
+class JsonLinesWriter:
+    """Listener che scrive un campione JSON per riga."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __call__(self, samples):
+        for sample in samples:
+            self.stream.write(json.dumps(sample, default=to_jsonable) + "\n")
+        self.stream.flush()
+
+
+def create_sinks(args):
+    """Crea i sink a lotti richiesti da riga di comando."""
+    import plc_sinks
+
+    options = {'block_timeout': args.sink_block_timeout}
+    sinks = []
+    try:
+        if args.sqlite:
+            sinks.append(plc_sinks.SqliteSink(args.sqlite, **options))
+        if args.csv_dir:
+            sinks.append(plc_sinks.RotatingCsvSink(args.csv_dir, **options))
+        if args.parquet:
+            sinks.append(plc_sinks.ParquetSink(args.parquet, **options))
+    except Exception:
+        # Chiude thread e file dei sink già aperti prima di propagare l'errore
+        for sink in sinks:
+            sink.close()
+        raise
+    return sinks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Collector headless S7 / Modbus / OPC UA.")
+    parser.add_argument("config", help="file dei tag (.json, .toml, .yaml)")
+    parser.add_argument("--output", help="file JSON Lines dei campioni (default stdout se nessun sink)")
+    parser.add_argument("--sqlite", help="database SQLite in cui salvare i campioni")
+    parser.add_argument("--csv-dir", help="cartella dei file CSV a rotazione")
+    parser.add_argument("--parquet", help="file Parquet dei campioni (richiede pyarrow)")
+    parser.add_argument("--sink-block-timeout", type=float, default=0.0,
+                        help="secondi di attesa con la coda di un sink piena prima di scartare i campioni; "
+                             "l'attesa ferma tutti i dispositivi (default 0 = scarta subito)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processi su cui ripartire i dispositivi (default 1, 0 = un processo per core)")
+    parser.add_argument("--scheduler", choices=SCHEDULERS,
+                        help="cadenze fisse o scheduler adattivo con priorità (default: 'scheduler' del file, "
+                             "altrimenti fixed)")
+    parser.add_argument("--capture", help="registra le risposte grezze in un file di cattura (vedi plc_capture.py)")
+    parser.add_argument("--metrics-prom", help="textfile Prometheus con le metriche delle richieste")
+    parser.add_argument("--metrics-json", help="file JSON con le metriche delle richieste")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="secondi tra due scritture delle metriche (default 10)")
+    parser.add_argument("--stats-json", help="file JSON con min/max/media/ultimo di ogni tag (richiede numpy)")
+    parser.add_argument("--stats-window", type=float, default=60.0,
+                        help="secondi di campioni tenuti in memoria per le statistiche (default 60)")
+    parser.add_argument("--stats-interval", type=float, default=10.0,
+                        help="secondi tra due scritture delle statistiche (default 10)")
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_tag_config(args.config)
+    except (OSError, ValueError) as exc:
+        print(f"Errore nella configurazione dei tag: {exc}", file=sys.stderr)
+        return 1
+    if args.scheduler:
+        config["scheduler"] = args.scheduler
+
+    if args.capture and args.workers != 1:
+        print("La registrazione (--capture) richiede un solo processo (--workers 1).", file=sys.stderr)
+        return 1
+
+    stats_dumper = None
+    if args.stats_json:
+        try:
+            import plc_timeseries
+        except ImportError as exc:
+            print(f"Le statistiche (--stats-json) richiedono numpy: {exc}", file=sys.stderr)
+            return 1
+        # Buffer dimensionati sulla sola finestra delle statistiche: memoria costante
+        store = plc_timeseries.TimeSeriesStore.for_config(config, retention=args.stats_window)
+        stats_dumper = plc_timeseries.StatsDumper(store, args.stats_json, args.stats_window, args.stats_interval)
+
+    try:
+        sinks = create_sinks(args)
+    except (OSError, ValueError) as exc:
+        print(f"Errore nella creazione dei sink: {exc}", file=sys.stderr)
+        return 1
+
+    output = None
+    if args.output:
+        output = open(args.output, "a", encoding="utf-8")
+    elif not sinks:
+        # I messaggi dei reader vanno su stderr quando i campioni escono su stdout
+        output = sys.stdout
+        sys.stdout = sys.stderr
+
+    recorder = None
+    if args.capture:
+        recorder = start_capture(args.capture)
+
+    dumper = None
+    if args.metrics_prom or args.metrics_json:
+        import plc_metrics
+        dumper = plc_metrics.MetricsDumper(plc_metrics.enable_metrics(), args.metrics_prom,
+                                           args.metrics_json, args.metrics_interval)
+        dumper.start()
+
+    if args.workers == 1:
+        collector = Collector(config)
+    else:
+        from plc_sharding import ShardedCollector
+        collector = ShardedCollector(config, args.workers or None)
+    if output is not None:
+        collector.add_listener(JsonLinesWriter(output))
+    for sink in sinks:
+        collector.add_listener(sink)
+    if stats_dumper is not None:
+        collector.add_listener(stats_dumper.store)
+        stats_dumper.start()
+    try:
+        collector.run_forever()
+    finally:
+        for sink in sinks:
+            sink.close()
+        if stats_dumper is not None:
+            stats_dumper.stop()
+        if dumper is not None:
+            dumper.stop()
+        if recorder is not None:
+            stop_capture()
+            print(f"Registrati {recorder.records} record in {args.capture}", file=sys.stderr)
+        if args.output:
+            output.close()
+        elif output is not None:
+            sys.stdout = output
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
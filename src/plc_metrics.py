@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Strumentazione delle richieste dei reader S7, Modbus e OPC UA.
+
+I reader chiamano metrics_clock() prima di una richiesta e record_request() /
+record_decode() dopo: finché la raccolta non è attivata con enable_metrics(),
+metrics_clock() restituisce None e le funzioni di registrazione ritornano
+subito, quindi il costo è di due chiamate a vuoto per richiesta.
+
+Per ogni coppia (protocollo, operazione) vengono raccolti un istogramma della
+latenza di round trip, il numero di elementi trasferiti (byte, registri, bit o
+nodi), errori, timeout e un istogramma del tempo di decodifica. I dati si
+esportano come textfile Prometheus (node_exporter) o come JSON.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Limiti superiori dei bucket degli istogrammi (secondi)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_DUMP_INTERVAL = 10.0
+
+_registry = None
+
+
+class Histogram:
+    """Istogramma a bucket fissi con somma e conteggio (stile Prometheus)."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        # L'ultimo bucket raccoglie i valori oltre l'ultimo limite (+Inf)
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Stima del quantile q come limite superiore del bucket che lo contiene."""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds, self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return bound
+        return self.max
+
+    def merge(self, other):
+        """Somma nell'istogramma le osservazioni di un altro con gli stessi bucket."""
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def cumulative_counts(self):
+        result = []
+        cumulative = 0
+        for bucket_count in self.counts:
+            cumulative += bucket_count
+            result.append(cumulative)
+        return result
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.max if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(bound) for bound in self.bounds] + ['+Inf'], self.cumulative_counts())),
+        }
+
+
+class OperationStats:
+    """Statistiche di un'operazione di un protocollo (es. s7/read_area)."""
+
+    def __init__(self, unit):
+        self.unit = unit
+        self.latency = Histogram()
+        self.decode = Histogram()
+        self.requests = 0
+        self.items = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.decode.merge(other.decode)
+        self.requests += other.requests
+        self.items += other.items
+        self.errors += other.errors
+        self.timeouts += other.timeouts
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'items': self.items,
+            'unit': self.unit,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'latency_seconds': self.latency.to_dict(),
+            'decode_seconds': self.decode.to_dict(),
+        }
+
+
+def is_timeout_error(error):
+    """Riconosce i timeout dalle eccezioni dei tre stack (tipo o messaggio)."""
+    if isinstance(error, TimeoutError):
+        return True
+    return "timeout" in type(error).__name__.lower() or "timeout" in str(error).lower()
+
+
+class MetricsRegistry:
+    """Raccolta thread-safe delle statistiche per (protocollo, operazione)."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, protocol, operation, unit):
+        key = (protocol, operation)
+        stats = self.operations.get(key)
+        if stats is None:
+            stats = self.operations[key] = OperationStats(unit)
+        return stats
+
+    def record_request(self, protocol, operation, seconds, items=0, unit="items", error=None):
+        with self._lock:
+            stats = self._stats(protocol, operation, unit)
+            stats.requests += 1
+            stats.latency.observe(seconds)
+            if error is None:
+                stats.items += items
+            else:
+                stats.errors += 1
+                if error is not True and is_timeout_error(error):
+                    stats.timeouts += 1
+
+    def record_decode(self, protocol, operation, seconds, unit="items"):
+        with self._lock:
+            self._stats(protocol, operation, unit).decode.observe(seconds)
+
+    def drain(self):
+        """Restituisce le statistiche raccolte dall'ultima chiamata e riparte da zero."""
+        with self._lock:
+            operations, self.operations = self.operations, {}
+        return operations
+
+    def merge(self, operations):
+        """Aggiunge statistiche prese da drain() in un altro processo (es. un worker)."""
+        with self._lock:
+            for (protocol, operation), stats in operations.items():
+                self._stats(protocol, operation, stats.unit).merge(stats)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'timestamp': time.time(),
+                'operations': [dict(protocol=protocol, operation=operation, **stats.to_dict())
+                               for (protocol, operation), stats in sorted(self.operations.items())],
+            }
+
+    def to_prometheus(self):
+        """Testo nel formato di esposizione Prometheus."""
+        lines = []
+
+        def _histogram(name, help_text, attribute):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (protocol, operation), stats in sorted(self.operations.items()):
+                histogram = getattr(stats, attribute)
+                if not histogram.count:
+                    continue
+                labels = f'protocol="{protocol}",operation="{operation}"'
+                bounds = [repr(bound) for bound in histogram.bounds] + ['+Inf']
+                for bound, cumulative in zip(bounds, histogram.cumulative_counts()):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.total!r}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        def _counter(name, help_text, attribute, with_unit=False):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (protocol, operation), stats in sorted(self.operations.items()):
+                if not stats.requests:
+                    continue
+                labels = f'protocol="{protocol}",operation="{operation}"'
+                if with_unit:
+                    labels += f',unit="{stats.unit}"'
+                lines.append(f"{name}{{{labels}}} {getattr(stats, attribute)}")
+
+        with self._lock:
+            _histogram("plc_request_duration_seconds", "Latenza di round trip delle richieste.", "latency")
+            _histogram("plc_decode_duration_seconds", "Tempo di decodifica delle risposte.", "decode")
+            _counter("plc_requests_total", "Richieste eseguite.", "requests")
+            _counter("plc_request_items_total", "Elementi trasferiti (byte, registri, bit o nodi).", "items",
+                     with_unit=True)
+            _counter("plc_request_errors_total", "Richieste fallite.", "errors")
+            _counter("plc_request_timeouts_total", "Richieste fallite per timeout.", "timeouts")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_textfile(self, path):
+        """Scrive il textfile in modo atomico, come richiesto dal textfile collector."""
+        _write_atomic(path, self.to_prometheus())
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.to_dict(), indent=2) + "\n")
+
+
+def _write_atomic(path, text):
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as output_file:
+        output_file.write(text)
+    os.replace(temporary_path, path)
+
+
+def enable_metrics():
+    """Attiva la raccolta (se non già attiva) e restituisce il registro."""
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
+
+
+def disable_metrics():
+    global _registry
+    _registry = None
+
+
+def get_metrics():
+    """Registro attivo, o None se la raccolta è disattivata."""
+    return _registry
+
+
+def metrics_clock():
+    """Istante di inizio di una richiesta, o None se la raccolta è disattivata."""
+    if _registry is None:
+        return None
+    return time.perf_counter()
+
+
+def record_request(protocol, operation, started, items=0, unit="items", error=None):
+    """Registra una richiesta iniziata a 'started'; error può essere un'eccezione o True."""
+    if started is None or _registry is None:
+        return
+    _registry.record_request(protocol, operation, time.perf_counter() - started, items, unit, error)
+
+
+def record_decode(protocol, operation, started, unit="items"):
+    if started is None or _registry is None:
+        return
+    _registry.record_decode(protocol, operation, time.perf_counter() - started, unit)
+
+
+class MetricsDumper(threading.Thread):
+    """Thread che riscrive periodicamente il textfile Prometheus e/o il JSON."""
+
+    def __init__(self, registry, prometheus_path=None, json_path=None, interval=DEFAULT_DUMP_INTERVAL):
+        super().__init__(name="metrics-dumper", daemon=True)
+        self.registry = registry
+        self.prometheus_path = prometheus_path
+        self.json_path = json_path
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def dump(self):
+        try:
+            if self.prometheus_path:
+                self.registry.write_prometheus_textfile(self.prometheus_path)
+            if self.json_path:
+                self.registry.write_json(self.json_path)
+        except OSError as e:
+            print(f"Errore durante la scrittura delle metriche: {e}")
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join(self.interval)
+        self.dump()
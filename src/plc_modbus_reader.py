@@ -3,7 +3,14 @@ from pymodbus.client import ModbusTcpClient
 import struct
 import sys
 
-def connect_to_plc(ip, port=502):
+from plc_capture import encode_bits, encode_registers, get_recorder, modbus_request_key
+from plc_metrics import metrics_clock, record_decode, record_request
+
+# Limiti del protocollo per una singola scrittura multipla (FC16 e FC15)
+MAX_WRITE_REGISTERS = 123
+MAX_WRITE_COILS = 1968
+
+def connect_to_plc(ip, port=502, exit_on_error=True):
     client = ModbusTcpClient(ip, port=port)
     try:
         connection = client.connect()
@@ -12,60 +19,101 @@ def connect_to_plc(ip, port=502):
             return client
         else:
             print(f"Errore: Impossibile connettersi al PLC Modbus {ip}:{port}")
-            sys.exit(1)
     except Exception as e:
         print(f"Errore durante la connessione al PLC: {e}")
-        sys.exit(1)
 
-def read_coils(client, address, count, unit_id=1):
+    # In modalità non interattiva il chiamante gestisce il fallimento
+    if not exit_on_error:
+        client.close()
+        return None
+    sys.exit(1)
+
+def read_coils(client, address, count, unit_id=1, verbose=True):
+    started = metrics_clock()
     try:
         result = client.read_coils(address, count=count, device_id=unit_id)
         if result.isError():
+            record_request("modbus", "read_coils", started, unit="bits", error=True)
             print(f"Errore durante la lettura delle coils: {result}")
             return None
-        print(f"Coils lette (Indirizzo {address}, Quantita' {count}): {result.bits[:count]}")
+        record_request("modbus", "read_coils", started, count, "bits")
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record("modbus", "read_coils", client, modbus_request_key(unit_id, address, count),
+                            encode_bits(result.bits[:count]))
+        if verbose:
+            print(f"Coils lette (Indirizzo {address}, Quantita' {count}): {result.bits[:count]}")
         return result.bits[:count]
     except Exception as e:
+        record_request("modbus", "read_coils", started, unit="bits", error=e)
         print(f"Errore durante la lettura delle coils: {e}")
         return None
 
-def read_discrete_inputs(client, address, count, unit_id=1):
+def read_discrete_inputs(client, address, count, unit_id=1, verbose=True):
+    started = metrics_clock()
     try:
         result = client.read_discrete_inputs(address, count=count, device_id=unit_id)
         if result.isError():
+            record_request("modbus", "read_discrete_inputs", started, unit="bits", error=True)
             print(f"Errore durante la lettura degli input discreti: {result}")
             return None
-        print(f"Input discreti letti (Indirizzo {address}, Quantita' {count}): {result.bits[:count]}")
+        record_request("modbus", "read_discrete_inputs", started, count, "bits")
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record("modbus", "read_discrete_inputs", client, modbus_request_key(unit_id, address, count),
+                            encode_bits(result.bits[:count]))
+        if verbose:
+            print(f"Input discreti letti (Indirizzo {address}, Quantita' {count}): {result.bits[:count]}")
         return result.bits[:count]
     except Exception as e:
+        record_request("modbus", "read_discrete_inputs", started, unit="bits", error=e)
         print(f"Errore durante la lettura degli input discreti: {e}")
         return None
 
-def read_holding_registers(client, address, count, unit_id=1):
+def read_holding_registers(client, address, count, unit_id=1, verbose=True):
+    started = metrics_clock()
     try:
         result = client.read_holding_registers(address, count=count, device_id=unit_id)
         if result.isError():
+            record_request("modbus", "read_holding_registers", started, unit="registers", error=True)
             print(f"Errore durante la lettura dei registri di holding: {result}")
             return None
-        print(f"Registri di holding letti (Indirizzo {address}, Quantita' {count}): {result.registers}")
+        record_request("modbus", "read_holding_registers", started, count, "registers")
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record("modbus", "read_holding_registers", client, modbus_request_key(unit_id, address, count),
+                            encode_registers(result.registers))
+        if verbose:
+            print(f"Registri di holding letti (Indirizzo {address}, Quantita' {count}): {result.registers}")
         return result.registers
     except Exception as e:
+        record_request("modbus", "read_holding_registers", started, unit="registers", error=e)
         print(f"Errore durante la lettura dei registri di holding: {e}")
         return None
 
-def read_input_registers(client, address, count, unit_id=1):
+def read_input_registers(client, address, count, unit_id=1, verbose=True):
+    started = metrics_clock()
     try:
         result = client.read_input_registers(address, count=count, device_id=unit_id)
         if result.isError():
+            record_request("modbus", "read_input_registers", started, unit="registers", error=True)
             print(f"Errore durante la lettura dei registri di input: {result}")
             return None
-        print(f"Registri di input letti (Indirizzo {address}, Quantita' {count}): {result.registers}")
+        record_request("modbus", "read_input_registers", started, count, "registers")
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record("modbus", "read_input_registers", client, modbus_request_key(unit_id, address, count),
+                            encode_registers(result.registers))
+        if verbose:
+            print(f"Registri di input letti (Indirizzo {address}, Quantita' {count}): {result.registers}")
         return result.registers
     except Exception as e:
+        record_request("modbus", "read_input_registers", started, unit="registers", error=e)
         print(f"Errore durante la lettura dei registri di input: {e}")
         return None
 
 def parse_register_data(registers, data_type, register_order='big'):
+    started = metrics_clock()
     try:
         if not registers:
             return None
@@ -109,6 +157,82 @@ def parse_register_data(registers, data_type, register_order='big'):
     except Exception as e:
         print(f"Errore durante il parsing dei dati: {e}")
         return None
+    finally:
+        record_decode("modbus", "parse_register_data", started)
+
+def encode_register_data(value, data_type, register_order='big', string_length=None):
+    """
+    Codifica un valore in registri, all'inverso di parse_register_data.
+    string_length (byte) tronca o completa con zeri le stringhe.
+    """
+    try:
+        if data_type in ('int16', 'uint16'):
+            return [int(value) & 0xFFFF]
+        elif data_type in ('int32', 'uint32', 'dword', 'float32'):
+            if data_type == 'float32':
+                packed = struct.pack('>f', float(value))
+            elif data_type == 'int32':
+                packed = struct.pack('>i', int(value))
+            else:
+                packed = struct.pack('>I', int(value))
+            combined = struct.unpack('>I', packed)[0]
+            high, low = combined >> 16, combined & 0xFFFF
+            return [high, low] if register_order == 'big' else [low, high]
+        elif data_type == 'string':
+            raw = str(value).encode('utf-8')
+            if string_length is not None:
+                raw = raw[:string_length].ljust(string_length, b'\x00')
+            if len(raw) % 2:
+                raw += b'\x00'
+            return [(raw[i] << 8) | raw[i + 1] for i in range(0, len(raw), 2)]
+        else:
+            print("Tipo di dato non supportato.")
+            return None
+    except Exception as e:
+        print(f"Errore durante la codifica dei dati: {e}")
+        return None
+
+def write_registers(client, address, registers, unit_id=1, verbose=True):
+    """Scrive i registri di holding con FC16, in blocchi da MAX_WRITE_REGISTERS. True se riuscita."""
+    registers = list(registers)
+    for offset in range(0, len(registers), MAX_WRITE_REGISTERS):
+        chunk = registers[offset:offset + MAX_WRITE_REGISTERS]
+        started = metrics_clock()
+        try:
+            result = client.write_registers(address + offset, chunk, device_id=unit_id)
+            if result.isError():
+                record_request("modbus", "write_registers", started, unit="registers", error=True)
+                print(f"Errore durante la scrittura dei registri di holding: {result}")
+                return False
+            record_request("modbus", "write_registers", started, len(chunk), "registers")
+        except Exception as e:
+            record_request("modbus", "write_registers", started, unit="registers", error=e)
+            print(f"Errore durante la scrittura dei registri di holding: {e}")
+            return False
+    if verbose:
+        print(f"Registri di holding scritti (Indirizzo {address}, Quantita' {len(registers)}): {registers}")
+    return True
+
+def write_coils(client, address, bits, unit_id=1, verbose=True):
+    """Scrive le coils con FC15, in blocchi da MAX_WRITE_COILS. True se riuscita."""
+    bits = [bool(bit) for bit in bits]
+    for offset in range(0, len(bits), MAX_WRITE_COILS):
+        chunk = bits[offset:offset + MAX_WRITE_COILS]
+        started = metrics_clock()
+        try:
+            result = client.write_coils(address + offset, chunk, device_id=unit_id)
+            if result.isError():
+                record_request("modbus", "write_coils", started, unit="bits", error=True)
+                print(f"Errore durante la scrittura delle coils: {result}")
+                return False
+            record_request("modbus", "write_coils", started, len(chunk), "bits")
+        except Exception as e:
+            record_request("modbus", "write_coils", started, unit="bits", error=e)
+            print(f"Errore durante la scrittura delle coils: {e}")
+            return False
+    if verbose:
+        print(f"Coils scritte (Indirizzo {address}, Quantita' {len(bits)}): {bits}")
+    return True
 
 def main():
     ip = input("Inserisci l'indirizzo IP del PLC Modbus: ")
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import csv
+import os
+from datetime import datetime, timedelta, timezone
+from asyncua import ua
+
+from plc_opcua_reader import (
+    DEFAULT_MAX_PARALLEL_REQUESTS,
+    NODE_ID_STRING_RE,
+    NodeRegistry,
+    fetch_operation_limits,
+    format_variable_value,
+    is_browse_path,
+    load_node_ids_from_file,
+    parse_browse_path,
+    split_in_chunks,
+)
+
+# Ampiezza di default delle finestre temporali eseguite in parallelo
+DEFAULT_HISTORY_WINDOW = timedelta(hours=1)
+# Campioni richiesti per nodo a ogni chiamata (limita la memoria di ogni risposta)
+DEFAULT_VALUES_PER_NODE = 1000
+
+HISTORY_CSV_HEADER = ['node_id', 'reference', 'source_timestamp', 'server_timestamp', 'status', 'value']
+
+
+def split_time_range(start, end, window=DEFAULT_HISTORY_WINDOW):
+    """Divide l'intervallo [start, end) in finestre consecutive di ampiezza window."""
+    if window is None or window.total_seconds() <= 0:
+        return [(start, end)]
+
+    windows = []
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + window, end)
+        windows.append((window_start, window_end))
+        window_start = window_end
+    return windows
+
+
+async def history_read_raw_window(client, node_ids, start, end, on_values,
+                                  values_per_node=DEFAULT_VALUES_PER_NODE):
+    """
+    Esegue HistoryReadRaw su più nodi per una finestra temporale, seguendo i
+    continuation point finché tutti i nodi sono esauriti. Ogni blocco di campioni
+    viene passato subito a on_values(node_id, data_values) e poi scartato.
+    """
+    truncated = await _history_read_raw(client, node_ids, start, end, on_values, values_per_node)
+    for node_id, tail in truncated.items():
+        await _resume_truncated(client, node_id, tail, end, on_values, values_per_node)
+
+
+async def _history_read_raw(client, node_ids, start, end, on_values, values_per_node):
+    """
+    Una lettura HistoryReadRaw completa (continuation point compresi). Restituisce
+    i nodi troncati senza continuation point, con gli ultimi campioni ricevuti
+    che hanno lo stesso SourceTimestamp dell'ultimo.
+    """
+    details = ua.ReadRawModifiedDetails()
+    details.IsReadModified = False
+    details.StartTime = start
+    details.EndTime = end
+    details.NumValuesPerNode = values_per_node
+    # I bound duplicherebbero i campioni ai bordi delle finestre
+    details.ReturnBounds = False
+
+    pending = {node_id: None for node_id in node_ids}
+    truncated = {}
+
+    try:
+        while pending:
+            params = ua.HistoryReadParameters()
+            params.HistoryReadDetails = details
+            params.TimestampsToReturn = ua.TimestampsToReturn.Both
+            params.ReleaseContinuationPoints = False
+            for node_id, continuation_point in pending.items():
+                value_id = ua.HistoryReadValueId()
+                value_id.NodeId = node_id
+                value_id.IndexRange = ""
+                value_id.ContinuationPoint = continuation_point
+                params.NodesToRead.append(value_id)
+
+            results = await client.uaclient.history_read(params)
+
+            next_pending = {}
+            for node_id, result in zip(list(pending), results):
+                if not result.StatusCode.is_good():
+                    if result.StatusCode.value != ua.StatusCodes.GoodNoData:
+                        print(f"HistoryRead non riuscita per {node_id.to_string()}: {result.StatusCode.name}")
+                    continue
+                history_data = result.HistoryData
+                if history_data is not None and history_data.DataValues:
+                    on_values(node_id, history_data.DataValues)
+                if result.ContinuationPoint:
+                    next_pending[node_id] = result.ContinuationPoint
+                elif values_per_node and history_data is not None and len(history_data.DataValues) >= values_per_node:
+                    # Alcuni server troncano a NumValuesPerNode senza continuation point
+                    last_timestamp = history_data.DataValues[-1].SourceTimestamp
+                    truncated[node_id] = [dv for dv in history_data.DataValues
+                                          if dv.SourceTimestamp == last_timestamp]
+            pending = next_pending
+    finally:
+        # In caso di errore o annullamento libera i continuation point rimasti sul server
+        leftovers = {node_id: cp for node_id, cp in pending.items() if cp}
+        if leftovers:
+            await _release_continuation_points(client, details, leftovers)
+
+    return truncated
+
+
+def _sample_key(data_value):
+    value = data_value.Value.Value if data_value.Value is not None else None
+    return data_value.StatusCode.value, value
+
+
+async def _resume_truncated(client, node_id, tail, end, on_values, values_per_node):
+    """
+    Riprende un nodo troncato dall'ultimo timestamp ricevuto (StartTime è
+    inclusivo). I campioni con quel timestamp tornano di nuovo: si scartano solo
+    quelli già passati a on_values (stesso stato e valore), così non si perdono
+    gli altri campioni con lo stesso timestamp.
+    """
+    while tail and tail[-1].SourceTimestamp is not None and tail[-1].SourceTimestamp < end:
+        last_timestamp = tail[-1].SourceTimestamp
+        already_written = [_sample_key(dv) for dv in tail]
+        delivered = 0
+
+        def _on_resumed_values(resumed_node_id, data_values):
+            nonlocal delivered
+            fresh = []
+            for data_value in data_values:
+                if data_value.SourceTimestamp == last_timestamp:
+                    key = _sample_key(data_value)
+                    if key in already_written:
+                        already_written.remove(key)
+                        continue
+                fresh.append(data_value)
+            if fresh:
+                on_values(resumed_node_id, fresh)
+                delivered += len(fresh)
+
+        truncated = await _history_read_raw(client, [node_id], last_timestamp, end,
+                                            _on_resumed_values, values_per_node)
+        if node_id not in truncated:
+            return
+        if not delivered:
+            print(f"Storico di {node_id.to_string()}: più di {values_per_node} campioni con timestamp "
+                  f"{last_timestamp}, lettura interrotta.")
+            return
+        tail = truncated[node_id]
+
+
+async def _release_continuation_points(client, details, continuation_points):
+    params = ua.HistoryReadParameters()
+    params.HistoryReadDetails = details
+    params.TimestampsToReturn = ua.TimestampsToReturn.Neither
+    params.ReleaseContinuationPoints = True
+    for node_id, continuation_point in continuation_points.items():
+        value_id = ua.HistoryReadValueId()
+        value_id.NodeId = node_id
+        value_id.ContinuationPoint = continuation_point
+        params.NodesToRead.append(value_id)
+    try:
+        await client.uaclient.history_read(params)
+    except Exception:
+        pass
+
+
+def export_history(client, loop, node_references, start, end, filename,
+                   window=DEFAULT_HISTORY_WINDOW, max_parallel=DEFAULT_MAX_PARALLEL_REQUESTS,
+                   values_per_node=DEFAULT_VALUES_PER_NODE, registry=None):
+    """
+    Esporta su CSV lo storico grezzo di molti nodi nell'intervallo [start, end).
+    L'intervallo è diviso in finestre lette in parallelo, i nodi sono raggruppati
+    secondo MaxNodesPerHistoryReadData e i campioni vengono scritti su disco man
+    mano che arrivano, quindi la memoria non cresce con il numero di campioni.
+    Restituisce il numero di campioni scritti, o None in caso di errore.
+    """
+    node_references = list(node_references)
+    if registry is None:
+        registry = NodeRegistry(client, loop, register_nodes=False)
+
+    try:
+        export_file = open(filename, "w", encoding="utf-8", newline="")
+    except OSError as exc:
+        print(f"Errore durante l'apertura del file {filename}: {exc}")
+        return None
+
+    with export_file:
+        writer = csv.writer(export_file)
+        writer.writerow(HISTORY_CSV_HEADER)
+        written = 0
+
+        async def _export():
+            resolved = await registry.resolve_async(node_references)
+            references_by_node = {node_id: str(reference)
+                                  for reference, node_id in zip(node_references, resolved) if node_id is not None}
+            if not references_by_node:
+                return
+
+            def _write_values(node_id, data_values):
+                # Eseguito sul thread del loop: un solo writer, nessun lock necessario
+                nonlocal written
+                node_id_str = node_id.to_string()
+                reference = references_by_node.get(node_id, node_id_str)
+                for data_value in data_values:
+                    value = data_value.Value.Value if data_value.Value is not None else None
+                    writer.writerow([node_id_str, reference, data_value.SourceTimestamp,
+                                     data_value.ServerTimestamp, data_value.StatusCode.name,
+                                     format_variable_value(value)])
+                written += len(data_values)
+
+            limits = await fetch_operation_limits(client)
+            node_chunks = split_in_chunks(list(references_by_node), limits['MaxNodesPerHistoryReadData'])
+            semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+            async def _run_job(node_chunk, window_start, window_end):
+                async with semaphore:
+                    await history_read_raw_window(client, node_chunk, window_start, window_end,
+                                                  _write_values, values_per_node)
+
+            jobs = [_run_job(node_chunk, window_start, window_end)
+                    for window_start, window_end in split_time_range(start, end, window)
+                    for node_chunk in node_chunks]
+            await asyncio.gather(*jobs)
+
+        try:
+            loop.run_until_complete(_export())
+        except Exception as e:
+            print(f"Errore durante l'esportazione dello storico: {e}")
+            return None
+
+    return written
+
+
+def is_node_reference(text):
+    """Indica se il testo è un Node ID o un percorso che parte da una cartella standard."""
+    if NODE_ID_STRING_RE.match(text):
+        return True
+    if not is_browse_path(text):
+        return False
+    try:
+        namespace, name = parse_browse_path(text)[0]
+    except ValueError:
+        return False
+    return namespace is not None
+
+
+def parse_datetime_input(text, default):
+    """Interpreta una data 'AAAA-MM-GG HH:MM[:SS]' in ora locale; vuota = default."""
+    text = text.strip()
+    if not text:
+        return default
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(text, fmt).astimezone(timezone.utc)
+        except ValueError:
+            continue
+    raise ValueError(f"Formato data non valido: {text}")
+
+
+def export_history_interactive(client, loop):
+    """Chiede nodi, intervallo e finestra all'utente ed esporta lo storico su CSV."""
+    source = input("Inserisci un Node ID o il percorso di un file con l'elenco dei nodi: ").strip()
+    if not source:
+        print("Nessun nodo specificato.")
+        return
+
+    if os.path.isfile(source):
+        try:
+            node_references = load_node_ids_from_file(source)
+        except OSError as exc:
+            print(f"Errore durante la lettura del file {source}: {exc}")
+            return
+    elif is_node_reference(source):
+        node_references = [source]
+    else:
+        print(f"File {source} non trovato e non è un Node ID valido.")
+        return
+
+    now = datetime.now(timezone.utc)
+    try:
+        start = parse_datetime_input(input("Inizio (AAAA-MM-GG HH:MM, default 24 ore fa): "), now - timedelta(days=1))
+        end = parse_datetime_input(input("Fine (AAAA-MM-GG HH:MM, default adesso): "), now)
+        window_minutes = int(input("Ampiezza finestre parallele in minuti (default 60): ") or 60)
+    except ValueError as exc:
+        print(exc)
+        return
+
+    if start >= end:
+        print("L'inizio deve precedere la fine.")
+        return
+
+    filename = f"history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    began = datetime.now()
+    written = export_history(client, loop, node_references, start, end, filename,
+                             window=timedelta(minutes=window_minutes))
+    if written is None:
+        return
+
+    elapsed = (datetime.now() - began).total_seconds()
+    print(f"Esportati {written} campioni di {len(node_references)} nodi in {filename} ({elapsed:.1f} s)")
@@ -1,24 +1,123 @@
 # -*- coding: utf-8 -*-
 import asyncio
-from asyncua import Client, Node
+from asyncua import Client, Node, ua
+from asyncua.common.utils import Buffer
+from asyncua.ua.ua_binary import struct_from_binary, struct_to_binary
 import sys
 import json
 import csv
 import re
+import threading
+from array import array
 from datetime import datetime
 
+try:
+    import numpy as np
+except ImportError:  # NumPy è opzionale: in sua assenza si usa array.array
+    np = None
+
+from plc_capture import get_recorder
+from plc_metrics import metrics_clock, record_decode, record_request
+
+# Dimensione dei blocchi se il server non dichiara MaxNodesPerRead (0 = illimitato)
+DEFAULT_MAX_NODES_PER_REQUEST = 1000
+# Numero massimo di richieste Read in volo contemporaneamente
+DEFAULT_MAX_PARALLEL_REQUESTS = 4
+
+NAMESPACE_INDEX_RE = re.compile(r'NamespaceIndex=(\d+)')
+IDENTIFIER_STRING_RE = re.compile(r"Identifier='([^']+)'")
+IDENTIFIER_INT_RE = re.compile(r"Identifier=(\d+)")
+NODE_ID_STRING_RE = re.compile(r"^(ns=\d+;|nsu=[^;]+;)?[isgb]=")
+QUALIFIED_SEGMENT_RE = re.compile(r"^(\d+):(.+)$")
+
+# Cartelle standard (namespace 0) usate come primo elemento dei percorsi simbolici
+STANDARD_FOLDERS = ("Objects", "Types", "Views", "Server")
+
+# Tipi array numerici: VariantType -> (dtype NumPy, typecode array.array)
+ARRAY_TYPECODES = {
+    ua.VariantType.Boolean: ('bool', 'B'),
+    ua.VariantType.SByte: ('int8', 'b'),
+    ua.VariantType.Byte: ('uint8', 'B'),
+    ua.VariantType.Int16: ('int16', 'h'),
+    ua.VariantType.UInt16: ('uint16', 'H'),
+    ua.VariantType.Int32: ('int32', 'i'),
+    ua.VariantType.UInt32: ('uint32', 'I'),
+    ua.VariantType.Int64: ('int64', 'q'),
+    ua.VariantType.UInt64: ('uint64', 'Q'),
+    ua.VariantType.Float: ('float32', 'f'),
+    ua.VariantType.Double: ('float64', 'd'),
+}
+# Elementi mostrati nell'anteprima di un array
+ARRAY_PREVIEW_LENGTH = 10
+
+OPERATION_LIMIT_NODE_IDS = {
+    'MaxNodesPerRead': ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerRead,
+    'MaxNodesPerWrite': ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerWrite,
+    'MaxNodesPerRegisterNodes': ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerRegisterNodes,
+    'MaxNodesPerTranslateBrowsePathsToNodeIds': ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerTranslateBrowsePathsToNodeIds,
+    'MaxNodesPerHistoryReadData': ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerHistoryReadData,
+}
+
+class BackgroundEventLoop:
+    """
+    Event loop asyncio eseguito su un thread dedicato.
+    Offre la stessa interfaccia run_until_complete() di un loop classico, ma le
+    coroutine girano sempre sul thread in background: keepalive e sottoscrizioni
+    restano attivi mentre il programma attende l'input dell'utente, e più thread
+    possono inviare richieste sovrapposte sulla stessa sessione tramite submit().
+    """
+
+    def __init__(self, name="opcua-loop"):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    @property
+    def asyncio_loop(self):
+        """Event loop asyncio sottostante."""
+        return self._loop
+
+    def submit(self, coro):
+        """Pianifica una coroutine e restituisce un concurrent.futures.Future thread-safe."""
+        if self._loop.is_closed():
+            coro.close()
+            raise RuntimeError("L'event loop in background è già stato chiuso.")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run_until_complete(self, coro, timeout=None):
+        """Esegue una coroutine sul thread in background e ne attende il risultato."""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("run_until_complete non può essere chiamato dal thread dell'event loop.")
+        return self.submit(coro).result(timeout)
+
+    def is_closed(self):
+        return self._loop.is_closed()
+
+    def close(self):
+        """Ferma il thread in background e chiude l'event loop."""
+        if self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
 def connect_to_opcua_server(endpoint_url):
-    """Connette al server OPC UA e restituisce il client."""
+    """Connette al server OPC UA e restituisce il client e il loop in background."""
     client = Client(url=endpoint_url)
+    loop = BackgroundEventLoop()
     try:
-        # Esegue la connessione in modo sincrono
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         loop.run_until_complete(client.connect())
         print(f"Connesso al server OPC UA: {endpoint_url}")
         return client, loop
     except Exception as e:
         print(f"Errore durante la connessione al server OPC UA: {e}")
+        loop.close()
         return None, None
 
 def disconnect_from_server(client, loop):
@@ -26,13 +125,24 @@ def disconnect_from_server(client, loop):
     try:
         if client:
             loop.run_until_complete(client.disconnect())
-            loop.close()
             print("Disconnesso dal server OPC UA.")
     except Exception as e:
         print(f"Errore durante la disconnessione: {e}")
+    finally:
+        # Il thread del loop va fermato anche se la disconnessione fallisce
+        if loop is not None:
+            loop.close()
+
+def submit_node_read(client, loop, node_id):
+    """Avvia la lettura di un nodo senza bloccare e restituisce un Future thread-safe."""
+    async def _read_value():
+        return await resolve_node_reference(client, node_id).read_value()
+
+    return loop.submit(_read_value())
 
 def read_node_value(client, loop, node_id):
     """Legge il valore di un nodo OPC UA."""
+    started = metrics_clock()
     try:
         async def _read_value():
             node = client.get_node(node_id)
@@ -40,9 +150,11 @@ def read_node_value(client, loop, node_id):
             return value
         
         value = loop.run_until_complete(_read_value())
+        record_request("opcua", "read_value", started, 1, "nodes")
         print(f"Valore letto dal nodo {node_id}: {value}")
         return value
     except Exception as e:
+        record_request("opcua", "read_value", started, unit="nodes", error=e)
         print(f"Errore durante la lettura del nodo {node_id}: {e}")
         return None
 
@@ -84,6 +196,9 @@ def resolve_node_reference(client, node_reference):
     if isinstance(node_reference, Node):
         return node_reference
 
+    if isinstance(node_reference, ua.NodeId):
+        return client.get_node(node_reference)
+
     if node_reference == "root":
         return client.nodes.root
 
@@ -99,9 +214,9 @@ def resolve_node_reference(client, node_reference):
             return client.get_node("ns=4;s=GESTIONALE")
 
         try:
-            namespace_match = re.search(r'NamespaceIndex=(\d+)', node_str)
-            identifier_string_match = re.search(r"Identifier='([^']+)'", node_str)
-            identifier_int_match = re.search(r"Identifier=(\d+)", node_str)
+            namespace_match = NAMESPACE_INDEX_RE.search(node_str)
+            identifier_string_match = IDENTIFIER_STRING_RE.search(node_str)
+            identifier_int_match = IDENTIFIER_INT_RE.search(node_str)
 
             if namespace_match:
                 namespace = namespace_match.group(1)
@@ -127,6 +242,103 @@ def resolve_node_reference(client, node_reference):
         raise ValueError(f"NodeId non valido: {exc}") from exc
 
 
+def is_numeric_array(value):
+    """Indica se il valore è già un array numerico compatto (NumPy o array.array)."""
+    return isinstance(value, array) or (np is not None and isinstance(value, np.ndarray))
+
+
+def infer_variant_type(values):
+    """
+    Deduce il VariantType di una lista da tutti i suoi elementi (None se non
+    numerica): basta un reale per avere Double, così nessun valore viene troncato.
+    """
+    if not values:
+        return None
+    if all(isinstance(item, bool) for item in values):
+        return ua.VariantType.Boolean
+    if not all(isinstance(item, (int, float)) for item in values):
+        return None
+    if any(isinstance(item, float) for item in values):
+        return ua.VariantType.Double
+    return ua.VariantType.Int64
+
+
+def to_numeric_array(value, variant_type=None):
+    """
+    Converte una sola volta un valore array in un array compatto (NumPy se
+    disponibile, altrimenti array.array) secondo il VariantType. Restituisce
+    il valore originale se non è un array numerico.
+    """
+    if is_numeric_array(value) or not isinstance(value, (list, tuple)):
+        return value
+
+    if variant_type is None:
+        variant_type = infer_variant_type(value)
+    typecodes = ARRAY_TYPECODES.get(variant_type)
+    if typecodes is None:
+        return value
+
+    dtype, typecode = typecodes
+    try:
+        if np is not None:
+            return np.asarray(value, dtype=dtype)
+        return array(typecode, value)
+    except (TypeError, ValueError, OverflowError):
+        # Array multidimensionali o con elementi eterogenei restano liste
+        return value
+
+
+def to_variant(value, variant_type=None):
+    """
+    Converte un valore Python in ua.Variant del VariantType indicato, all'inverso
+    di to_numeric_array: array NumPy e array.array tornano liste, i numeri
+    vengono convertiti al tipo del nodo (es. un intero scritto su un nodo Float).
+    """
+    if is_numeric_array(value):
+        value = value.tolist()
+    elif isinstance(value, tuple):
+        value = list(value)
+
+    dtype = ARRAY_TYPECODES.get(variant_type, (None, None))[0]
+    if dtype is not None:
+        cast = bool if dtype == 'bool' else float if dtype.startswith('float') else int
+        value = [cast(item) for item in value] if isinstance(value, list) else cast(value)
+    return ua.Variant(value, variant_type)
+
+
+def summarize_array(values):
+    """Riassume un array (lunghezza, min/max, primi elementi) senza copiarlo."""
+    length = len(values)
+    if length == 0:
+        return "Array [0 elementi]"
+
+    head = ", ".join(str(item) for item in values[:ARRAY_PREVIEW_LENGTH])
+    if length > ARRAY_PREVIEW_LENGTH:
+        head += ", ..."
+
+    summary = f"Array [{length} elementi]"
+    if is_numeric_array(values):
+        summary += f" min={min(values) if isinstance(values, array) else values.min()}"
+        summary += f" max={max(values) if isinstance(values, array) else values.max()}"
+    return f"{summary}: [{head}]"
+
+
+def save_array_binary(values, base_filename):
+    """Salva un array in formato binario compatto (.npy o .bin grezzo) e restituisce il nome file."""
+    values = to_numeric_array(values)
+    if np is not None and isinstance(values, np.ndarray):
+        filename = f"{base_filename}.npy"
+        np.save(filename, values)
+        return filename
+    if isinstance(values, array):
+        # Il typecode nel nome permette di rileggere il file con array.fromfile
+        filename = f"{base_filename}_{values.typecode}.bin"
+        with open(filename, "wb") as binary_file:
+            values.tofile(binary_file)
+        return filename
+    return None
+
+
 def format_variable_value(value):
     """Formatta un valore OPC UA in modo compatto per l'export."""
     if value is None:
@@ -144,10 +356,12 @@ def format_variable_value(value):
     if isinstance(value, (bytes, bytearray)):
         return value.hex()
 
+    if hasattr(value, "__len__") and hasattr(value, "__getitem__"):
+        return f"Array[{len(value)} elementi]"
+
     try:
-        if hasattr(value, "__iter__") and not isinstance(value, (str, bytes, bytearray)):
-            materialized = list(value)
-            return f"Array[{len(materialized)} elementi]"
+        if hasattr(value, "__iter__"):
+            return f"Array[{sum(1 for _ in value)} elementi]"
     except TypeError:
         pass
 
@@ -174,6 +388,521 @@ def node_id_to_filename_fragment(node_id_str):
     return sanitized or "node"
 
 
+async def fetch_operation_limits(client):
+    """Legge in un'unica richiesta gli OperationLimits dichiarati dal server."""
+    node_ids = [ua.NodeId(identifier) for identifier in OPERATION_LIMIT_NODE_IDS.values()]
+    results = await client.uaclient.read_attributes(node_ids, ua.AttributeIds.Value)
+
+    limits = {}
+    for name, data_value in zip(OPERATION_LIMIT_NODE_IDS, results):
+        value = data_value.Value.Value if data_value.Value is not None else None
+        # 0 o valore assente significano "nessun limite dichiarato"
+        limits[name] = int(value) if data_value.StatusCode.is_good() and value else 0
+    return limits
+
+
+def read_operation_limits(client, loop):
+    """Restituisce gli OperationLimits del server (0 = nessun limite)."""
+    try:
+        return loop.run_until_complete(fetch_operation_limits(client))
+    except Exception as e:
+        print(f"Errore durante la lettura degli OperationLimits: {e}")
+        return {name: 0 for name in OPERATION_LIMIT_NODE_IDS}
+
+
+def split_in_chunks(items, chunk_size):
+    """Divide una lista in blocchi di al massimo chunk_size elementi."""
+    if not chunk_size or chunk_size <= 0:
+        chunk_size = DEFAULT_MAX_NODES_PER_REQUEST
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def to_node_id(client, node_reference):
+    """Converte un riferimento (stringa, NodeId o Node) in un ua.NodeId."""
+    if isinstance(node_reference, ua.NodeId):
+        return node_reference
+    return resolve_node_reference(client, node_reference).nodeid
+
+
+async def read_values_chunked(client, node_ids, max_nodes_per_read=0,
+                              max_parallel=DEFAULT_MAX_PARALLEL_REQUESTS):
+    """Legge i valori di molti nodi con richieste Read a blocchi, in parallelo."""
+    chunks = split_in_chunks(list(node_ids), max_nodes_per_read)
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+    async def _read_chunk(chunk):
+        params = ua.ReadParameters(TimestampsToReturn_=ua.TimestampsToReturn.Both)
+        for node_id in chunk:
+            read_value_id = ua.ReadValueId()
+            read_value_id.NodeId = node_id
+            read_value_id.AttributeId = ua.AttributeIds.Value
+            params.NodesToRead.append(read_value_id)
+        async with semaphore:
+            started = metrics_clock()
+            try:
+                data_values = await client.uaclient.read(params)
+            except Exception as exc:
+                record_request("opcua", "read", started, unit="nodes", error=exc)
+                raise
+            record_request("opcua", "read", started, len(chunk), "nodes")
+            recorder = get_recorder()
+            if recorder is not None:
+                for node_id, data_value in zip(chunk, data_values):
+                    recorder.record("opcua", "read", client, node_id.to_string(), struct_to_binary(data_value))
+            return data_values
+
+    chunk_results = await asyncio.gather(*(_read_chunk(chunk) for chunk in chunks))
+
+    started = metrics_clock()
+    results = [data_value_to_result(node_id.to_string(), data_value)
+               for chunk, data_values in zip(chunks, chunk_results)
+               for node_id, data_value in zip(chunk, data_values)]
+    record_decode("opcua", "read", started, "nodes")
+    return results
+
+
+def data_value_to_result(node_id_str, data_value):
+    """Converte un DataValue nel dizionario restituito dalle letture massive."""
+    value = None
+    if data_value.Value is not None:
+        value = data_value.Value.Value
+        if isinstance(value, list):
+            value = to_numeric_array(value, data_value.Value.VariantType)
+    return {
+        'node_id': node_id_str,
+        'value': value,
+        'variant_type': data_value.Value.VariantType if data_value.Value is not None else None,
+        'status': data_value.StatusCode.name,
+        'source_timestamp': data_value.SourceTimestamp,
+        'server_timestamp': data_value.ServerTimestamp,
+    }
+
+
+async def write_values_chunked(client, node_ids, variants, max_nodes_per_write=0,
+                               max_parallel=DEFAULT_MAX_PARALLEL_REQUESTS):
+    """
+    Scrive i valori (ua.Variant) di molti nodi con richieste Write a blocchi di
+    al massimo max_nodes_per_write nodi, in parallelo. Restituisce il nome dello
+    StatusCode di ogni nodo.
+    """
+    chunks = split_in_chunks(list(zip(node_ids, variants)), max_nodes_per_write)
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+    async def _write_chunk(chunk):
+        async with semaphore:
+            started = metrics_clock()
+            try:
+                status_codes = await client.uaclient.write_attributes(
+                    [node_id for node_id, _ in chunk], [ua.DataValue(variant) for _, variant in chunk])
+            except Exception as exc:
+                record_request("opcua", "write", started, unit="nodes", error=exc)
+                raise
+            record_request("opcua", "write", started, len(chunk), "nodes")
+            return [status_code.name for status_code in status_codes]
+
+    chunk_results = await asyncio.gather(*(_write_chunk(chunk) for chunk in chunks))
+    return [status for statuses in chunk_results for status in statuses]
+
+
+def data_value_from_binary(node_id_str, payload):
+    """Decodifica un DataValue registrato in codifica binaria OPC UA (vedi plc_capture)."""
+    return data_value_to_result(node_id_str, struct_from_binary(ua.DataValue, Buffer(bytes(payload))))
+
+
+def is_browse_path(node_reference):
+    """Indica se il riferimento è un percorso simbolico (es: Objects/Impianto/Velocita)."""
+    if not isinstance(node_reference, str) or "/" not in node_reference:
+        return False
+    if node_reference.startswith("NodeId(") or NODE_ID_STRING_RE.match(node_reference):
+        return False
+    return True
+
+
+def parse_browse_path(path, default_namespace=None):
+    """
+    Converte un percorso simbolico in una lista di (namespace, nome).
+    I segmenti possono essere qualificati ("3:ServerInterfaces"); per quelli non
+    qualificati il namespace è 0 per le cartelle standard, altrimenti
+    default_namespace (None = sconosciuto).
+    """
+    segments = [segment for segment in path.strip("/").split("/") if segment]
+    if segments and segments[0] == "Root":
+        segments = segments[1:]
+    if not segments:
+        raise ValueError(f"Percorso {path!r} vuoto: indicare almeno un nodo (es: Objects/Impianto).")
+
+    parsed = []
+    for position, segment in enumerate(segments):
+        match = QUALIFIED_SEGMENT_RE.match(segment)
+        if match:
+            parsed.append((int(match.group(1)), match.group(2)))
+        elif position == 0 and segment in STANDARD_FOLDERS:
+            parsed.append((0, segment))
+        else:
+            parsed.append((default_namespace, segment))
+    return parsed
+
+
+async def browse_references(client, node_ids):
+    """
+    Sfoglia più nodi con una Browse e restituisce tutti i riferimenti di ognuno.
+    I server che paginano i risultati restituiscono un ContinuationPoint: i
+    riferimenti mancanti si chiedono con BrowseNext, per tutti i nodi insieme.
+    """
+    browse_results = await client.browse_nodes([client.get_node(node_id) for node_id in node_ids])
+    references = [list(result.References) for _, result in browse_results]
+    pending = {index: result.ContinuationPoint for index, (_, result) in enumerate(browse_results)
+               if result.ContinuationPoint}
+    while pending:
+        params = ua.BrowseNextParameters()
+        params.ReleaseContinuationPoints = False
+        params.ContinuationPoints = list(pending.values())
+        results = await client.uaclient.browse_next(params)
+        next_pending = {}
+        for index, result in zip(pending, results):
+            if not result.StatusCode.is_good():
+                continue
+            references[index].extend(result.References)
+            if result.ContinuationPoint:
+                next_pending[index] = result.ContinuationPoint
+        pending = next_pending
+    return references
+
+
+class NodeRegistry:
+    """
+    Registro che risolve in blocco percorsi simbolici e Node ID in ua.NodeId.
+    I percorsi vengono tradotti con TranslateBrowsePathsToNodeIds (una richiesta
+    per blocco di MaxNodesPerTranslateBrowsePathsToNodeIds), i risultati restano
+    in cache e, se il server lo supporta, vengono registrati con RegisterNodes.
+    """
+
+    def __init__(self, client, loop, default_namespace=None, register_nodes=True):
+        self.client = client
+        self.loop = loop
+        self.default_namespace = default_namespace
+        self.register_nodes_enabled = register_nodes
+        self._resolved = {}
+        self._registered = {}
+        self._limits = None
+
+    async def operation_limits(self):
+        """OperationLimits del server, letti una sola volta e tenuti in cache fino a invalidate()."""
+        if self._limits is None:
+            self._limits = await fetch_operation_limits(self.client)
+        return self._limits
+
+    async def _translate(self, paths):
+        """Traduce i percorsi completamente qualificati con TranslateBrowsePathsToNodeIds."""
+        browse_paths = []
+        for path in paths:
+            relative_path = ua.RelativePath()
+            for namespace, name in parse_browse_path(path, self.default_namespace):
+                element = ua.RelativePathElement()
+                element.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+                element.IsInverse = False
+                element.IncludeSubtypes = True
+                element.TargetName = ua.QualifiedName(name, namespace)
+                relative_path.Elements.append(element)
+            browse_path = ua.BrowsePath()
+            browse_path.StartingNode = ua.NodeId(ua.ObjectIds.RootFolder)
+            browse_path.RelativePath = relative_path
+            browse_paths.append(browse_path)
+
+        limits = await self.operation_limits()
+        chunks = split_in_chunks(browse_paths, limits['MaxNodesPerTranslateBrowsePathsToNodeIds'])
+        chunk_results = await asyncio.gather(
+            *(self.client.uaclient.translate_browsepaths_to_nodeids(chunk) for chunk in chunks))
+
+        resolved = {}
+        results = [result for chunk in chunk_results for result in chunk]
+        for path, result in zip(paths, results):
+            if result.StatusCode.is_good() and result.Targets:
+                target = result.Targets[0].TargetId
+                resolved[path] = ua.NodeId(target.Identifier, target.NamespaceIndex, target.NodeIdType)
+        return resolved
+
+    async def _walk_by_names(self, paths):
+        """Risolve i percorsi per nome, sfogliando un livello alla volta tutti i percorsi insieme."""
+        pending = {path: parse_browse_path(path, self.default_namespace) for path in paths}
+        current = {path: ua.NodeId(ua.ObjectIds.RootFolder) for path in paths}
+        resolved = {}
+        depth = 0
+
+        while pending:
+            parents = list({current[path] for path in pending})
+            children = {}
+            for chunk in split_in_chunks(parents, DEFAULT_MAX_NODES_PER_REQUEST):
+                references = await browse_references(self.client, chunk)
+                for node_id, node_references in zip(chunk, references):
+                    children[node_id] = {
+                        (ref.BrowseName.NamespaceIndex, ref.BrowseName.Name): ref.NodeId for ref in node_references
+                    }
+
+            for path in list(pending):
+                namespace, name = pending[path][depth]
+                candidates = children.get(current[path], {})
+                child = candidates.get((namespace, name))
+                if child is None:
+                    child = next((node_id for (_, child_name), node_id in candidates.items() if child_name == name), None)
+                if child is None:
+                    del pending[path]
+                    continue
+                current[path] = ua.NodeId(child.Identifier, child.NamespaceIndex, child.NodeIdType)
+                if depth + 1 == len(pending[path]):
+                    resolved[path] = current[path]
+                    del pending[path]
+            depth += 1
+
+        return resolved
+
+    async def _register(self, node_ids):
+        """Registra i nodi sul server; se il servizio non è supportato lo disattiva."""
+        limits = await self.operation_limits()
+        try:
+            for chunk in split_in_chunks(node_ids, limits['MaxNodesPerRegisterNodes']):
+                registered = await self.client.uaclient.register_nodes(chunk)
+                self._registered.update(zip(chunk, registered))
+        except ua.UaStatusCodeError:
+            self.register_nodes_enabled = False
+
+    async def resolve_async(self, node_references):
+        """Versione asincrona di resolve(), da usare sul loop del client."""
+        missing_paths = []
+        for reference in node_references:
+            if reference in self._resolved:
+                continue
+            if is_browse_path(reference):
+                try:
+                    parse_browse_path(reference, self.default_namespace)
+                except ValueError as exc:
+                    print(f"Nodo {reference} non valido: {exc}")
+                    self._resolved[reference] = None
+                    continue
+                missing_paths.append(reference)
+            else:
+                try:
+                    self._resolved[reference] = to_node_id(self.client, reference)
+                except ValueError as exc:
+                    print(f"Nodo {reference} non valido: {exc}")
+                    self._resolved[reference] = None
+
+        if missing_paths:
+            missing_paths = list(dict.fromkeys(missing_paths))
+            qualified = [path for path in missing_paths
+                         if all(ns is not None for ns, _ in parse_browse_path(path, self.default_namespace))]
+            resolved = await self._translate(qualified) if qualified else {}
+            unresolved = [path for path in missing_paths if path not in resolved]
+            if unresolved:
+                resolved.update(await self._walk_by_names(unresolved))
+            for path in missing_paths:
+                if path not in resolved:
+                    print(f"Percorso {path} non trovato sul server.")
+                self._resolved[path] = resolved.get(path)
+
+        if self.register_nodes_enabled:
+            to_register = list(dict.fromkeys(
+                self._resolved[reference] for reference in node_references
+                if self._resolved.get(reference) is not None and self._resolved[reference] not in self._registered))
+            if to_register:
+                await self._register(to_register)
+
+        return [self._registered.get(self._resolved.get(reference), self._resolved.get(reference))
+                for reference in node_references]
+
+    def resolve(self, node_references):
+        """Risolve una lista di riferimenti in ua.NodeId (None se non trovati)."""
+        try:
+            return self.loop.run_until_complete(self.resolve_async(list(node_references)))
+        except Exception as e:
+            print(f"Errore durante la risoluzione dei nodi: {e}")
+            return [None] * len(node_references)
+
+    def get(self, node_reference):
+        """Risolve un singolo riferimento usando la cache."""
+        return self.resolve([node_reference])[0]
+
+    def invalidate(self):
+        """Svuota la cache, ad esempio dopo una riconnessione (le registrazioni non sono più valide)."""
+        self._resolved.clear()
+        self._registered.clear()
+        self._limits = None
+
+    def close(self):
+        """Annulla la registrazione dei nodi registrati sul server."""
+        registered = list(self._registered.values())
+        self._registered.clear()
+        if not registered:
+            return
+        try:
+            self.loop.run_until_complete(self.client.uaclient.unregister_nodes(registered))
+        except Exception as e:
+            print(f"Errore durante l'annullamento della registrazione dei nodi: {e}")
+
+
+async def resolve_references(client, node_references, registry=None):
+    """Risolve i riferimenti in ua.NodeId (None per quelli non risolti), in blocco tramite registry."""
+    if registry is not None:
+        return await registry.resolve_async(node_references)
+    resolved = []
+    for reference in node_references:
+        try:
+            resolved.append(to_node_id(client, reference))
+        except ValueError as exc:
+            print(f"Nodo {reference} ignorato: {exc}")
+            resolved.append(None)
+    return resolved
+
+
+def read_nodes_values_bulk(client, loop, node_references, max_parallel=DEFAULT_MAX_PARALLEL_REQUESTS,
+                           registry=None):
+    """
+    Legge i valori di una lista di nodi con poche richieste Read a blocchi.
+    I riferimenti possono essere Node ID o percorsi simbolici, risolti in blocco
+    tramite registry (creato al volo se non fornito). Con un registry
+    persistente anche risoluzioni e OperationLimits restano in cache, così ogni
+    lettura costa solo le richieste Read. I nodi non risolti non compaiono nei
+    risultati: usare 'reference' per associarli ai riferimenti richiesti.
+    """
+    node_references = list(node_references)
+    if registry is None and any(is_browse_path(reference) for reference in node_references):
+        registry = NodeRegistry(client, loop, register_nodes=False)
+
+    try:
+        async def _bulk_read():
+            resolved = await resolve_references(client, node_references, registry)
+            pairs = [(reference, node_id) for reference, node_id in zip(node_references, resolved)
+                     if node_id is not None]
+            if not pairs:
+                return []
+
+            recorder = get_recorder()
+            if recorder is not None:
+                for reference, node_id in pairs:
+                    node_id_str = node_id.to_string()
+                    if str(reference) != node_id_str:
+                        recorder.record_alias("opcua", client, str(reference), node_id_str)
+
+            limits = await (registry.operation_limits() if registry is not None else fetch_operation_limits(client))
+            results = await read_values_chunked(client, [node_id for _, node_id in pairs],
+                                                limits['MaxNodesPerRead'], max_parallel)
+            for (reference, _), item in zip(pairs, results):
+                item['reference'] = str(reference)
+            return results
+
+        return loop.run_until_complete(_bulk_read())
+    except Exception as e:
+        print(f"Errore durante la lettura massiva dei nodi: {e}")
+        return []
+
+
+def write_nodes_values_bulk(client, loop, node_references, values, variant_types=None,
+                            max_parallel=DEFAULT_MAX_PARALLEL_REQUESTS, registry=None):
+    """
+    Scrive i valori di una lista di nodi con poche richieste Write, a blocchi di
+    MaxNodesPerWrite. variant_types (nomi o ua.VariantType, None = dal nodo)
+    indica il tipo di ogni valore; i tipi mancanti vengono letti dai nodi con
+    una lettura massiva. Restituisce per ogni riferimento un dizionario con
+    reference, node_id, value e status.
+    """
+    node_references = list(node_references)
+    values = list(values)
+    variant_types = list(variant_types) if variant_types is not None else [None] * len(node_references)
+    if registry is None and any(is_browse_path(reference) for reference in node_references):
+        registry = NodeRegistry(client, loop, register_nodes=False)
+
+    results = [{'reference': str(reference), 'node_id': None, 'value': value, 'status': "BadNodeIdUnknown"}
+               for reference, value in zip(node_references, values)]
+    try:
+        async def _bulk_write():
+            resolved = await resolve_references(client, node_references, registry)
+            indexes = [index for index, node_id in enumerate(resolved) if node_id is not None]
+            if not indexes:
+                return
+
+            types = [getattr(ua.VariantType, variant_type) if isinstance(variant_type, str) else variant_type
+                     for variant_type in variant_types]
+            limits = await (registry.operation_limits() if registry is not None else fetch_operation_limits(client))
+            untyped = [index for index in indexes if types[index] is None]
+            if untyped:
+                current = await read_values_chunked(client, [resolved[index] for index in untyped],
+                                                    limits['MaxNodesPerRead'], max_parallel)
+                for index, item in zip(untyped, current):
+                    types[index] = item['variant_type']
+
+            statuses = await write_values_chunked(client, [resolved[index] for index in indexes],
+                                                  [to_variant(values[index], types[index]) for index in indexes],
+                                                  limits['MaxNodesPerWrite'], max_parallel)
+            for index, status in zip(indexes, statuses):
+                results[index]['node_id'] = resolved[index].to_string()
+                results[index]['status'] = status
+
+        loop.run_until_complete(_bulk_write())
+    except Exception as e:
+        print(f"Errore durante la scrittura massiva dei nodi: {e}")
+        # Nodi non ancora scritti quando la richiesta è fallita
+        for item in results:
+            if item['node_id'] is None:
+                item['status'] = "BadCommunicationError"
+    return results
+
+
+def load_node_ids_from_file(path):
+    """Carica un elenco di Node ID o percorsi simbolici da file (uno per riga, '#' per i commenti)."""
+    node_ids = []
+    with open(path, "r", encoding="utf-8") as node_file:
+        for line in node_file:
+            entry = line.split("#", 1)[0].strip()
+            if entry:
+                node_ids.append(entry)
+    return node_ids
+
+
+def bulk_read_from_file(client, loop):
+    """Legge in blocco i nodi elencati in un file e ne mostra o salva i valori."""
+    path = input("Inserisci il percorso del file con i Node ID: ").strip()
+    try:
+        node_references = load_node_ids_from_file(path)
+    except OSError as exc:
+        print(f"Errore durante la lettura del file {path}: {exc}")
+        return
+
+    if not node_references:
+        print("Nessun Node ID trovato nel file.")
+        return
+
+    start = datetime.now()
+    results = read_nodes_values_bulk(client, loop, node_references)
+    elapsed = (datetime.now() - start).total_seconds()
+
+    if not results:
+        print("Nessun valore letto.")
+        return
+
+    for index, item in enumerate(results, 1):
+        print(f"{index:4d}. {item['reference']} ({item['node_id']}) = {format_variable_value(item['value'])} "
+              f"[{item['status']}] (sorgente: {item['source_timestamp']}, server: {item['server_timestamp']})")
+    print(f"Letti {len(results)} nodi in {elapsed:.3f} s")
+
+    save = input("Vuoi salvare i valori su file CSV? (s/n): ").lower()
+    if save != 's':
+        return
+
+    filename = f"bulk_read_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    try:
+        with open(filename, "w", encoding="utf-8", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['reference', 'node_id', 'value', 'status', 'source_timestamp', 'server_timestamp'])
+            for item in results:
+                writer.writerow([item['reference'], item['node_id'], format_variable_value(item['value']), item['status'],
+                                 item['source_timestamp'], item['server_timestamp']])
+    except OSError as exc:
+        print(f"Errore durante la scrittura del file {filename}: {exc}")
+        return
+
+    print(f"Valori salvati in {filename}")
+
+
 def browse_nodes(client, loop, parent_node_id="i=85", show_values=False):
     """Esplora i nodi figli di un nodo padre."""
     try:
@@ -229,7 +958,13 @@ def browse_nodes(client, loop, parent_node_id="i=85", show_values=False):
 
             return nodes_info
 
-        nodes = loop.run_until_complete(_browse())
+        started = metrics_clock()
+        try:
+            nodes = loop.run_until_complete(_browse())
+        except Exception as exc:
+            record_request("opcua", "browse", started, unit="nodes", error=exc)
+            raise
+        record_request("opcua", "browse", started, len(nodes), "nodes")
 
         if nodes:
             print(f"\nNodi trovati sotto {parent_node_id}:")
@@ -238,7 +973,11 @@ def browse_nodes(client, loop, parent_node_id="i=85", show_values=False):
                 display_text = f"{i}. {node['browse_name']} ({class_name})"
 
                 if 'value' in node:
-                    display_text += f" = {node['value']}"
+                    value = node['value']
+                    if isinstance(value, (list, tuple)) or is_numeric_array(value):
+                        display_text += f" = {summarize_array(to_numeric_array(value))}"
+                    else:
+                        display_text += f" = {value}"
                     if 'opcua_type' in node and node['opcua_type'] != 'Unknown':
                         display_text += f" [Tipo: {node['opcua_type']}]"
 
@@ -346,6 +1085,17 @@ def export_variables_to_file(client, loop):
 
     for index, item in enumerate(variables, 1):
         value_str = format_variable_value(item['value']) if item['readable'] else "(non leggibile)"
+        if item['readable'] and (isinstance(item['value'], (list, tuple)) or is_numeric_array(item['value'])):
+            # Gli array sono riassunti nel testo e salvati a parte in formato binario
+            values = to_numeric_array(item['value'])
+            value_str = summarize_array(values)
+            base_filename = f"{filename[:-4]}_{index:02d}_{node_id_to_filename_fragment(item['name'])}"
+            try:
+                binary_filename = save_array_binary(values, base_filename)
+                if binary_filename:
+                    value_str += f" -> {binary_filename}"
+            except OSError as exc:
+                print(f"Errore durante il salvataggio dell'array {item['name']}: {exc}")
         opcua_type = item.get('opcua_type', 'Unknown')
         line = f"{index:2d}. {item['name']:<{name_width}} | {item['node_id']:<{node_id_width}} | {opcua_type:<{type_width}} = {value_str}"
         lines.append(line)
@@ -376,7 +1126,9 @@ def parse_opcua_data(value, expected_type=None):
         elif isinstance(value, str):
             return f"String: '{value}'"
         elif hasattr(value, '__iter__') and not isinstance(value, str):
-            return f"Array [{len(list(value))} elementi]: {list(value)}"
+            if not hasattr(value, '__len__'):
+                value = list(value)
+            return summarize_array(to_numeric_array(value))
         else:
             return f"Tipo {value_type}: {value}"
     except Exception as e:
@@ -478,10 +1230,14 @@ def interactive_node_navigation(client, loop):
             input("Premi Invio per continuare...")
 
 def main():
+    # Importato qui perché il modulo del supervisore dipende da questo
+    from plc_opcua_session import SessionSupervisor
+
     print("=== PLC OPC UA Reader ===")
     
     client = None
     loop = None
+    supervisor = None
     
     while client is None:
         user_input = input("Inserisci IP del PLC (es: 192.168.125.125) o URL completo: ")
@@ -500,7 +1256,10 @@ def main():
             print("L'URL deve iniziare con 'opc.tcp://'")
             continue
         
-        client, loop = connect_to_opcua_server(endpoint_url)
+        # Il supervisore riconnette automaticamente la sessione dopo un'interruzione di rete
+        supervisor = SessionSupervisor(endpoint_url)
+        if supervisor.start():
+            client, loop = supervisor.client, supervisor.loop
         
         if client is None:
             retry = input("Connessione fallita. Vuoi riprovare? (s/n): ").lower()
@@ -514,6 +1273,8 @@ def main():
             print("1. Leggi valore di un nodo")
             print("2. Esplora nodi")
             print("3. Esporta variabili su file")
+            print("4. Lettura massiva da file di Node ID")
+            print("5. Esporta storico (HistoryRead) su CSV")
             print("x. Esci")
 
             choice = input("Seleziona un'opzione: ")
@@ -553,7 +1314,16 @@ def main():
             elif choice == '3':
                 # Esportazione variabili su file
                 export_variables_to_file(client, loop)
-                
+
+            elif choice == '4':
+                # Lettura massiva a blocchi
+                bulk_read_from_file(client, loop)
+
+            elif choice == '5':
+                # Esportazione storico; importato qui perché il modulo dipende da questo
+                from plc_opcua_history import export_history_interactive
+                export_history_interactive(client, loop)
+
             elif choice == 'x':
                 print("Uscita dall'applicazione.")
                 break
@@ -567,7 +1337,7 @@ def main():
     except Exception as e:
         print(f"Errore nell'applicazione: {e}")
     finally:
-        disconnect_from_server(client, loop)
+        supervisor.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import random
+from datetime import datetime, timezone
+
+from plc_opcua_reader import (
+    NodeRegistry,
+    connect_to_opcua_server,
+    disconnect_from_server,
+    read_nodes_values_bulk,
+    resolve_node_reference,
+    write_nodes_values_bulk,
+)
+
+# Intervallo e timeout del controllo di keepalive (secondi)
+DEFAULT_KEEPALIVE_INTERVAL = 1.0
+DEFAULT_KEEPALIVE_TIMEOUT = 3.0
+# Backoff esponenziale tra i tentativi di riconnessione (secondi)
+DEFAULT_RECONNECT_MIN_DELAY = 1.0
+DEFAULT_RECONNECT_MAX_DELAY = 30.0
+
+STATUS_NOT_CONNECTED = "BadNotConnected"
+
+
+class SessionSupervisor:
+    """
+    Supervisore di una sessione OPC UA aperta con connect_to_opcua_server.
+    Controlla periodicamente la connessione, in caso di perdita riconnette lo
+    stesso client con backoff esponenziale, ricrea le sottoscrizioni e registra
+    gli intervalli di disservizio in self.gaps. Poiché il client viene riusato,
+    le coppie (client, loop) già passate alle altre funzioni restano valide.
+    Le letture e le scritture usano un NodeRegistry della sessione: i nodi
+    risolti (e registrati con RegisterNodes, se il server lo supporta) e gli
+    OperationLimits restano in cache fino alla riconnessione.
+    """
+
+    def __init__(self, endpoint_url, keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT, reconnect_min_delay=DEFAULT_RECONNECT_MIN_DELAY,
+                 reconnect_max_delay=DEFAULT_RECONNECT_MAX_DELAY):
+        self.endpoint_url = endpoint_url
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_timeout = keepalive_timeout
+        self.reconnect_min_delay = reconnect_min_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.client = None
+        self.loop = None
+        self.registry = None
+        self.connected = False
+        self.reconnections = 0
+        self.gaps = []
+        self._subscriptions = []
+        self._reconnect_callbacks = []
+        self._watchdog = None
+        self._stopping = False
+
+    def start(self):
+        """Apre la sessione e avvia il controllo di keepalive. Restituisce True se connesso."""
+        self.client, self.loop = connect_to_opcua_server(self.endpoint_url)
+        if self.client is None:
+            return False
+
+        self.registry = NodeRegistry(self.client, self.loop)
+        self.connected = True
+        self._stopping = False
+        self._watchdog = self.loop.submit(self._supervise())
+        return True
+
+    def stop(self):
+        """Ferma il supervisore, elimina le sottoscrizioni e chiude la sessione."""
+        self._stopping = True
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+
+        if self.client is None:
+            return
+
+        async def _delete_subscriptions():
+            for spec in self._subscriptions:
+                await self._delete_subscription(spec)
+
+        try:
+            self.loop.run_until_complete(_delete_subscriptions())
+        except Exception:
+            pass
+        self._subscriptions.clear()
+        # Annulla la registrazione dei nodi prima di chiudere la sessione
+        self.registry.close()
+
+        disconnect_from_server(self.client, self.loop)
+        self.connected = False
+        self.client = None
+        self.loop = None
+        self.registry = None
+
+    def add_reconnect_callback(self, callback):
+        """Registra una funzione chiamata (sul thread del loop) dopo ogni riconnessione."""
+        self._reconnect_callbacks.append(callback)
+
+    def subscribe(self, node_references, handler, period_ms=500):
+        """
+        Crea una sottoscrizione data-change che viene ricreata a ogni riconnessione.
+        handler segue l'interfaccia asyncua (datachange_notification) e può
+        implementare gap_notification(start, end) per sapere quali intervalli mancano.
+        """
+        spec = {
+            'node_references': list(node_references),
+            'handler': handler,
+            'period_ms': period_ms,
+            'subscription': None,
+        }
+        try:
+            self.loop.run_until_complete(self._create_subscription(spec))
+        except Exception as e:
+            print(f"Errore durante la creazione della sottoscrizione: {e}")
+            return None
+        self._subscriptions.append(spec)
+        return spec['subscription']
+
+    def read_values(self, node_references):
+        """
+        Lettura massiva che durante un disservizio non blocca: restituisce subito
+        i nodi marcati con stato BadNotConnected, così il ciclo di polling mantiene
+        la propria cadenza e il buco nei dati resta visibile.
+        """
+        node_references = list(node_references)
+        if self.connected:
+            results = read_nodes_values_bulk(self.client, self.loop, node_references, registry=self.registry)
+            if results:
+                return results
+
+        now = datetime.now(timezone.utc)
+        return [{
+            'reference': str(reference),
+            'node_id': str(reference),
+            'value': None,
+            'status': STATUS_NOT_CONNECTED,
+            'source_timestamp': None,
+            'server_timestamp': now,
+        } for reference in node_references]
+
+    def write_values(self, node_references, values, variant_types=None):
+        """Scrittura massiva; durante un disservizio restituisce subito i nodi con stato BadNotConnected."""
+        node_references = list(node_references)
+        if self.connected:
+            return write_nodes_values_bulk(self.client, self.loop, node_references, values, variant_types,
+                                           registry=self.registry)
+        return [{'reference': str(reference), 'node_id': None, 'value': value, 'status': STATUS_NOT_CONNECTED}
+                for reference, value in zip(node_references, values)]
+
+    async def _create_subscription(self, spec):
+        subscription = await self.client.create_subscription(spec['period_ms'], spec['handler'])
+        nodes = [resolve_node_reference(self.client, reference) for reference in spec['node_references']]
+        await subscription.subscribe_data_change(nodes)
+        spec['subscription'] = subscription
+
+    async def _delete_subscription(self, spec):
+        subscription = spec.get('subscription')
+        spec['subscription'] = None
+        if subscription is None:
+            return
+        try:
+            await subscription.delete()
+        except Exception:
+            # Dopo una perdita di sessione la sottoscrizione non esiste più sul server
+            pass
+
+    async def _probe(self):
+        """Verifica che i task interni del client siano vivi e che il server risponda."""
+        await self.client.check_connection()
+        await self.client.nodes.server_state.read_value()
+
+    async def _supervise(self):
+        while not self._stopping:
+            await asyncio.sleep(self.keepalive_interval)
+            try:
+                await asyncio.wait_for(self._probe(), self.keepalive_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                if self._stopping:
+                    continue
+                try:
+                    await self._recover(exc)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Il controllo continua: al prossimo giro si ritenta la riconnessione
+                    print(f"Errore durante il ripristino della sessione: {e}")
+
+    async def _recover(self, exc):
+        """Riconnette con backoff esponenziale e ripristina le sottoscrizioni."""
+        gap_start = datetime.now(timezone.utc)
+        self.connected = False
+        print(f"Connessione persa con {self.endpoint_url}: {str(exc) or type(exc).__name__}. Riconnessione in corso...")
+
+        delay = self.reconnect_min_delay
+        while not self._stopping:
+            try:
+                await self.client.disconnect()
+            except Exception:
+                pass
+            try:
+                await self.client.connect()
+                break
+            except Exception as e:
+                wait = delay + random.uniform(0, delay / 10)
+                print(f"Riconnessione fallita: {e}. Nuovo tentativo tra {wait:.1f} s")
+                await asyncio.sleep(wait)
+                delay = min(delay * 2, self.reconnect_max_delay)
+
+        if self._stopping:
+            return
+
+        gap_end = datetime.now(timezone.utc)
+        self.gaps.append((gap_start, gap_end))
+        self.reconnections += 1
+        # La nuova sessione può avere limiti e spazio dei nomi diversi
+        self.registry.invalidate()
+
+        try:
+            await self._restore(gap_start, gap_end)
+        finally:
+            # Un errore nel ripristino non deve lasciare il supervisore "scollegato" per sempre
+            self.connected = True
+        duration = (gap_end - gap_start).total_seconds()
+        print(f"Riconnesso a {self.endpoint_url} dopo {duration:.1f} s di disservizio.")
+
+    async def _restore(self, gap_start, gap_end):
+        """Ricrea le sottoscrizioni, notifica il disservizio e chiama le callback di riconnessione."""
+        for spec in self._subscriptions:
+            await self._delete_subscription(spec)
+            try:
+                await self._create_subscription(spec)
+            except Exception as e:
+                print(f"Errore durante il ripristino della sottoscrizione: {e}")
+                continue
+            gap_notification = getattr(spec['handler'], "gap_notification", None)
+            if gap_notification is not None:
+                try:
+                    gap_notification(gap_start, gap_end)
+                except Exception as e:
+                    print(f"Errore nella notifica del disservizio: {e}")
+
+        for callback in self._reconnect_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Errore nella callback di riconnessione: {e}")
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Download di ricette: scrive in blocco i parametri su PLC S7, Modbus TCP e OPC UA.
+
+La ricetta ha lo stesso formato del file dei tag del collector (JSON, TOML o
+YAML) con un campo "value" per ogni tag. Ogni dispositivo scrive tutti i suoi
+parametri con poche transazioni:
+
+    S7       tag contigui uniti in blocchi, più blocchi per write_multi_vars
+    Modbus   indirizzi contigui in write_registers/write_coils fino a 123
+             registri o 1968 coils per richiesta
+    OPC UA   Write multi-nodo a blocchi di MaxNodesPerWrite
+
+I valori vengono codificati con gli inversi delle funzioni di decodifica dei
+reader. Con --verify i parametri scritti vengono riletti (con le letture a
+blocchi del collector) e confrontati con il valore atteso dopo la codifica.
+
+Esempio:
+    python src/plc_recipe.py ricetta.json --verify
+"""
+import argparse
+import json
+import math
+import sys
+
+import plc_metrics
+from plc_collector import DEVICE_CLASSES, QUALITY_GOOD, load_tag_config, to_jsonable
+
+# Tolleranza relativa nel confronto dei valori reali riletti
+FLOAT_TOLERANCE = 1e-6
+
+
+def load_recipe(path):
+    """Carica la ricetta e controlla che ogni tag abbia un 'value'."""
+    config = load_tag_config(path)
+    for device in config["devices"]:
+        for tag in device["tags"]:
+            if "value" not in tag:
+                raise ValueError(f"Tag {device['name']}/{tag['name']}: manca 'value'.")
+    return config
+
+
+def values_match(expected, actual):
+    """Confronta un valore atteso con quello riletto (reali con tolleranza, array elemento per elemento)."""
+    if hasattr(actual, "tolist"):
+        actual = actual.tolist()
+    if isinstance(expected, (list, tuple)) or isinstance(actual, (list, tuple)):
+        if not isinstance(expected, (list, tuple)) or not isinstance(actual, (list, tuple)):
+            return False
+        return len(expected) == len(actual) and all(values_match(e, a) for e, a in zip(expected, actual))
+    if isinstance(expected, float) or isinstance(actual, float):
+        try:
+            return math.isclose(float(expected), float(actual), rel_tol=FLOAT_TOLERANCE, abs_tol=FLOAT_TOLERANCE)
+        except (TypeError, ValueError):
+            return False
+    return expected == actual
+
+
+def write_requests(registry, protocol):
+    """Richieste di scrittura registrate finora per un protocollo."""
+    return sum(stats.requests for (stats_protocol, operation), stats in registry.operations.items()
+               if stats_protocol == protocol and operation.startswith("write"))
+
+
+def download_device(device_config, verify=False):
+    """Scrive i parametri di un dispositivo; restituisce un risultato per tag."""
+    name = device_config["name"]
+    tags = device_config["tags"]
+    values = [tag["value"] for tag in tags]
+    results = [{'device': name, 'tag': tag["name"], 'value': tag["value"], 'status': "BadNotConnected",
+                'verified': None} for tag in tags]
+
+    device = DEVICE_CLASSES[device_config["protocol"]](device_config)
+    if not device.connect():
+        print(f"[{name}] Connessione fallita: ricetta non scaricata.")
+        return results
+
+    try:
+        statuses = device.write(tags, values)
+        for result, status in zip(results, statuses):
+            result['status'] = status
+
+        if verify:
+            written = [index for index, status in enumerate(statuses) if status == QUALITY_GOOD]
+            readings = device.read([tags[index] for index in written]) if written else []
+            for index, (value, quality) in zip(written, readings):
+                expected = device.expected_value(tags[index], values[index])
+                results[index]['verified'] = quality == QUALITY_GOOD and values_match(expected, value)
+                if not results[index]['verified']:
+                    print(f"[{name}] Verifica fallita per {tags[index]['name']}: atteso {expected!r}, "
+                          f"riletto {value!r} ({quality})")
+    finally:
+        device.close()
+    return results
+
+
+def download_recipe(config, verify=False):
+    """Scrive i parametri di tutti i dispositivi della ricetta, uno dopo l'altro."""
+    # Le metriche delle richieste servono a contare le transazioni di ogni dispositivo
+    registry = plc_metrics.enable_metrics()
+    results = []
+    for device_config in config["devices"]:
+        protocol = device_config["protocol"]
+        requests_before = write_requests(registry, protocol)
+        device_results = download_device(device_config, verify)
+        transactions = write_requests(registry, protocol) - requests_before
+
+        written = sum(1 for result in device_results if result['status'] == QUALITY_GOOD)
+        message = (f"[{device_config['name']}] Scritti {written}/{len(device_results)} parametri "
+                   f"in {transactions} transazioni")
+        if verify:
+            verified = sum(1 for result in device_results if result['verified'])
+            message += f", verificati {verified}/{written}"
+        print(message)
+        results.extend(device_results)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scarica una ricetta su PLC S7, Modbus TCP e OPC UA.")
+    parser.add_argument("recipe", help="file della ricetta (.json, .toml, .yaml): tag con 'value'")
+    parser.add_argument("--verify", action="store_true", help="rilegge i parametri scritti e li confronta")
+    parser.add_argument("--report", help="file JSON con l'esito di ogni parametro")
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_recipe(args.recipe)
+    except (OSError, ValueError) as exc:
+        print(f"Errore nella ricetta: {exc}", file=sys.stderr)
+        return 1
+
+    results = download_recipe(config, args.verify)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump(results, report_file, indent=2, default=to_jsonable)
+
+    failed = [result for result in results
+              if result['status'] != QUALITY_GOOD or (args.verify and not result['verified'])]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,22 @@
+import ctypes
 import math
 import snap7
+from snap7.error import check_error, error_text
+from snap7.type import S7DataItem, WordLen
 from snap7.util import *
 import sys
 
+from plc_capture import get_recorder, s7_request_key
+from plc_metrics import metrics_clock, record_decode, record_request
+
+# Variabili al massimo in una write_multi_vars (limite di snap7)
+MAX_WRITE_ITEMS = 20
+# Intestazione di una richiesta di scrittura e costo fisso di ogni variabile (byte del PDU)
+WRITE_REQUEST_HEADER_BYTES = 12
+WRITE_ITEM_OVERHEAD_BYTES = 16
+# PDU negoziato di default se il PLC non lo comunica
+DEFAULT_PDU_LENGTH = 240
+
 def connect_to_plc(ip, rack, slot, port=102):
     plc = snap7.client.Client()
     try:
@@ -13,9 +27,16 @@ def connect_to_plc(ip, rack, slot, port=102):
         print(f"Errore durante la connessione al PLC: {e}")
         return None
 
-def read_plc_data(plc, area, db_number, start_offset, size):
+def read_plc_data(plc, area, db_number, start_offset, size, verbose=True):
+    started = metrics_clock()
     try:
         data = plc.read_area(area, db_number, start_offset, size)
+        record_request("s7", "read_area", started, size, "bytes")
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record("s7", "read_area", plc, s7_request_key(area, db_number, start_offset, size), bytes(data))
+        if not verbose:
+            return data
         
         # Tentativo di ottenere un nome leggibile per l'area
         try:
@@ -29,6 +50,7 @@ def read_plc_data(plc, area, db_number, start_offset, size):
              print(f"Dati letti dall'area {area_name} (Offset {start_offset}, Size {size}): {data}")
         return data
     except Exception as e:
+        record_request("s7", "read_area", started, unit="bytes", error=e)
         print(f"Errore durante la lettura dei dati: {e}")
         return None
 
@@ -39,6 +61,7 @@ def parse_data(data, data_type, index, string_length=None, byte_index=0):
     'byte_index' è il byte all'interno del buffer per il tipo 'bool',
     altrimenti 'index' è l'indice del byte di partenza (solitamente 0).
     """
+    started = metrics_clock()
     try:
         if data_type == 'bool':
             return get_bool(data, byte_index, index)
@@ -58,11 +81,142 @@ def parse_data(data, data_type, index, string_length=None, byte_index=0):
     except Exception as e:
         print(f"Errore durante il parsing dei dati: {e}")
         return None
+    finally:
+        record_decode("s7", "parse_data", started)
 
 def get_string(data, offset, length):
     """Legge una stringa dal buffer di dati."""
     return data[offset:offset + length].decode('utf-8').strip('\x00')
 
+def set_string(data, offset, value, length):
+    """Scrive una stringa nel buffer di dati, troncata o completata con zeri fino a length."""
+    data[offset:offset + length] = str(value).encode('utf-8')[:length].ljust(length, b'\x00')
+
+def encode_data(data, data_type, value, index, string_length=None, byte_index=0):
+    """
+    Codifica value nel buffer data, all'inverso di parse_data (stessi parametri).
+    Restituisce True se il valore è stato scritto nel buffer.
+    """
+    try:
+        if data_type == 'bool':
+            set_bool(data, byte_index, index, bool(value))
+        elif data_type == 'int':
+            set_int(data, index, int(value))
+        elif data_type == 'real':
+            set_real(data, index, float(value))
+        elif data_type == 'string':
+            if string_length is None:
+                raise ValueError("Per il tipo 'string', è necessario specificare la lunghezza.")
+            set_string(data, index, value, string_length)
+        elif data_type == 'udint':
+            set_udint(data, index, int(value))
+        else:
+            print("Tipo di dato non supportato.")
+            return False
+        return True
+    except Exception as e:
+        print(f"Errore durante la codifica dei dati: {e}")
+        return False
+
+def write_plc_data(plc, area, db_number, start_offset, data, verbose=True):
+    """Scrive un blocco di byte con write_area. Restituisce True se riuscita."""
+    started = metrics_clock()
+    try:
+        plc.write_area(area, db_number, start_offset, bytearray(data))
+        record_request("s7", "write_area", started, len(data), "bytes")
+        if verbose:
+            print(f"Scritti {len(data)} byte nell'area {getattr(area, 'name', area)} "
+                  f"(DB {db_number}, Offset {start_offset})")
+        return True
+    except Exception as e:
+        record_request("s7", "write_area", started, unit="bytes", error=e)
+        print(f"Errore durante la scrittura dei dati: {e}")
+        return False
+
+def pack_write_items(writes, pdu_length):
+    """
+    Raggruppa le scritture (area, db, offset, dati) in lotti che stanno in un
+    PDU e in una write_multi_vars. Una scrittura più grande del PDU resta da
+    sola: write_area la divide in più PDU.
+    """
+    budget = pdu_length - WRITE_REQUEST_HEADER_BYTES
+    batches = []
+    batch, used = [], 0
+    for write in writes:
+        size = len(write[3])
+        cost = WRITE_ITEM_OVERHEAD_BYTES + size + size % 2
+        if batch and (used + cost > budget or len(batch) >= MAX_WRITE_ITEMS):
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(write)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+def item_error_text(code):
+    """Messaggio di errore snap7 di una singola variabile (error_text restituisce byte)."""
+    text = error_text(code, "client")
+    return text.decode("ascii", "replace") if isinstance(text, bytes) else text
+
+def write_multi_plc_data(plc, writes, verbose=True):
+    """
+    Scrive più blocchi (area, db, offset, dati) con il minor numero di
+    write_multi_vars. Restituisce l'esito (True/False) di ogni scrittura.
+    """
+    try:
+        pdu_length = plc.get_pdu_length() or DEFAULT_PDU_LENGTH
+    except Exception:
+        pdu_length = DEFAULT_PDU_LENGTH
+
+    results = []
+    for batch in pack_write_items(writes, pdu_length):
+        if len(batch) == 1:
+            area, db_number, start_offset, data = batch[0]
+            results.append(write_plc_data(plc, area, db_number, start_offset, data, verbose))
+            continue
+
+        items = (S7DataItem * len(batch))()
+        # I buffer devono restare referenziati fino al termine della chiamata
+        buffers = []
+        for item, (area, db_number, start_offset, data) in zip(items, batch):
+            buffer = (ctypes.c_uint8 * len(data)).from_buffer_copy(bytes(data))
+            buffers.append(buffer)
+            item.Area = area.value
+            item.WordLen = WordLen.Byte.value
+            item.DBNumber = db_number
+            item.Start = start_offset
+            item.Amount = len(data)
+            item.pData = ctypes.cast(buffer, ctypes.POINTER(ctypes.c_uint8))
+
+        started = metrics_clock()
+        try:
+            # Client.write_multi_vars copia gli elementi e ne scarta il Result, mentre snap7
+            # segnala solo lì gli errori delle singole variabili: si chiama la libreria
+            # direttamente su un array che resta nostro. _lib e _s7_client sono privati di
+            # python-snap7: la versione è bloccata a 2.0.* in requirements.txt, da ricontrollare
+            # a ogni aggiornamento (la copre tests/test_s7_reader.py)
+            check_error(plc._lib.Cli_WriteMultiVars(plc._s7_client, ctypes.byref(items), ctypes.c_int32(len(batch))),
+                        context="client")
+        except Exception as e:
+            record_request("s7", "write_multi_vars", started, unit="bytes", error=e)
+            print(f"Errore durante la scrittura multipla dei dati: {e}")
+            results.extend([False] * len(batch))
+            continue
+
+        failed = 0
+        for item, (area, db_number, start_offset, data) in zip(items, batch):
+            if item.Result:
+                failed += 1
+                print(f"Errore durante la scrittura di {len(data)} byte nell'area {getattr(area, 'name', area)} "
+                      f"(DB {db_number}, Offset {start_offset}): {item_error_text(item.Result)}")
+            results.append(not item.Result)
+        written = sum(len(data) for item, (_, _, _, data) in zip(items, batch) if not item.Result)
+        record_request("s7", "write_multi_vars", started, written, "bytes", error=True if failed else None)
+        if verbose:
+            print(f"Scritte {len(batch) - failed}/{len(batch)} variabili ({written} byte) con una richiesta")
+    return results
+
 def scan_plc_network(ip, db_number, port=102):
     """Scansiona tutte le combinazioni rack/slot per trovare PLC online."""
     print(f"\nInizio scansione PLC su IP: {ip}")
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Scheduler adattivo del collector, con classi di priorità e contropressione.
+
+Ogni tag ha una cadenza ("rate") e una priorità ("high", "normal", "low"),
+scritte direttamente o ereditate da una classe in "rate_classes":
+
+    "rate_classes": {
+        "allarmi": {"rate": 0.1, "priority": "high"},
+        "energia": {"rate": 60, "priority": "low"}
+    }
+
+I gruppi di tag che scadono nello stesso momento (entro COALESCE_WINDOW)
+vengono letti con un'unica chiamata a device.read, quindi in un'unica
+transazione: una Read OPC UA, o una richiesta per blocco di indirizzi S7 e
+Modbus. Il poller misura la frazione di tempo passata in lettura e la quota di
+letture non buone: se crescono, allunga le cadenze (i tag "normal" del fattore
+di rallentamento, i "low" del suo quadrato, gli "high" mai); quando il
+dispositivo torna scarico le riporta al valore configurato. In sovraccarico le
+letture a bassa priorità vengono scartate per prime, per non far slittare le
+scadenze dei tag più importanti.
+
+Si attiva con "scheduler": "adaptive" nel file dei tag o con
+plc_collector.py --scheduler adaptive.
+"""
+import math
+import time
+
+from plc_collector import DEFAULT_POLL_RATE, DEFAULT_PRIORITY, PRIORITIES, QUALITY_GOOD, DevicePoller
+
+# Gruppi che scadono entro questa finestra vengono anticipati e letti insieme (secondi)
+COALESCE_WINDOW = 0.02
+# Intervallo tra due adattamenti del fattore di rallentamento (secondi)
+ADAPT_INTERVAL = 1.0
+# Frazione del tempo in lettura oltre la quale le cadenze vengono allungate
+TARGET_UTILIZATION = 0.7
+# Frazione del tempo in lettura oltre la quale i tag "low" vengono scartati
+OVERLOAD_UTILIZATION = 0.9
+# Quota di letture non buone oltre la quale le cadenze vengono allungate
+MAX_ERROR_RATE = 0.2
+# Ritardo tollerato sulla scadenza di un gruppo più prioritario, in frazioni della sua cadenza
+DEADLINE_TOLERANCE = 0.5
+# Scarti consecutivi dopo i quali un gruppo viene letto comunque (niente attesa infinita)
+MAX_CONSECUTIVE_SHEDS = 4
+# Fattore massimo di rallentamento e passi di aumento/diminuzione
+MAX_STRETCH = 16.0
+STRETCH_UP = 1.5
+STRETCH_DOWN = 0.8
+# Esponente del fattore di rallentamento per priorità
+PRIORITY_STRETCH = {"high": 0, "normal": 1, "low": 2}
+# Peso dell'ultima misura nelle medie mobili esponenziali
+EWMA_ALPHA = 0.2
+
+
+class PollGroup:
+    """Tag di un dispositivo con la stessa cadenza e priorità."""
+
+    def __init__(self, rate, priority, tags):
+        self.rate = rate
+        self.priority = priority
+        self.rank = PRIORITIES.index(priority)
+        self.tags = tags
+        self.next_due = 0.0
+        self.skipped = 0
+
+
+def group_tags_by_class(tags):
+    """Raggruppa i tag per (cadenza, priorità), dal gruppo più prioritario."""
+    groups = {}
+    for tag in tags:
+        key = (float(tag.get("rate", DEFAULT_POLL_RATE)), tag.get("priority", DEFAULT_PRIORITY))
+        groups.setdefault(key, []).append(tag)
+    return sorted((PollGroup(rate, priority, group_tags) for (rate, priority), group_tags in groups.items()),
+                  key=lambda group: (group.rank, group.rate))
+
+
+def ewma(previous, value):
+    return value if previous is None else previous + EWMA_ALPHA * (value - previous)
+
+
+class AdaptiveDevicePoller(DevicePoller):
+    """DevicePoller con transazioni unite, cadenze adattive e scarto per priorità."""
+
+    def __init__(self, device_config, emit, stop_event):
+        super().__init__(device_config, emit, stop_event)
+        self.poll_groups = group_tags_by_class(device_config["tags"])
+        self.stretch = 1.0
+        self.utilization = 0.0
+        self.error_rate = 0.0
+        # Durata media di lettura per tag, usata per stimare il costo di una transazione
+        self.tag_latency = None
+        self.transactions = 0
+        self.shed = {priority: 0 for priority in PRIORITIES}
+        self._busy = 0.0
+        self._window_start = 0.0
+
+    def period(self, group):
+        """Cadenza effettiva del gruppo con il rallentamento corrente."""
+        return group.rate * self.stretch ** PRIORITY_STRETCH[group.priority]
+
+    def _select(self, due, now):
+        """
+        Sceglie i gruppi da leggere in questa transazione. Si scartano prima i
+        gruppi meno prioritari se il dispositivo è saturo o se la lettura non
+        finirebbe entro la prossima scadenza di un gruppo più prioritario (più
+        DEADLINE_TOLERANCE della sua cadenza).
+        I tag "high" e i gruppi già scartati MAX_CONSECUTIVE_SHEDS volte restano.
+        """
+        def sheddable(group):
+            return group.priority != "high" and group.skipped < MAX_CONSECUTIVE_SHEDS
+
+        selected = list(due)
+        if self.utilization >= OVERLOAD_UTILIZATION:
+            selected = [group for group in selected if group.priority != "low" or not sheddable(group)]
+
+        while self.tag_latency is not None:
+            candidates = [group for group in selected if sheddable(group)]
+            if not candidates:
+                break
+            lowest = max(group.rank for group in candidates)
+            # Prossima scadenza dei gruppi più prioritari, compresi quelli letti ora
+            deadlines = [group.next_due + self.period(group) * ((group in selected) + DEADLINE_TOLERANCE)
+                         for group in self.poll_groups if group.rank < lowest]
+            cost = self.tag_latency * sum(len(group.tags) for group in selected)
+            if not deadlines or now + cost <= min(deadlines):
+                break
+            selected = [group for group in selected if group.rank < lowest or not sheddable(group)]
+        return selected
+
+    def _schedule(self, group, now):
+        """Cadenza fissa senza deriva; i cicli persi per sovraccarico vengono saltati."""
+        period = self.period(group)
+        group.next_due += period
+        if group.next_due <= now:
+            missed = math.floor((now - group.next_due) / period) + 1
+            self.overruns += missed
+            group.next_due += missed * period
+
+    def _adapt(self, now):
+        elapsed = now - self._window_start
+        if elapsed < ADAPT_INTERVAL:
+            return
+        self.utilization = self._busy / elapsed
+        self._busy = 0.0
+        self._window_start = now
+
+        if self.utilization > TARGET_UTILIZATION or self.error_rate > MAX_ERROR_RATE:
+            self.stretch = min(self.stretch * STRETCH_UP, MAX_STRETCH)
+        elif self.utilization < TARGET_UTILIZATION / 2 and self.error_rate < MAX_ERROR_RATE / 4:
+            self.stretch = max(self.stretch * STRETCH_DOWN, 1.0)
+
+    def _transaction(self, due, now):
+        selected = self._select(due, now) if self.connected else due
+        for group in due:
+            if group in selected:
+                group.skipped = 0
+            else:
+                group.skipped += 1
+                self.shed[group.priority] += len(group.tags)
+
+        tags = [tag for group in selected for tag in group.tags]
+        readings = None
+        if tags:
+            started = time.monotonic()
+            readings = self._poll_group(tags)
+            duration = time.monotonic() - started
+            self.cycles += 1
+            self.transactions += 1
+
+        # Le letture a dispositivo scollegato non dicono nulla sui suoi tempi di risposta
+        if readings is not None:
+            self._busy += duration
+            self.tag_latency = ewma(self.tag_latency, duration / len(tags))
+            bad = sum(1 for _, quality in readings if quality != QUALITY_GOOD)
+            self.error_rate = ewma(self.error_rate, bad / len(readings))
+
+        now = time.monotonic()
+        for group in due:
+            self._schedule(group, now)
+
+    def stats(self):
+        """Stato dello scheduler, per diagnostica."""
+        return {
+            'device': self.name_tag,
+            'stretch': self.stretch,
+            'utilization': self.utilization,
+            'error_rate': self.error_rate,
+            'tag_latency': self.tag_latency,
+            'transactions': self.transactions,
+            'overruns': self.overruns,
+            'shed': dict(self.shed),
+        }
+
+    def run(self):
+        start = time.monotonic()
+        self._window_start = start
+        for group in self.poll_groups:
+            group.next_due = start
+
+        while not self.stop_event.is_set():
+            if not self.connected:
+                self._try_connect()
+
+            now = time.monotonic()
+            due = [group for group in self.poll_groups if group.next_due <= now + COALESCE_WINDOW]
+            if due:
+                self._transaction(due, now)
+            self._adapt(time.monotonic())
+
+            next_due = min(group.next_due for group in self.poll_groups)
+            self.stop_event.wait(max(0.0, next_due - time.monotonic()))
+
+        self.device.close()
+        if any(self.shed.values()) or self.stretch > 1.0:
+            shed = ", ".join(f"{priority}={count}" for priority, count in self.shed.items() if count)
+            print(f"[{self.name_tag}] Letture scartate: {shed or 'nessuna'}; "
+                  f"fattore di rallentamento finale {self.stretch:.2f}")
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Collector distribuito su più processi.
+
+I dispositivi della configurazione vengono ripartiti in shard bilanciati per
+numero di letture al secondo; ogni shard gira in un processo separato con il
+proprio Collector, così la decodifica non è limitata dal GIL di un solo
+processo. I campioni tornano al processo principale a blocchi, come tuple,
+attraverso una pipe dedicata per ogni worker e vengono passati ai listener
+come con Collector. Un thread di supervisione riavvia i processi terminati:
+avendo pipe ed eventi propri, un worker che muore non blocca gli altri.
+
+Se nel processo principale le metriche sono attive (plc_metrics.enable_metrics),
+anche i worker le raccolgono e inviano periodicamente sulla stessa pipe le
+statistiche accumulate, che il principale somma nel proprio registro.
+"""
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing.connection import wait as wait_connections
+
+import plc_metrics
+from plc_collector import DEFAULT_POLL_RATE, Collector
+
+# Campioni accumulati da un worker prima dell'invio al processo principale
+DEFAULT_SHARD_BATCH_SIZE = 500
+# Tempo massimo di permanenza di un campione nel buffer del worker (secondi)
+DEFAULT_SHARD_FLUSH_INTERVAL = 0.1
+# Campioni in attesa oltre i quali un worker scarta i più vecchi (principale troppo lento)
+MAX_SHARD_BUFFER = 100000
+# Attesa massima tra due riavvii dello stesso shard (secondi)
+MAX_RESTART_DELAY = 60.0
+# Intervallo tra due invii delle metriche di un worker al processo principale (secondi)
+METRICS_FORWARD_INTERVAL = 1.0
+
+
+def device_load(device):
+    """Letture al secondo di un dispositivo: somma di 1/rate sui suoi tag."""
+    return sum(1.0 / float(tag.get("rate", DEFAULT_POLL_RATE)) for tag in device["tags"])
+
+
+def shard_devices(devices, shard_count):
+    """Ripartisce i dispositivi in shard_count gruppi con carico simile (LPT greedy)."""
+    shard_count = max(1, min(shard_count, len(devices)))
+    shards = [[] for _ in range(shard_count)]
+    loads = [0.0] * shard_count
+    for device in sorted(devices, key=device_load, reverse=True):
+        index = loads.index(min(loads))
+        shards[index].append(device)
+        loads[index] += device_load(device)
+    return shards
+
+
+class ShardForwarder:
+    """
+    Listener del Collector di un worker: accumula i campioni come tuple e un
+    thread li invia a blocchi sulla pipe, così i poller non aspettano mai la
+    serializzazione né un processo principale lento. Ogni messaggio è una
+    coppia ("samples", blocco) o ("metrics", statistiche dall'ultimo invio).
+    """
+
+    def __init__(self, connection, batch_size=DEFAULT_SHARD_BATCH_SIZE,
+                 flush_interval=DEFAULT_SHARD_FLUSH_INTERVAL):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="shard-forwarder", daemon=True)
+        self._thread.start()
+
+    def __call__(self, samples):
+        with self._lock:
+            self._buffer.extend((sample['timestamp'], sample['device'], sample['tag'],
+                                 sample['value'], sample['quality']) for sample in samples)
+            overflow = len(self._buffer) - MAX_SHARD_BUFFER
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self.dropped += overflow
+            if len(self._buffer) >= self.batch_size:
+                self._ready.set()
+
+    def _send(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            self._ready.clear()
+        if batch:
+            self.connection.send(("samples", batch))
+
+    def _send_metrics(self):
+        registry = plc_metrics.get_metrics()
+        if registry is None:
+            return
+        operations = registry.drain()
+        if operations:
+            self.connection.send(("metrics", operations))
+
+    def _run(self):
+        next_metrics = time.monotonic() + METRICS_FORWARD_INTERVAL
+        try:
+            while not self._stop.is_set():
+                self._ready.wait(self.flush_interval)
+                self._send()
+                if time.monotonic() >= next_metrics:
+                    self._send_metrics()
+                    next_metrics = time.monotonic() + METRICS_FORWARD_INTERVAL
+            self._send()
+            self._send_metrics()
+        except (BrokenPipeError, EOFError, OSError):
+            # Il processo principale è terminato: non c'è più nessuno a cui inviare
+            pass
+
+    def close(self):
+        self._stop.set()
+        self._ready.set()
+        self._thread.join()
+        self.connection.close()
+
+
+def run_shard(devices, connection, stop_event, options=None, metrics=False):
+    """
+    Corpo di un processo worker: raccoglie i dispositivi dello shard fino a
+    stop_event. options sono le chiavi globali della configurazione (es. scheduler);
+    con metrics le statistiche delle richieste vengono inviate al principale.
+    """
+    # Ctrl+C arriva a tutto il gruppo di processi: l'arresto è coordinato dal principale
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # I campioni escono dalla pipe: stdout del worker resta libero per il principale
+    sys.stdout = sys.stderr
+    if metrics:
+        plc_metrics.enable_metrics()
+
+    collector = Collector(dict(options or {}, devices=devices))
+    forwarder = ShardForwarder(connection)
+    collector.add_listener(forwarder)
+    collector.start()
+    try:
+        while not stop_event.wait(1.0):
+            pass
+    finally:
+        collector.stop()
+        forwarder.close()
+
+
+class ShardedCollector:
+    """Stessa interfaccia di Collector, con i dispositivi ripartiti su più processi."""
+
+    def __init__(self, config, workers=None):
+        self.config = config
+        self.workers = workers or os.cpu_count() or 1
+        self.shards = shard_devices(config["devices"], self.workers)
+        self.options = {key: value for key, value in config.items() if key != "devices"}
+        self.listeners = []
+        self.restarts = [0] * len(self.shards)
+        # spawn funziona su tutte le piattaforme e non eredita i thread del processo principale
+        self._context = multiprocessing.get_context("spawn")
+        self.stop_event = threading.Event()
+        self._workers_stopped = threading.Event()
+        self._processes = [None] * len(self.shards)
+        self._stop_events = [None] * len(self.shards)
+        self._connections = {}
+        self._connections_lock = threading.Lock()
+        self._next_restart = [0.0] * len(self.shards)
+        self._threads = []
+
+    def add_listener(self, listener):
+        """Registra una funzione che riceve ogni lista di campioni raccolti."""
+        self.listeners.append(listener)
+
+    def _start_shard(self, index):
+        receiver, sender = self._context.Pipe(duplex=False)
+        stop_event = self._context.Event()
+        process = self._context.Process(target=run_shard, name=f"shard-{index}",
+                                        args=(self.shards[index], sender, stop_event, self.options,
+                                              plc_metrics.get_metrics() is not None),
+                                        daemon=True)
+        process.start()
+        # Chiudendo qui il lato di scrittura, la morte del worker si vede come EOF sulla pipe
+        sender.close()
+        self._processes[index] = process
+        self._stop_events[index] = stop_event
+        with self._connections_lock:
+            self._connections[receiver] = index
+
+    def _emit(self, batch):
+        samples = [{'timestamp': timestamp, 'device': device, 'tag': tag, 'value': value, 'quality': quality}
+                   for timestamp, device, tag, value, quality in batch]
+        for listener in self.listeners:
+            try:
+                listener(samples)
+            except Exception as e:
+                print(f"Errore in un listener dei campioni: {e}")
+
+    def _aggregate(self):
+        while True:
+            with self._connections_lock:
+                connections = list(self._connections)
+            if not connections:
+                if self._workers_stopped.is_set():
+                    return
+                time.sleep(0.1)
+                continue
+
+            for connection in wait_connections(connections, timeout=0.5):
+                try:
+                    kind, payload = connection.recv()
+                except (EOFError, OSError):
+                    with self._connections_lock:
+                        self._connections.pop(connection, None)
+                    connection.close()
+                    continue
+                if kind == "metrics":
+                    registry = plc_metrics.get_metrics()
+                    if registry is not None:
+                        registry.merge(payload)
+                else:
+                    self._emit(payload)
+
+    def _supervise(self):
+        while not self.stop_event.wait(1.0):
+            for index, process in enumerate(self._processes):
+                if process.is_alive() or time.monotonic() < self._next_restart[index]:
+                    continue
+                self.restarts[index] += 1
+                delay = min(2 ** (self.restarts[index] - 1), MAX_RESTART_DELAY)
+                names = ", ".join(device["name"] for device in self.shards[index])
+                print(f"Shard {index} ({names}) terminato con codice {process.exitcode}, riavvio...")
+                self._start_shard(index)
+                # Un worker che termina subito non viene riavviato più spesso del backoff
+                self._next_restart[index] = time.monotonic() + delay
+
+    def start(self):
+        for index in range(len(self.shards)):
+            self._start_shard(index)
+        self._threads = [threading.Thread(target=self._aggregate, name="shard-aggregator", daemon=True),
+                         threading.Thread(target=self._supervise, name="shard-supervisor", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=10.0):
+        self.stop_event.set()
+        # Il supervisore non deve riavviare i worker durante l'arresto
+        for thread in self._threads[1:]:
+            thread.join(timeout)
+        for stop_event in self._stop_events:
+            if stop_event is not None:
+                stop_event.set()
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        # L'aggregatore esce dopo aver letto gli ultimi blocchi e l'EOF di ogni pipe
+        self._workers_stopped.set()
+        for thread in self._threads[:1]:
+            thread.join(timeout)
+
+    def run_forever(self):
+        """Avvia la raccolta e la mantiene attiva fino a SIGINT/SIGTERM."""
+        def _handle_signal(signum, frame):
+            self.stop_event.set()
+
+        signal.signal(signal.SIGINT, _handle_signal)
+        if hasattr(signal, "SIGTERM"):
+            signal.signal(signal.SIGTERM, _handle_signal)
+
+        self.start()
+        while not self.stop_event.is_set():
+            self.stop_event.wait(1.0)
+        self.stop()
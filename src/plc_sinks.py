@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Sink di output a lotti per i campioni raccolti.
+
+Ogni sink è un listener del Collector: riceve le liste di campioni in una coda
+limitata e un thread dedicato le scrive su disco a lotti (per numero di
+campioni o per tempo trascorso). Il thread di polling si limita a un
+put_nowait, quindi un disco lento non rallenta le letture: quando la coda è
+piena i blocchi in eccesso vengono scartati e conteggiati in self.dropped.
+Con block_timeout il chiamante attende invece fino a block_timeout secondi
+(None = senza limite) che si liberi posto, prima di scartare.
+
+Sink disponibili: SQLite (executemany in modalità WAL), CSV con rotazione per
+dimensione/tempo e Parquet a row group (richiede pyarrow).
+"""
+import csv
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from plc_collector import to_jsonable
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow è opzionale, serve solo a ParquetSink
+    pa = None
+    pq = None
+
+# Blocchi di campioni in attesa oltre i quali si scarta (ogni blocco è una lettura di un gruppo)
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 1000
+# Tempo massimo tra l'arrivo di un campione e la sua scrittura (secondi)
+DEFAULT_FLUSH_INTERVAL = 1.0
+# Intervallo minimo tra due avvisi di coda piena (secondi)
+DROP_WARNING_INTERVAL = 10.0
+
+SAMPLE_COLUMNS = ['timestamp', 'device', 'tag', 'value', 'quality']
+
+_STOP = object()
+
+
+def encode_value(value):
+    """Numeri e booleani restano tali; liste, array e altri tipi diventano testo JSON."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return json.dumps(value, default=to_jsonable)
+
+
+class BatchingSink:
+    """
+    Base dei sink: coda limitata + thread di scrittura. Le sottoclassi
+    implementano open(), write_batch(samples) e close_output(), tutti chiamati
+    dal thread di scrittura.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 queue_size=DEFAULT_QUEUE_SIZE, block_timeout=0.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # block_timeout > 0 (o None, senza limite) applica backpressure al chiamante prima di scartare
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+        self._last_drop_warning = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"sink-{type(self).__name__}", daemon=True)
+        self._thread.start()
+
+    def __call__(self, samples):
+        try:
+            if self.block_timeout is None:
+                self.queue.put(samples)
+            elif self.block_timeout > 0:
+                self.queue.put(samples, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(samples)
+        except queue.Full:
+            self.dropped += len(samples)
+            now = time.monotonic()
+            if now - self._last_drop_warning >= DROP_WARNING_INTERVAL:
+                self._last_drop_warning = now
+                print(f"{type(self).__name__}: coda piena, scartati {self.dropped} campioni finora")
+
+    def close(self, timeout=30.0):
+        """Scrive i campioni ancora in coda e chiude l'output."""
+        if not self._thread.is_alive():
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def pending(self):
+        """Numero di blocchi in attesa di scrittura."""
+        return self.queue.qsize()
+
+    def open(self):
+        pass
+
+    def write_batch(self, samples):
+        raise NotImplementedError
+
+    def close_output(self):
+        pass
+
+    def _flush(self, buffer):
+        if not buffer:
+            return
+        try:
+            self.write_batch(buffer)
+            self.written += len(buffer)
+            self.batches += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"{type(self).__name__}: errore durante la scrittura di {len(buffer)} campioni: {e}")
+
+    def _run(self):
+        try:
+            self.open()
+        except Exception as e:
+            print(f"{type(self).__name__}: errore durante l'apertura dell'output: {e}")
+            # Senza output i campioni vengono solo consumati, così il chiamante non si blocca
+            while self.queue.get() is not _STOP:
+                pass
+            return
+
+        buffer = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                if not buffer:
+                    deadline = time.monotonic() + self.flush_interval
+                buffer.extend(item)
+                if len(buffer) < self.batch_size:
+                    continue
+            self._flush(buffer)
+            buffer = []
+            deadline = None
+
+        try:
+            self.close_output()
+        except Exception as e:
+            print(f"{type(self).__name__}: errore durante la chiusura dell'output: {e}")
+
+
+class SqliteSink(BatchingSink):
+    """Scrive i campioni in una tabella SQLite con un executemany per lotto."""
+
+    def __init__(self, path, table="samples", **kwargs):
+        if not table.isidentifier():
+            raise ValueError(f"Nome tabella non valido: {table}")
+        self.path = path
+        self.table = table
+        self.connection = None
+        super().__init__(**kwargs)
+
+    def open(self):
+        # La connessione appartiene al thread di scrittura
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} "
+            "(timestamp REAL NOT NULL, device TEXT NOT NULL, tag TEXT NOT NULL, value, quality TEXT)")
+        self.connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_tag_time ON {self.table} (device, tag, timestamp)")
+        self.connection.commit()
+
+    def write_batch(self, samples):
+        rows = [(sample['timestamp'], sample['device'], sample['tag'], encode_value(sample['value']),
+                 sample['quality']) for sample in samples]
+        with self.connection:
+            self.connection.executemany(f"INSERT INTO {self.table} VALUES (?, ?, ?, ?, ?)", rows)
+
+    def close_output(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class RotatingCsvSink(BatchingSink):
+    """
+    Scrive i campioni in file CSV dentro 'directory', aprendo un nuovo file
+    quando quello corrente supera max_bytes o è aperto da più di max_seconds.
+    """
+
+    def __init__(self, directory, prefix="samples", max_bytes=100 * 1024 * 1024, max_seconds=3600.0, **kwargs):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.current_path = None
+        self._file = None
+        self._writer = None
+        self._opened_at = 0.0
+        super().__init__(**kwargs)
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _rotate(self):
+        self.close_output()
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(self.directory, f"{self.prefix}_{stamp}.csv")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{self.prefix}_{stamp}_{suffix}.csv")
+            suffix += 1
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(SAMPLE_COLUMNS)
+        self._opened_at = time.monotonic()
+        self.current_path = path
+
+    def write_batch(self, samples):
+        if (self._file is None or self._file.tell() >= self.max_bytes
+                or time.monotonic() - self._opened_at >= self.max_seconds):
+            self._rotate()
+        self._writer.writerows([sample['timestamp'], sample['device'], sample['tag'],
+                                encode_value(sample['value']), sample['quality']] for sample in samples)
+        self._file.flush()
+
+    def close_output(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+
+class ParquetSink(BatchingSink):
+    """
+    Scrive ogni lotto come row group di un file Parquet. I valori numerici
+    finiscono nella colonna 'value', gli altri (stringhe, liste) in 'value_text'.
+    """
+
+    def __init__(self, path, batch_size=10000, flush_interval=10.0, **kwargs):
+        if pa is None:
+            raise ValueError("Il sink Parquet richiede il pacchetto pyarrow.")
+        self.path = path
+        self._writer = None
+        super().__init__(batch_size=batch_size, flush_interval=flush_interval, **kwargs)
+
+    def open(self):
+        schema = pa.schema([
+            ('timestamp', pa.float64()),
+            ('device', pa.string()),
+            ('tag', pa.string()),
+            ('value', pa.float64()),
+            ('value_text', pa.string()),
+            ('quality', pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(self.path, schema)
+
+    def write_batch(self, samples):
+        numeric = []
+        text = []
+        for sample in samples:
+            value = sample['value']
+            if isinstance(value, (bool, int, float)):
+                numeric.append(float(value))
+                text.append(None)
+            else:
+                numeric.append(None)
+                text.append(None if value is None else encode_value(value))
+
+        table = pa.table({
+            'timestamp': [sample['timestamp'] for sample in samples],
+            'device': [sample['device'] for sample in samples],
+            'tag': [sample['tag'] for sample in samples],
+            'value': numeric,
+            'value_text': text,
+            'quality': [sample['quality'] for sample in samples],
+        }, schema=self._writer.schema)
+        self._writer.write_table(table)
+
+    def close_output(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Buffer circolari in memoria per le serie temporali dei tag raccolti.
+
+Ogni tag ha un buffer NumPy preallocato (timestamp, valore, qualità) con
+append O(1), query su finestra temporale (min/max/media/ultimo) e
+sottocampionamento a bucket, senza un oggetto Python per campione.
+
+Con "plc_collector.py --stats-json" il collector tiene un buffer per tag e
+riscrive periodicamente un file JSON con le statistiche dell'ultima finestra.
+"""
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from plc_collector import DEFAULT_POLL_RATE
+
+# Codici di qualità memorizzati nel buffer (un byte per campione)
+QUALITY_GOOD_CODE = 0
+QUALITY_BAD_CODE = 1
+QUALITY_NOT_CONNECTED_CODE = 2
+QUALITY_NAMES = {
+    QUALITY_GOOD_CODE: "Good",
+    QUALITY_BAD_CODE: "Bad",
+    QUALITY_NOT_CONNECTED_CODE: "BadNotConnected",
+}
+
+# Finestra conservata di default quando la capacità è calcolata dalla cadenza (secondi)
+DEFAULT_RETENTION = 3600.0
+DEFAULT_CAPACITY = 3600
+# Secondi tra due scritture del file delle statistiche
+DEFAULT_STATS_INTERVAL = 10.0
+
+
+def quality_to_code(quality):
+    """Converte la qualità di un campione (stringa o codice) nel codice a un byte."""
+    if isinstance(quality, int):
+        return quality
+    if quality == "Good":
+        return QUALITY_GOOD_CODE
+    if quality == "BadNotConnected":
+        return QUALITY_NOT_CONNECTED_CODE
+    return QUALITY_BAD_CODE
+
+
+def to_float(value):
+    """Converte un valore numerico o booleano in float; gli altri tipi diventano NaN."""
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return math.nan
+
+
+class TagRingBuffer:
+    """Buffer circolare preallocato per un singolo tag."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity <= 0:
+            raise ValueError("La capacità del buffer deve essere positiva.")
+        self.capacity = capacity
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._values = np.zeros(capacity, dtype=np.float64)
+        self._qualities = np.zeros(capacity, dtype=np.uint8)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value, quality="Good"):
+        """Aggiunge un campione; quando il buffer è pieno sovrascrive il più vecchio."""
+        numeric_value = to_float(value)
+        quality_code = quality_to_code(quality)
+        with self._lock:
+            head = self._head
+            self._timestamps[head] = timestamp
+            self._values[head] = numeric_value
+            self._qualities[head] = quality_code
+            self._head = (head + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def _physical(self, logical_index):
+        return (self._head - self._count + logical_index) % self.capacity
+
+    def _first_index_since(self, since):
+        """Ricerca binaria del primo campione con timestamp >= since (indice logico)."""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamps[self._physical(mid)] < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _segments(self, first):
+        """Restituisce al più due intervalli fisici che coprono gli indici logici [first, count)."""
+        length = self._count - first
+        if length <= 0:
+            return []
+        start = self._physical(first)
+        if start + length <= self.capacity:
+            return [(start, start + length)]
+        return [(start, self.capacity), (0, start + length - self.capacity)]
+
+    def window(self, seconds=None, now=None):
+        """
+        Restituisce (timestamps, valori, qualità) degli ultimi 'seconds' secondi,
+        in ordine cronologico. Senza 'seconds' restituisce l'intero buffer.
+        """
+        with self._lock:
+            if seconds is None or self._count == 0:
+                first = 0
+            else:
+                reference = now if now is not None else self._timestamps[self._physical(self._count - 1)]
+                first = self._first_index_since(reference - seconds)
+            segments = self._segments(first)
+            return tuple(self._concatenate(buffer, segments)
+                         for buffer in (self._timestamps, self._values, self._qualities))
+
+    @staticmethod
+    def _concatenate(buffer, segments):
+        if not segments:
+            return buffer[:0].copy()
+        return np.concatenate([buffer[start:end] for start, end in segments])
+
+    def last(self):
+        """Ultimo campione come (timestamp, valore, codice qualità), o None se vuoto."""
+        with self._lock:
+            if self._count == 0:
+                return None
+            index = self._physical(self._count - 1)
+            return float(self._timestamps[index]), float(self._values[index]), int(self._qualities[index])
+
+    def stats(self, seconds=None, now=None):
+        """Min/max/media/ultimo dei campioni validi nella finestra, più i conteggi."""
+        timestamps, values, qualities = self.window(seconds, now)
+        result = {'count': len(values), 'good': 0, 'min': None, 'max': None, 'mean': None,
+                  'last': None, 'last_timestamp': None}
+
+        mask = (qualities == QUALITY_GOOD_CODE) & ~np.isnan(values)
+        good_values = values[mask]
+        if len(good_values):
+            good_timestamps = timestamps[mask]
+            result.update(good=int(len(good_values)), min=float(good_values.min()),
+                          max=float(good_values.max()), mean=float(good_values.mean()),
+                          last=float(good_values[-1]), last_timestamp=float(good_timestamps[-1]))
+        return result
+
+    def downsample(self, bucket_seconds, seconds=None, now=None):
+        """
+        Sottocampiona la finestra in bucket di 'bucket_seconds' secondi allineati
+        all'epoca. Restituisce un dizionario di sequenze parallele: timestamp di
+        inizio bucket, min, max, media, ultimo valore e numero di campioni validi.
+        """
+        if bucket_seconds <= 0:
+            raise ValueError("L'ampiezza dei bucket deve essere positiva.")
+        timestamps, values, qualities = self.window(seconds, now)
+
+        mask = (qualities == QUALITY_GOOD_CODE) & ~np.isnan(values)
+        timestamps, values = timestamps[mask], values[mask]
+        if not len(values):
+            return {key: np.empty(0) for key in ('timestamp', 'min', 'max', 'mean', 'last', 'count')}
+        buckets = np.floor(timestamps / bucket_seconds).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        counts = np.diff(np.r_[starts, len(values)])
+        ends = starts + counts - 1
+        return {
+            'timestamp': buckets[starts] * bucket_seconds,
+            'min': np.minimum.reduceat(values, starts),
+            'max': np.maximum.reduceat(values, starts),
+            'mean': np.add.reduceat(values, starts) / counts,
+            'last': values[ends],
+            'count': counts,
+        }
+
+
+class TimeSeriesStore:
+    """
+    Insieme di buffer indicizzati per (dispositivo, tag). Può essere registrato
+    come listener del Collector: ogni campione ricevuto viene aggiunto al buffer
+    del proprio tag, creato al volo se non preconfigurato.
+    """
+
+    def __init__(self, default_capacity=DEFAULT_CAPACITY):
+        self.default_capacity = default_capacity
+        self.buffers = {}
+
+    @classmethod
+    def for_config(cls, config, retention=DEFAULT_RETENTION):
+        """Prealloca un buffer per ogni tag, dimensionato per 'retention' secondi alla sua cadenza."""
+        store = cls()
+        for device in config["devices"]:
+            for tag in device["tags"]:
+                rate = float(tag.get("rate", DEFAULT_POLL_RATE))
+                store.buffers[(device["name"], tag["name"])] = TagRingBuffer(max(1, math.ceil(retention / rate)))
+        return store
+
+    def get(self, device, tag):
+        return self.buffers.get((device, tag))
+
+    def __call__(self, samples):
+        for sample in samples:
+            key = (sample['device'], sample['tag'])
+            buffer = self.buffers.get(key)
+            if buffer is None:
+                buffer = self.buffers[key] = TagRingBuffer(self.default_capacity)
+            buffer.append(sample['timestamp'], sample['value'], sample['quality'])
+
+    def summary(self, seconds=None, now=None):
+        """Statistiche di ogni tag sugli ultimi 'seconds' secondi: {dispositivo: {tag: stats}}."""
+        now = time.time() if now is None else now
+        result = {}
+        for (device, tag), buffer in list(self.buffers.items()):
+            result.setdefault(device, {})[tag] = buffer.stats(seconds, now)
+        return result
+
+
+class StatsDumper(threading.Thread):
+    """Thread che riscrive periodicamente il file JSON con le statistiche dei tag."""
+
+    def __init__(self, store, path, window=None, interval=DEFAULT_STATS_INTERVAL):
+        super().__init__(name="stats-dumper", daemon=True)
+        self.store = store
+        self.path = path
+        self.window = window
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def dump(self):
+        temporary_path = f"{self.path}.tmp"
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as output_file:
+                json.dump(self.store.summary(self.window), output_file, indent=2)
+                output_file.write("\n")
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            print(f"Errore durante la scrittura delle statistiche: {e}")
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join(self.interval)
+        self.dump()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Punto di ingresso unico degli strumenti py-plc-utils.
+
+Ogni sottocomando importa il proprio stack (snap7, pymodbus, asyncua) solo
+quando viene eseguito: "plc-utils --help", "plc-utils scan" o "plc-utils poll"
+su un file di soli dispositivi Modbus non pagano l'import degli altri protocolli.
+
+Esempi:
+    plc-utils s7                       # reader S7 interattivo
+    plc-utils modbus                   # reader Modbus TCP interattivo
+    plc-utils opcua                    # navigatore OPC UA interattivo
+    plc-utils scan 192.168.0.10 --db 1 # scansione rack/slot S7
+    plc-utils poll tags.json --sqlite campioni.db
+    plc-utils replay impianto.cap tags.json --fast --sqlite replay.db
+    plc-utils recipe ricetta.json --verify
+"""
+import argparse
+import sys
+
+
+def run_s7(args):
+    import plc_s7_reader
+    plc_s7_reader.main()
+
+
+def run_modbus(args):
+    import plc_modbus_reader
+    plc_modbus_reader.main()
+
+
+def run_opcua(args):
+    import plc_opcua_reader
+    plc_opcua_reader.main()
+
+
+def run_scan(args):
+    import plc_s7_reader
+    online_plcs = plc_s7_reader.scan_plc_network(args.ip, args.db, args.port)
+    return 0 if online_plcs else 1
+
+
+def run_poll(collector_args):
+    import plc_collector
+    return plc_collector.main(collector_args)
+
+
+def run_replay(replay_args):
+    import plc_capture
+    return plc_capture.main(replay_args)
+
+
+def run_recipe(recipe_args):
+    import plc_recipe
+    return plc_recipe.main(recipe_args)
+
+
+# Sottocomandi i cui argomenti passano intatti al main del modulo
+PASSTHROUGH_COMMANDS = {"poll": run_poll, "replay": run_replay, "recipe": run_recipe}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="plc-utils", description="Strumenti per PLC S7, Modbus TCP e OPC UA.")
+    subparsers = parser.add_subparsers(dest="command", metavar="COMANDO")
+    subparsers.required = True
+
+    subparsers.add_parser("s7", help="reader Siemens S7 interattivo").set_defaults(handler=run_s7)
+    subparsers.add_parser("modbus", help="reader Modbus TCP interattivo").set_defaults(handler=run_modbus)
+    subparsers.add_parser("opcua", help="navigatore OPC UA interattivo").set_defaults(handler=run_opcua)
+
+    scan_parser = subparsers.add_parser("scan", help="scansione rack/slot di un PLC S7")
+    scan_parser.add_argument("ip", help="indirizzo IP del PLC")
+    scan_parser.add_argument("--db", type=int, default=1, help="DB da leggere per verificare l'accesso (default 1)")
+    scan_parser.add_argument("--port", type=int, default=102, help="porta ISO-on-TCP (default 102)")
+    scan_parser.set_defaults(handler=run_scan)
+
+    # Registrati solo per l'help: gli argomenti passano intatti al main del modulo
+    subparsers.add_parser("poll", help="collector headless da file dei tag (vedi 'poll --help')")
+    subparsers.add_parser("replay", help="riproduce una cattura di poll --capture (vedi 'replay --help')")
+    subparsers.add_parser("recipe", help="scarica una ricetta di parametri (vedi 'recipe --help')")
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    try:
+        if argv and argv[0] in PASSTHROUGH_COMMANDS:
+            return PASSTHROUGH_COMMANDS[argv[0]](argv[1:])
+        args = build_parser().parse_args(argv)
+        return args.handler(args) or 0
+    except KeyboardInterrupt:
+        print("\nInterrotto dall'utente.")
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Rende importabili i moduli di src/ nei test, come fa lo script plc-utils, e fornisce server S7 e OPC UA locali."""
+import ctypes
+import os
+import socket
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+# Dimensione del DB1 del server snap7 di test
+S7_DB_SIZE = 64
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def s7_server():
+    """Server snap7 con il solo DB1 registrato; restituisce (porta, memoria di DB1)."""
+    snap7 = pytest.importorskip("snap7")
+    from snap7.type import SrvArea
+
+    server = snap7.server.Server(log=False)
+    db1 = (ctypes.c_ubyte * S7_DB_SIZE)()
+    server.register_area(SrvArea.DB, 1, db1)
+    port = free_port()
+    server.start(tcp_port=port)
+    yield port, db1
+    server.stop()
+    server.destroy()
+
+
+@pytest.fixture
+def s7_client(s7_server):
+    """Client snap7 connesso al server di test, con DB1 azzerato."""
+    import plc_s7_reader
+
+    port, db1 = s7_server
+    ctypes.memset(db1, 0, S7_DB_SIZE)
+    client = plc_s7_reader.connect_to_plc("127.0.0.1", 0, 1, port)
+    assert client is not None
+    yield client
+    client.disconnect()
+
+
+class OpcUaTestServer:
+    """
+    Server asyncua locale con l'oggetto 2:Plant e le variabili scrivibili Tag0..Tag9
+    (Double) e Wave (array di Double). Può essere fermato e riavviato sullo stesso
+    endpoint per simulare la perdita della sessione.
+    """
+
+    def __init__(self):
+        import plc_opcua_reader
+
+        self.endpoint = f"opc.tcp://127.0.0.1:{free_port()}"
+        self.loop = plc_opcua_reader.BackgroundEventLoop(name="opcua-test-server")
+        self.server = None
+
+    def start(self):
+        from asyncua import Server, ua
+
+        async def _start():
+            server = Server()
+            await server.init()
+            server.set_endpoint(self.endpoint)
+            namespace = await server.register_namespace("test")
+            plant = await server.nodes.objects.add_object(ua.NodeId("Plant", namespace), "Plant")
+            for index in range(10):
+                variable = await plant.add_variable(ua.NodeId(f"Tag{index}", namespace), f"Tag{index}",
+                                                    float(index))
+                await variable.set_writable()
+            await plant.add_variable(ua.NodeId("Wave", namespace), "Wave", [float(x) for x in range(1500)])
+            await server.start()
+            return server
+
+        self.server = self.loop.run_until_complete(_start())
+
+    def stop(self):
+        if self.server is not None:
+            self.loop.run_until_complete(self.server.stop())
+            self.server = None
+
+    def write(self, name, value):
+        from asyncua import ua
+
+        self.loop.run_until_complete(self.server.write_attribute_value(
+            ua.NodeId(name, 2), ua.DataValue(ua.Variant(float(value), ua.VariantType.Double))))
+
+    def close(self):
+        self.stop()
+        self.loop.close()
+
+
+@pytest.fixture(scope="session")
+def opcua_server():
+    """Server OPC UA condiviso dai test; restituisce l'endpoint."""
+    pytest.importorskip("asyncua")
+    server = OpcUaTestServer()
+    server.start()
+    yield server.endpoint
+    server.close()
+
+
+@pytest.fixture
+def restartable_opcua_server():
+    """Server OPC UA dedicato al test, che il test può fermare e riavviare."""
+    pytest.importorskip("asyncua")
+    server = OpcUaTestServer()
+    server.start()
+    yield server
+    server.close()
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("asyncua")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import bench_opcua
+
+
+def run(argv):
+    report = bench_opcua.run_benchmarks(bench_opcua.parse_args(argv))
+    return {result['operation']: result for result in report['results']}
+
+
+def test_read_mode_counts_round_trips():
+    results = run(["--mode", "read", "--depth", "1", "--fanout", "2", "--variables", "5", "--repeat", "1"])
+    # Le 10 variabili delle due foglie: una Read per gli OperationLimits e una per i valori
+    assert results["read_nodes_values_bulk"]['items'] == 10
+    assert results["read_nodes_values_bulk"]['round_trips'] == {'ReadRequest': 2.0}
+    assert results["read_node_value"]['round_trips'] == {'ReadRequest': 10.0}
+
+
+def test_history_mode_reads_every_sample_across_truncated_blocks():
+    results = run(["--mode", "history", "--depth", "0", "--variables", "3", "--repeat", "1",
+                   "--history-nodes", "2", "--history-samples", "250", "--values-per-node", "100"])
+    assert results["history_read_raw_window"]['items'] == 500
+    # Un blocco troncato per tutti i nodi, poi due riprese per ciascun nodo
+    assert results["history_read_raw_window"]['round_trips']['HistoryReadRequest'] == 5.0
+    assert results["export_history"]['items'] == 500
+
+
+def test_subscription_mode_receives_every_update():
+    results = run(["--mode", "subscription", "--depth", "0", "--variables", "5",
+                   "--updates", "3", "--publish-ms", "50"])
+    subscription = results["SessionSupervisor.subscribe"]
+    assert subscription['notifications'] == subscription['notifications_expected'] == 15
+    assert subscription['round_trips'].get('PublishRequest', 0) >= 1
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Scritture a blocchi dei dispositivi del collector."""
+import ctypes
+
+import pytest
+
+from plc_collector import QUALITY_BAD, QUALITY_GOOD, coalesce_ranges
+
+
+def test_coalesce_ranges_zero_gap_joins_only_touching_tags():
+    blocks = coalesce_ranges([(0, 2, 0), (2, 2, 1), (6, 4, 2)], 0, 100)
+    assert [(start, size, [index for _, _, index in members]) for start, size, members in blocks] == \
+        [(0, 4, [0, 1]), (6, 4, [2])]
+
+
+def test_coalesce_ranges_respects_max_size():
+    blocks = coalesce_ranges([(0, 2, 0), (2, 2, 1), (4, 2, 2)], 0, 4)
+    assert [(start, size) for start, size, _ in blocks] == [(0, 4), (4, 2)]
+
+
+@pytest.fixture
+def s7_device(s7_client):
+    from plc_collector import S7Device
+
+    device = S7Device({"name": "plc", "ip": "127.0.0.1"})
+    device.plc = s7_client
+    return device
+
+
+def s7_tag(name, offset, data_type, **extra):
+    return dict(name=name, area="DB", db=1, offset=offset, type=data_type, **extra)
+
+
+def test_s7_write_never_touches_bytes_between_tags(s7_device, s7_server):
+    _, db1 = s7_server
+    ctypes.memset(db1, 0xFF, 16)
+    tags = [s7_tag("a", 0, "int"), s7_tag("b", 2, "int"), s7_tag("c", 6, "int")]
+    assert s7_device.write(tags, [1, 2, 3]) == [QUALITY_GOOD] * 3
+    # a e b sono contigui e formano un blocco; i byte 4-5 tra b e c restano invariati
+    assert bytes(db1[0:10]) == b"\x00\x01\x00\x02\xff\xff\x00\x03\xff\xff"
+    assert s7_device.read(tags) == [(1, QUALITY_GOOD), (2, QUALITY_GOOD), (3, QUALITY_GOOD)]
+
+
+def test_s7_write_bool_preserves_other_bits(s7_device, s7_server):
+    _, db1 = s7_server
+    db1[10] = 0b10100000
+    db1[11] = 0b00000001
+    tags = [s7_tag("run", 10, "bool", bit=0), s7_tag("alarm", 10, "bool", bit=7), s7_tag("setpoint", 11, "bool",
+                                                                                           bit=3)]
+    assert s7_device.write(tags, [True, False, True]) == [QUALITY_GOOD] * 3
+    assert db1[10] == 0b00100001
+    assert db1[11] == 0b00001001
+
+
+def test_s7_write_bad_db_marks_only_its_tags(s7_device, s7_server):
+    tags = [s7_tag("good", 0, "int"), dict(s7_tag("missing", 0, "int"), db=99)]
+    assert s7_device.write(tags, [7, 8]) == [QUALITY_GOOD, QUALITY_BAD]
+
+
+class FakeModbusResponse:
+    def isError(self):
+        return False
+
+
+class FakeModbusClient:
+    """Registra le richieste di scrittura e simula la memoria dei registri e delle coils."""
+
+    def __init__(self, size=32):
+        self.registers = [0xFFFF] * size
+        self.coils = [True] * size
+        self.requests = []
+
+    def write_registers(self, address, values, device_id=1):
+        self.requests.append(("write_registers", address, list(values)))
+        self.registers[address:address + len(values)] = values
+        return FakeModbusResponse()
+
+    def write_coils(self, address, values, device_id=1):
+        self.requests.append(("write_coils", address, list(values)))
+        self.coils[address:address + len(values)] = values
+        return FakeModbusResponse()
+
+
+@pytest.fixture
+def modbus_device():
+    pytest.importorskip("pymodbus")
+    from plc_collector import ModbusDevice
+
+    device = ModbusDevice({"name": "mb", "ip": "127.0.0.1"})
+    device.client = FakeModbusClient()
+    return device
+
+
+def test_modbus_write_never_touches_registers_between_tags(modbus_device):
+    tags = [{"name": "a", "table": "holding", "address": 0},
+            {"name": "b", "table": "holding", "address": 1, "type": "uint32"},
+            {"name": "c", "table": "holding", "address": 5}]
+    assert modbus_device.write(tags, [1, 0x00020003, 4]) == [QUALITY_GOOD] * 3
+    client = modbus_device.client
+    assert client.requests == [("write_registers", 0, [1, 2, 3]), ("write_registers", 5, [4])]
+    assert client.registers[:6] == [1, 2, 3, 0xFFFF, 0xFFFF, 4]
+
+
+def test_modbus_write_coils_and_read_only_tables(modbus_device):
+    tags = [{"name": "run", "table": "coil", "address": 0},
+            {"name": "modes", "table": "coil", "address": 1, "count": 2},
+            {"name": "stop", "table": "coil", "address": 4},
+            {"name": "level", "table": "input", "address": 0}]
+    assert modbus_device.write(tags, [False, [False, True], False, 3]) == [QUALITY_GOOD] * 3 + [QUALITY_BAD]
+    client = modbus_device.client
+    assert client.requests == [("write_coils", 0, [False, False, True]), ("write_coils", 4, [False])]
+    assert client.coils[:5] == [False, False, True, True, False]
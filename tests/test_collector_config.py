@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""File dei tag, classi di cadenza e ciclo di polling del collector."""
+import io
+import json
+import threading
+
+import pytest
+
+import plc_collector
+from plc_collector import (QUALITY_BAD, QUALITY_GOOD, QUALITY_NOT_CONNECTED, Collector, DevicePoller,
+                           JsonLinesWriter, group_tags_by_rate, load_tag_config, validate_tag_config)
+
+
+def opcua_config(endpoint="opc.tcp://127.0.0.1:4840", **tag):
+    return {"devices": [{"name": "linea1", "protocol": "opcua", "endpoint": endpoint,
+                         "tags": [dict({"name": "velocita", "node_id": "ns=2;s=Tag1"}, **tag)]}]}
+
+
+def test_load_json_and_toml_with_rate_classes(tmp_path):
+    config = {
+        "rate_classes": {"veloce": {"rate": 0.1, "priority": "high"}},
+        "devices": [{"name": "pressa", "protocol": "modbus", "ip": "127.0.0.1", "tags": [
+            {"name": "pressione", "table": "holding", "address": 0, "class": "veloce"},
+            {"name": "contatore", "table": "holding", "address": 1, "type": "uint32", "class": "veloce",
+             "rate": 5},
+        ]}],
+    }
+    json_path = tmp_path / "tags.json"
+    json_path.write_text(json.dumps(config), encoding="utf-8")
+    tags = load_tag_config(str(json_path))["devices"][0]["tags"]
+    assert (tags[0]["rate"], tags[0]["priority"]) == (0.1, "high")
+    # I campi del tag hanno la precedenza sulla classe
+    assert (tags[1]["rate"], tags[1]["priority"]) == (5, "high")
+
+    pytest.importorskip("tomllib")
+    toml_path = tmp_path / "tags.toml"
+    toml_path.write_text('[[devices]]\nname = "linea1"\nprotocol = "opcua"\nendpoint = "opc.tcp://host:4840"\n'
+                         '[[devices.tags]]\nname = "velocita"\nnode_id = "ns=2;s=Tag1"\n', encoding="utf-8")
+    assert load_tag_config(str(toml_path))["devices"][0]["tags"][0]["node_id"] == "ns=2;s=Tag1"
+
+
+def test_load_rejects_unknown_extension_and_class(tmp_path):
+    path = tmp_path / "tags.ini"
+    path.write_text("", encoding="utf-8")
+    with pytest.raises(ValueError, match="Estensione"):
+        load_tag_config(str(path))
+
+    path = tmp_path / "tags.json"
+    path.write_text(json.dumps(opcua_config(**{"class": "lenta"})), encoding="utf-8")
+    with pytest.raises(ValueError, match="classe di cadenza sconosciuta 'lenta'"):
+        load_tag_config(str(path))
+
+
+@pytest.mark.parametrize("config, message", [
+    ({}, "lista 'devices'"),
+    ({"devices": [{"protocol": "s7", "ip": "1.2.3.4", "tags": [{}]}]}, "'name'"),
+    ({"devices": [{"name": "a", "protocol": "profinet", "tags": [{}]}]}, "protocollo non supportato"),
+    ({"devices": [{"name": "a", "protocol": "s7", "tags": [{"name": "t"}]}]}, "manca 'ip'"),
+    ({"devices": [{"name": "a", "protocol": "modbus", "ip": "1.2.3.4", "tags": []}]}, "nessun tag"),
+    (opcua_config(rate=0), "'rate'"),
+    (opcua_config(priority="urgente"), "'priority'"),
+    (opcua_config(node_id=""), "manca 'node_id'"),
+    ({"devices": [{"name": "a", "protocol": "s7", "ip": "1.2.3.4",
+                   "tags": [{"name": "t", "type": "string", "offset": 0}]}]}, "richiede 'length'"),
+    ({"devices": [{"name": "a", "protocol": "modbus", "ip": "1.2.3.4",
+                   "tags": [{"name": "t", "table": "holding", "address": 0, "type": "float64"}]}]},
+     "tipo Modbus non supportato"),
+])
+def test_validate_tag_config_errors(config, message):
+    with pytest.raises(ValueError, match=message):
+        validate_tag_config(config)
+
+
+def test_validate_tag_config_rejects_duplicate_devices():
+    config = opcua_config()
+    config["devices"].append(dict(config["devices"][0]))
+    with pytest.raises(ValueError, match="duplicato"):
+        validate_tag_config(config)
+
+
+def test_group_tags_by_rate_uses_default_rate():
+    groups = group_tags_by_rate([{"name": "a"}, {"name": "b", "rate": 0.5}, {"name": "c", "rate": 1}])
+    assert {rate: [tag["name"] for tag in tags] for rate, tags in groups.items()} == {1.0: ["a", "c"], 0.5: ["b"]}
+
+
+class FakeDevice:
+    def __init__(self, config):
+        self.connects = 0
+        self.reachable = True
+
+    def connect(self):
+        self.connects += 1
+        return self.reachable
+
+    def read(self, tags):
+        return [(index, QUALITY_GOOD) for index, _ in enumerate(tags)]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_device(monkeypatch):
+    monkeypatch.setitem(plc_collector.DEVICE_CLASSES, "opcua", FakeDevice)
+
+
+def test_poller_emits_not_connected_samples_while_unreachable(fake_device):
+    emitted = []
+    poller = DevicePoller(opcua_config()["devices"][0], emitted.extend, threading.Event())
+    poller.device.reachable = False
+    poller._try_connect()
+    poller._poll_group(poller.groups[1.0])
+    assert [(sample["tag"], sample["quality"]) for sample in emitted] == [("velocita", QUALITY_NOT_CONNECTED)]
+    # Il backoff evita un nuovo tentativo immediato
+    poller._try_connect()
+    assert poller.device.connects == 1
+
+    poller.device.reachable = True
+    poller.next_reconnect = 0.0
+    poller._try_connect()
+    poller._poll_group(poller.groups[1.0])
+    assert (emitted[-1]["value"], emitted[-1]["quality"]) == (0, QUALITY_GOOD)
+
+
+def test_opcua_device_maps_results_to_tags(opcua_server):
+    device = plc_collector.OpcUaDevice({"name": "linea1", "endpoint": opcua_server})
+    assert device.connect()
+    try:
+        readings = device.read([{"name": "a", "node_id": "ns=2;s=Tag2"},
+                                {"name": "b", "node_id": "Objects/2:Plant/2:Manca"},
+                                {"name": "c", "node_id": "Objects/2:Plant/2:Tag4"}])
+    finally:
+        device.close()
+    assert readings == [(2.0, QUALITY_GOOD), (None, QUALITY_BAD), (4.0, QUALITY_GOOD)]
+
+
+def test_collector_writes_json_lines(opcua_server):
+    config = opcua_config(opcua_server, rate=0.05)
+    stream = io.StringIO()
+    collector = Collector(config)
+    collector.add_listener(JsonLinesWriter(stream))
+    done = threading.Event()
+    collector.add_listener(lambda samples: done.set())
+    collector.start()
+    try:
+        assert done.wait(10)
+    finally:
+        collector.stop()
+    sample = json.loads(stream.getvalue().splitlines()[0])
+    assert (sample["device"], sample["tag"], sample["value"], sample["quality"]) == \
+        ("linea1", "velocita", 1.0, QUALITY_GOOD)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""Istogrammi, registro delle metriche e formati di esportazione."""
+import json
+import pickle
+import re
+
+import pytest
+
+import plc_metrics
+from plc_metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_quantile_returns_bucket_upper_bound():
+    histogram = Histogram(bounds=(0.01, 0.1, 1.0))
+    for value in (0.005, 0.005, 0.05, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.quantile(0.4) == 0.01
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.8) == 1.0
+    # Oltre l'ultimo limite si usa il massimo osservato
+    assert histogram.quantile(0.99) == 3.0
+    assert Histogram().quantile(0.5) is None
+
+
+def test_histogram_boundary_value_falls_in_its_bucket():
+    histogram = Histogram(bounds=(0.01, 0.1))
+    histogram.observe(0.01)
+    assert histogram.counts == [1, 0, 0]
+
+
+def test_histogram_merge_sums_observations():
+    first, second = Histogram(bounds=(1.0, 2.0)), Histogram(bounds=(1.0, 2.0))
+    first.observe(0.5)
+    second.observe(1.5)
+    second.observe(4.0)
+    first.merge(second)
+    assert (first.counts, first.count, first.total, first.max) == ([1, 1, 1], 3, 6.0, 4.0)
+    assert first.cumulative_counts() == [1, 2, 3]
+
+
+def test_registry_counts_items_errors_and_timeouts():
+    registry = MetricsRegistry()
+    registry.record_request("s7", "read_area", 0.002, 10, "bytes")
+    registry.record_request("s7", "read_area", 0.003, unit="bytes", error=TimeoutError())
+    registry.record_request("s7", "read_area", 0.004, unit="bytes", error=RuntimeError("Recv TCP timeout"))
+    registry.record_request("s7", "read_area", 0.001, unit="bytes", error=True)
+    stats = registry.operations[("s7", "read_area")]
+    assert (stats.requests, stats.items, stats.errors, stats.timeouts) == (4, 10, 3, 2)
+    assert stats.to_dict()['latency_seconds']['count'] == 4
+
+
+def test_drain_and_merge_across_processes():
+    worker = MetricsRegistry()
+    worker.record_request("modbus", "read_holding_registers", 0.01, 5, "registers")
+    worker.record_decode("modbus", "read_holding_registers", 0.0001, "registers")
+    # Le statistiche viaggiano sulla pipe dei worker come pickle
+    operations = pickle.loads(pickle.dumps(worker.drain()))
+    assert worker.operations == {}
+
+    parent = MetricsRegistry()
+    parent.record_request("modbus", "read_holding_registers", 0.02, 5, "registers")
+    parent.merge(operations)
+    parent.merge(operations)
+    stats = parent.operations[("modbus", "read_holding_registers")]
+    assert (stats.requests, stats.items, stats.decode.count) == (3, 15, 2)
+
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry()
+    registry.record_request("opcua", "read", 0.003, 100, "nodes")
+    registry.record_request("opcua", "read", 20.0, unit="nodes", error=True)
+    text = registry.to_prometheus()
+    assert text.endswith("\n")
+
+    sample_re = re.compile(r'^[a-z_]+\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\} [0-9.e+-]+$')
+    for line in text.splitlines():
+        assert line.startswith(("# HELP ", "# TYPE ")) or sample_re.match(line), line
+
+    labels = 'protocol="opcua",operation="read"'
+    buckets = re.findall(rf'plc_request_duration_seconds_bucket\{{{labels},le="([^"]+)"\}} (\d+)', text)
+    assert buckets[0] == ("0.0005", "0") and buckets[-1] == ("+Inf", "2")
+    cumulative = [int(count) for _, count in buckets]
+    assert cumulative == sorted(cumulative)
+    assert f"plc_request_duration_seconds_count{{{labels}}} 2" in text
+    assert f'plc_request_items_total{{{labels},unit="nodes"}} 100' in text
+    assert f"plc_request_errors_total{{{labels}}} 1" in text
+    # Nessuna decodifica registrata: solo intestazioni per quell'istogramma
+    assert "plc_decode_duration_seconds_bucket" not in text
+
+
+def test_dumper_writes_json_and_textfile(tmp_path):
+    registry = MetricsRegistry()
+    registry.record_request("s7", "read_area", 0.002, 4, "bytes")
+    dumper = plc_metrics.MetricsDumper(registry, str(tmp_path / "m.prom"), str(tmp_path / "m.json"), interval=60)
+    dumper.dump()
+    document = json.loads((tmp_path / "m.json").read_text(encoding="utf-8"))
+    assert document['operations'][0]['operation'] == "read_area"
+    assert "plc_requests_total" in (tmp_path / "m.prom").read_text(encoding="utf-8")
+    assert not (tmp_path / "m.prom.tmp").exists()
+
+
+@pytest.fixture
+def metrics():
+    registry = plc_metrics.enable_metrics()
+    yield registry
+    plc_metrics.disable_metrics()
+
+
+def test_disabled_metrics_are_noops():
+    plc_metrics.disable_metrics()
+    assert plc_metrics.metrics_clock() is None
+    plc_metrics.record_request("s7", "read_area", None, 10)
+    assert plc_metrics.get_metrics() is None
+
+
+def test_s7_reads_are_instrumented(metrics, s7_client):
+    import plc_s7_reader
+    from snap7.type import Area
+
+    assert plc_s7_reader.read_plc_data(s7_client, Area.DB, 1, 0, 8, verbose=False) is not None
+    assert plc_s7_reader.read_plc_data(s7_client, Area.DB, 99, 0, 8, verbose=False) is None
+    stats = metrics.operations[("s7", "read_area")]
+    assert (stats.requests, stats.items, stats.errors, stats.unit) == (2, 8, 1, "bytes")
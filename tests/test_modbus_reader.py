@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Codifica dei registri Modbus, all'inverso di parse_register_data."""
+import pytest
+
+pytest.importorskip("pymodbus")
+
+import plc_modbus_reader  # noqa: E402
+
+
+@pytest.mark.parametrize("data_type, value", [
+    ('int16', 1234),
+    ('uint16', 65535),
+    ('int32', -123456789),
+    ('uint32', 4000000000),
+    ('dword', 0x12345678),
+    ('float32', -2.5),
+])
+@pytest.mark.parametrize("order", ['big', 'little'])
+def test_encode_parse_round_trip(data_type, value, order):
+    registers = plc_modbus_reader.encode_register_data(value, data_type, order)
+    assert plc_modbus_reader.parse_register_data(registers, data_type, order) == value
+
+
+def test_encode_32_bit_register_order():
+    assert plc_modbus_reader.encode_register_data(0x12345678, 'dword', 'big') == [0x1234, 0x5678]
+    assert plc_modbus_reader.encode_register_data(0x12345678, 'dword', 'little') == [0x5678, 0x1234]
+
+
+def test_encode_parse_string_round_trip():
+    registers = plc_modbus_reader.encode_register_data("ABC", 'string', string_length=6)
+    assert registers == [0x4142, 0x4300, 0x0000]
+    assert plc_modbus_reader.parse_register_data(registers, 'string') == "ABC"
+
+
+def test_encode_unsupported_type():
+    assert plc_modbus_reader.encode_register_data(1, 'int64') is None
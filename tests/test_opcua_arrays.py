@@ -0,0 +1,66 @@
+import io
+import json
+from array import array
+
+import pytest
+
+ua = pytest.importorskip("asyncua").ua
+
+import plc_opcua_reader
+from plc_collector import JsonLinesWriter, make_sample
+from plc_opcua_reader import data_value_to_result, infer_variant_type, to_numeric_array, to_variant
+
+
+def test_infer_variant_type_looks_at_every_element():
+    assert infer_variant_type([1, 2, 3]) == ua.VariantType.Int64
+    assert infer_variant_type([1, 2, 3.5]) == ua.VariantType.Double
+    assert infer_variant_type([True, False]) == ua.VariantType.Boolean
+    assert infer_variant_type([1, "a"]) is None
+    assert infer_variant_type([]) is None
+
+
+def test_to_numeric_array_uses_numpy_when_available():
+    np = pytest.importorskip("numpy")
+    values = to_numeric_array([1, 2, 3], ua.VariantType.Float)
+    assert isinstance(values, np.ndarray) and values.dtype == np.float32
+    assert to_numeric_array(["a", "b"]) == ["a", "b"]
+    assert to_numeric_array([[1, 2], [3]], ua.VariantType.Double) == [[1, 2], [3]]
+
+
+def test_to_numeric_array_falls_back_to_array_module(monkeypatch):
+    monkeypatch.setattr(plc_opcua_reader, "np", None)
+    values = to_numeric_array([1, 2, 3], ua.VariantType.Int16)
+    assert isinstance(values, array) and values.typecode == 'h'
+    assert to_numeric_array([1, 70000], ua.VariantType.Int16) == [1, 70000]
+
+
+def test_to_variant_converts_arrays_back_to_lists():
+    variant = to_variant(array('d', [1.0, 2.5]), ua.VariantType.Double)
+    assert variant.Value == [1.0, 2.5] and variant.VariantType == ua.VariantType.Double
+    assert to_variant(3, ua.VariantType.Float).Value == 3.0
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_array_values_round_trip_through_json_lines(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(plc_opcua_reader, "np", None)
+    wave = [float(x) / 4 for x in range(1500)]
+    data_value = ua.DataValue(ua.Variant(wave, ua.VariantType.Double))
+    result = data_value_to_result("ns=2;s=Wave", data_value)
+    assert plc_opcua_reader.is_numeric_array(result['value'])
+
+    stream = io.StringIO()
+    JsonLinesWriter(stream)([make_sample("linea1", "wave", result['value'], result['status'])])
+    assert json.loads(stream.getvalue())['value'] == wave
+
+
+def test_bulk_read_returns_whole_array(opcua_server):
+    client, loop = plc_opcua_reader.connect_to_opcua_server(opcua_server)
+    try:
+        [result] = plc_opcua_reader.read_nodes_values_bulk(client, loop, ["ns=2;s=Wave"])
+    finally:
+        plc_opcua_reader.disconnect_from_server(client, loop)
+    assert result['status'] == "Good"
+    assert list(result['value']) == [float(x) for x in range(1500)]
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Percorsi simbolici OPC UA e loro risoluzione sfogliando il server."""
+import asyncio
+
+import pytest
+
+ua = pytest.importorskip("asyncua").ua
+
+import plc_opcua_reader  # noqa: E402
+from plc_opcua_reader import NodeRegistry, is_browse_path, parse_browse_path  # noqa: E402
+
+
+def test_parse_browse_path_namespaces():
+    assert parse_browse_path("Objects/3:Impianto/Velocita", 2) == [(0, "Objects"), (3, "Impianto"), (2, "Velocita")]
+    assert parse_browse_path("/Root/Objects/Server/") == [(0, "Objects"), (None, "Server")]
+
+
+@pytest.mark.parametrize("path", ["/", "", "Root", "//Root/"])
+def test_parse_browse_path_rejects_empty(path):
+    with pytest.raises(ValueError, match="vuoto"):
+        parse_browse_path(path)
+
+
+def test_is_browse_path():
+    assert is_browse_path("Objects/Impianto")
+    assert not is_browse_path("ns=2;s=Linea/Motore")
+    assert not is_browse_path("i=85")
+    assert not is_browse_path(ua.NodeId(85))
+
+
+def reference(name, namespace, identifier):
+    ref = ua.ReferenceDescription()
+    ref.BrowseName = ua.QualifiedName(name, namespace)
+    ref.NodeId = ua.NodeId(identifier, namespace)
+    return ref
+
+
+def browse_result(references, continuation_point=None):
+    result = ua.BrowseResult()
+    result.References = references
+    result.ContinuationPoint = continuation_point
+    return result
+
+
+class FakeNode:
+    def __init__(self, nodeid):
+        self.nodeid = nodeid
+
+
+class PagingUaClient:
+    """Restituisce i riferimenti di Objects un elemento alla volta, con BrowseNext."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.browse_next_calls = 0
+
+    async def browse_next(self, params):
+        self.browse_next_calls += 1
+        results = []
+        for point in params.ContinuationPoints:
+            page = int(point)
+            more = str(page + 1).encode() if page + 1 < len(self.pages) else None
+            results.append(browse_result(self.pages[page], more))
+        return results
+
+
+class PagingClient:
+    def __init__(self, tree):
+        # tree: {NodeId: [pagine di riferimenti]}
+        self.tree = tree
+        self.uaclient = PagingUaClient(tree[ua.NodeId(ua.ObjectIds.ObjectsFolder)])
+
+    def get_node(self, node_id):
+        return FakeNode(node_id)
+
+    async def browse_nodes(self, nodes):
+        results = []
+        for node in nodes:
+            pages = self.tree.get(node.nodeid, [[]])
+            results.append((node, browse_result(pages[0], b"1" if len(pages) > 1 else None)))
+        return results
+
+
+def make_tree():
+    objects = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+    return {
+        ua.NodeId(ua.ObjectIds.RootFolder): [[reference("Objects", 0, ua.ObjectIds.ObjectsFolder)]],
+        objects: [[reference("Server", 0, 2253)], [reference("Linea1", 2, 1001)], [reference("Linea2", 2, 1002)]],
+        ua.NodeId(1002, 2): [[reference("Velocita", 2, 2001)]],
+    }
+
+
+def test_browse_references_follows_continuation_points():
+    client = PagingClient(make_tree())
+    objects = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+    references = asyncio.run(plc_opcua_reader.browse_references(client, [objects]))
+    assert [ref.BrowseName.Name for ref in references[0]] == ["Server", "Linea1", "Linea2"]
+    assert client.uaclient.browse_next_calls == 2
+
+
+def test_walk_by_names_finds_children_on_later_pages():
+    registry = NodeRegistry(PagingClient(make_tree()), loop=None, register_nodes=False)
+    resolved = asyncio.run(registry._walk_by_names(["Objects/Linea2/Velocita", "Objects/Manca"]))
+    assert resolved == {"Objects/Linea2/Velocita": ua.NodeId(2001, 2)}
+
+
+def test_registry_resolves_and_registers_on_server(opcua_server):
+    client, loop = plc_opcua_reader.connect_to_opcua_server(opcua_server)
+    try:
+        registry = NodeRegistry(client, loop)
+        resolved = registry.resolve(["Objects/2:Plant/2:Tag1", "ns=2;s=Tag2", "Objects/2:Plant/2:Manca"])
+        assert resolved[0] is not None and resolved[1] is not None and resolved[2] is None
+        assert registry.register_nodes_enabled
+        assert len(registry._registered) == 2
+        registry.close()
+        assert not registry._registered
+    finally:
+        plc_opcua_reader.disconnect_from_server(client, loop)
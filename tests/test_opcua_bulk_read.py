@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Letture OPC UA massive a blocchi (split_in_chunks, read_values_chunked)."""
+import asyncio
+
+import pytest
+
+ua = pytest.importorskip("asyncua").ua
+
+import plc_opcua_reader  # noqa: E402
+
+
+class FakeUaClient:
+    """Risponde alle Read con il numero del nodo e registra dimensione e concorrenza delle richieste."""
+
+    def __init__(self):
+        self.chunk_sizes = []
+        self.active = 0
+        self.max_active = 0
+
+    async def read(self, params):
+        self.chunk_sizes.append(len(params.NodesToRead))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return [ua.DataValue(ua.Variant(float(item.NodeId.Identifier), ua.VariantType.Double))
+                for item in params.NodesToRead]
+
+
+class FakeClient:
+    def __init__(self):
+        self.uaclient = FakeUaClient()
+
+
+def test_split_in_chunks():
+    assert plc_opcua_reader.split_in_chunks(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+    assert plc_opcua_reader.split_in_chunks([], 2) == []
+    # 0 = nessun limite dichiarato: si usa il blocco di default
+    default = plc_opcua_reader.DEFAULT_MAX_NODES_PER_REQUEST
+    assert len(plc_opcua_reader.split_in_chunks(list(range(default + 1)), 0)) == 2
+
+
+def test_read_values_chunked_respects_limits_and_order():
+    client = FakeClient()
+    node_ids = [ua.NodeId(index, 2) for index in range(25)]
+    results = asyncio.run(plc_opcua_reader.read_values_chunked(client, node_ids, 10, max_parallel=2))
+
+    assert client.uaclient.chunk_sizes == [10, 10, 5]
+    assert client.uaclient.max_active == 2
+    assert [item['value'] for item in results] == [float(index) for index in range(25)]
+    assert [item['node_id'] for item in results] == [node_id.to_string() for node_id in node_ids]
+    assert all(item['status'] == "Good" for item in results)
@@ -0,0 +1,147 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+ua = pytest.importorskip("asyncua").ua
+
+import plc_opcua_history
+from plc_opcua_history import history_read_raw_window, is_node_reference, split_time_range
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def data_value(seconds, value):
+    timestamp = START + timedelta(seconds=seconds)
+    return ua.DataValue(ua.Variant(float(value), ua.VariantType.Double),
+                        SourceTimestamp=timestamp, ServerTimestamp=timestamp)
+
+
+class TruncatingUaClient:
+    """Server storico che tronca a NumValuesPerNode senza restituire continuation point."""
+
+    def __init__(self, samples):
+        self.samples = samples
+        self.requests = 0
+
+    async def history_read(self, params):
+        self.requests += 1
+        details = params.HistoryReadDetails
+        results = []
+        for _ in params.NodesToRead:
+            selected = [dv for dv in self.samples
+                        if details.StartTime <= dv.SourceTimestamp < details.EndTime]
+            result = ua.HistoryReadResult()
+            result.HistoryData = ua.HistoryData(DataValues=selected[:details.NumValuesPerNode])
+            results.append(result)
+        return results
+
+
+class PagingUaClient:
+    """Server storico che pagina i campioni con i continuation point."""
+
+    def __init__(self, samples):
+        self.samples = samples
+        self.released = 0
+
+    async def history_read(self, params):
+        if params.ReleaseContinuationPoints:
+            self.released += len(params.NodesToRead)
+            return []
+        details = params.HistoryReadDetails
+        results = []
+        for value_id in params.NodesToRead:
+            offset = int(value_id.ContinuationPoint or b"0")
+            page = self.samples[offset:offset + details.NumValuesPerNode]
+            result = ua.HistoryReadResult()
+            result.HistoryData = ua.HistoryData(DataValues=page)
+            if offset + len(page) < len(self.samples):
+                result.ContinuationPoint = str(offset + len(page)).encode()
+            results.append(result)
+        return results
+
+
+class FakeClient:
+    def __init__(self, uaclient):
+        self.uaclient = uaclient
+
+
+def collect(uaclient, values_per_node, end=None):
+    received = []
+    asyncio.run(history_read_raw_window(
+        FakeClient(uaclient), [ua.NodeId("Tag1", 2)], START, end or START + timedelta(hours=1),
+        lambda node_id, values: received.extend(values), values_per_node))
+    return [(int((dv.SourceTimestamp - START).total_seconds()), dv.Value.Value) for dv in received]
+
+
+def test_split_time_range_covers_interval_without_overlap():
+    end = START + timedelta(minutes=150)
+    windows = split_time_range(START, end, timedelta(hours=1))
+    assert windows == [
+        (START, START + timedelta(hours=1)),
+        (START + timedelta(hours=1), START + timedelta(hours=2)),
+        (START + timedelta(hours=2), end),
+    ]
+    assert split_time_range(START, end, None) == [(START, end)]
+
+
+def test_resume_after_truncation_keeps_samples_sharing_last_timestamp():
+    samples = [data_value(0, 0), data_value(1, 1), data_value(2, 2), data_value(2, 3),
+               data_value(2, 4), data_value(3, 5), data_value(4, 6)]
+    # Il primo blocco si ferma a metà dei campioni con timestamp 2
+    assert collect(TruncatingUaClient(samples), values_per_node=4) == [
+        (0, 0.0), (1, 1.0), (2, 2.0), (2, 3.0), (2, 4.0), (3, 5.0), (4, 6.0)]
+
+
+def test_resume_stops_when_one_timestamp_exceeds_the_block(capsys):
+    samples = [data_value(0, value) for value in range(5)] + [data_value(1, 9)]
+    uaclient = TruncatingUaClient(samples)
+    assert collect(uaclient, values_per_node=3) == [(0, 0.0), (0, 1.0), (0, 2.0)]
+    assert uaclient.requests == 2
+    assert "lettura interrotta" in capsys.readouterr().out
+
+
+def test_continuation_points_are_followed():
+    samples = [data_value(second, second) for second in range(7)]
+    assert collect(PagingUaClient(samples), values_per_node=3) == [(s, float(s)) for s in range(7)]
+
+
+def test_continuation_points_are_released_on_error():
+    uaclient = PagingUaClient([data_value(second, second) for second in range(7)])
+
+    def _fail(node_id, values):
+        raise RuntimeError("disco pieno")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(history_read_raw_window(FakeClient(uaclient), [ua.NodeId("Tag1", 2)],
+                                            START, START + timedelta(hours=1), _fail, 3))
+    assert uaclient.released == 0
+
+    received = []
+
+    def _fail_second_block(node_id, values):
+        received.extend(values)
+        if len(received) > 3:
+            raise RuntimeError("disco pieno")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(history_read_raw_window(FakeClient(uaclient), [ua.NodeId("Tag1", 2)],
+                                            START, START + timedelta(hours=1), _fail_second_block, 3))
+    assert uaclient.released == 1
+
+
+def test_is_node_reference():
+    assert is_node_reference("ns=2;s=Tag1")
+    assert is_node_reference("i=2258")
+    assert is_node_reference("Objects/2:Plant/2:Tag1")
+    assert not is_node_reference("nodi.txt")
+    assert not is_node_reference("/tmp/nodi.txt")
+    assert not is_node_reference("dati/nodi.txt")
+
+
+def test_interactive_export_reports_missing_file(monkeypatch, capsys):
+    monkeypatch.setattr("builtins.input", lambda prompt="": "/percorso/inesistente/nodi.txt")
+    monkeypatch.setattr(plc_opcua_history, "export_history",
+                        lambda *args, **kwargs: pytest.fail("esportazione non attesa"))
+    plc_opcua_history.export_history_interactive(None, None)
+    assert "non trovato" in capsys.readouterr().out
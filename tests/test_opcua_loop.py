@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""Event loop OPC UA in background e chiusura della sessione."""
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("asyncua")
+
+import plc_opcua_reader  # noqa: E402
+
+
+def test_run_until_complete_runs_on_background_thread():
+    loop = plc_opcua_reader.BackgroundEventLoop()
+    try:
+        async def _thread_name():
+            await asyncio.sleep(0)
+            return threading.current_thread().name
+
+        assert loop.run_until_complete(_thread_name()) == "opcua-loop"
+        futures = [loop.submit(asyncio.sleep(0.01, result=index)) for index in range(5)]
+        assert [future.result(1) for future in futures] == list(range(5))
+    finally:
+        loop.close()
+    assert loop.is_closed()
+
+
+def test_submit_after_close_raises():
+    loop = plc_opcua_reader.BackgroundEventLoop()
+    loop.close()
+    with pytest.raises(RuntimeError):
+        loop.submit(asyncio.sleep(0))
+
+
+class FailingClient:
+    async def disconnect(self):
+        raise ConnectionError("socket chiuso")
+
+
+def test_disconnect_closes_loop_when_disconnect_fails():
+    loop = plc_opcua_reader.BackgroundEventLoop()
+    plc_opcua_reader.disconnect_from_server(FailingClient(), loop)
+    assert loop.is_closed()
+    assert not loop._thread.is_alive()
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("asyncua")
+
+from plc_opcua_session import STATUS_NOT_CONNECTED, SessionSupervisor
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.values = []
+        self.gaps = []
+        self.changed = threading.Event()
+
+    def datachange_notification(self, node, value, data):
+        self.values.append(value)
+        self.changed.set()
+
+    def gap_notification(self, start, end):
+        self.gaps.append((start, end))
+
+
+def wait_until(condition, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def make_supervisor(endpoint):
+    return SessionSupervisor(endpoint, keepalive_interval=0.2, keepalive_timeout=1.0,
+                             reconnect_min_delay=0.2, reconnect_max_delay=0.5)
+
+
+def test_reads_and_writes_through_registered_nodes(opcua_server):
+    supervisor = make_supervisor(opcua_server)
+    assert supervisor.start()
+    try:
+        written = supervisor.write_values(["Objects/2:Plant/2:Tag7"], [7.5])
+        assert [result['status'] for result in written] == ["Good"]
+        [result] = supervisor.read_values(["Objects/2:Plant/2:Tag7"])
+        assert result['value'] == 7.5
+        assert supervisor.registry._registered
+    finally:
+        supervisor.write_values(["ns=2;s=Tag7"], [7.0])
+        supervisor.stop()
+    assert supervisor.client is None and supervisor.registry is None
+
+
+def test_recovers_session_and_subscriptions_after_server_restart(restartable_opcua_server, capsys):
+    server = restartable_opcua_server
+    supervisor = make_supervisor(server.endpoint)
+    handler = RecordingHandler()
+    assert supervisor.start()
+    try:
+        assert supervisor.subscribe(["ns=2;s=Tag3"], handler, period_ms=50) is not None
+        assert handler.changed.wait(5)
+
+        server.stop()
+        assert wait_until(lambda: not supervisor.connected)
+        # Durante il disservizio le letture non bloccano e marcano i nodi come non connessi
+        started = time.monotonic()
+        [result] = supervisor.read_values(["ns=2;s=Tag3"])
+        assert result['status'] == STATUS_NOT_CONNECTED
+        assert time.monotonic() - started < 0.5
+
+        server.start()
+        assert wait_until(lambda: supervisor.connected and supervisor.reconnections == 1)
+        assert len(supervisor.gaps) == 1 and handler.gaps == supervisor.gaps
+
+        handler.changed.clear()
+        server.write("Tag3", 33.0)
+        assert wait_until(lambda: 33.0 in handler.values)
+        [result] = supervisor.read_values(["ns=2;s=Tag3"])
+        assert result['status'] == "Good" and result['value'] == 33.0
+    finally:
+        supervisor.stop()
+    assert "Riconnesso" in capsys.readouterr().out
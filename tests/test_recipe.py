@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Caricamento, confronto e download delle ricette."""
+import json
+
+import pytest
+
+import plc_recipe
+from plc_collector import QUALITY_BAD, QUALITY_GOOD, validate_tag
+
+
+def test_values_match():
+    assert plc_recipe.values_match(1.5, 1.5000000001)
+    assert not plc_recipe.values_match(1.5, 1.6)
+    assert plc_recipe.values_match([1, 2.0], (1, 2))
+    assert not plc_recipe.values_match([1, 2], [1, 2, 3])
+    assert not plc_recipe.values_match([1], 1)
+    assert plc_recipe.values_match("abc", "abc")
+
+
+def test_load_recipe_requires_values(tmp_path):
+    path = tmp_path / "ricetta.json"
+    path.write_text(json.dumps({"devices": [{"name": "plc", "protocol": "s7", "ip": "127.0.0.1", "tags": [
+        {"name": "speed", "area": "DB", "db": 1, "offset": 0, "type": "int"}]}]}), encoding="utf-8")
+    with pytest.raises(ValueError, match="value"):
+        plc_recipe.load_recipe(str(path))
+
+
+@pytest.mark.parametrize("variant_type", ["Double", "Int16", "Boolean"])
+def test_validate_tag_accepts_variant_type_names(variant_type):
+    pytest.importorskip("asyncua")
+    validate_tag("opc", "opcua", {"name": "t", "node_id": "ns=2;s=Tag0", "type": variant_type})
+
+
+@pytest.mark.parametrize("variant_type", ["double", "real", "Float64"])
+def test_validate_tag_rejects_unknown_variant_types(variant_type):
+    pytest.importorskip("asyncua")
+    with pytest.raises(ValueError, match="tipo OPC UA non valido"):
+        validate_tag("opc", "opcua", {"name": "t", "node_id": "ns=2;s=Tag0", "type": variant_type})
+
+
+def test_download_device_writes_and_verifies(s7_server):
+    port, db1 = s7_server
+    db1[4] = 0b01000000
+    device_config = {"name": "plc", "protocol": "s7", "ip": "127.0.0.1", "slot": 1, "port": port, "tags": [
+        {"name": "speed", "area": "DB", "db": 1, "offset": 0, "type": "int", "value": 1200},
+        {"name": "ratio", "area": "DB", "db": 1, "offset": 6, "type": "real", "value": 0.1},
+        {"name": "enable", "area": "DB", "db": 1, "offset": 4, "type": "bool", "bit": 0, "value": True},
+        {"name": "missing", "area": "DB", "db": 99, "offset": 0, "type": "int", "value": 1},
+    ]}
+    results = plc_recipe.download_device(device_config, verify=True)
+    assert [result['status'] for result in results] == [QUALITY_GOOD] * 3 + [QUALITY_BAD]
+    assert [result['verified'] for result in results] == [True, True, True, None]
+    assert db1[4] == 0b01000001
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Codifica, impacchettamento e scrittura dei dati S7."""
+import pytest
+
+pytest.importorskip("snap7")
+
+import plc_s7_reader  # noqa: E402
+from snap7.type import Area  # noqa: E402
+
+
+@pytest.mark.parametrize("data_type, value, size, length", [
+    ('int', -12345, 2, None),
+    ('int', 32767, 2, None),
+    ('real', 1.5, 4, None),
+    ('udint', 4000000000, 4, None),
+    ('string', "ricetta", 10, 10),
+])
+def test_encode_parse_round_trip(data_type, value, size, length):
+    data = bytearray(size)
+    assert plc_s7_reader.encode_data(data, data_type, value, 0, length)
+    assert plc_s7_reader.parse_data(data, data_type, 0, length) == value
+
+
+def test_encode_bool_touches_only_its_bit():
+    data = bytearray(b"\xa0\x00")
+    assert plc_s7_reader.encode_data(data, 'bool', True, 3, byte_index=1)
+    assert data == bytearray(b"\xa0\x08")
+    assert plc_s7_reader.parse_data(data, 'bool', 3, byte_index=1) is True
+    assert plc_s7_reader.encode_data(data, 'bool', False, 5)
+    assert data == bytearray(b"\x80\x08")
+
+
+def test_encode_string_is_truncated_to_length():
+    data = bytearray(4)
+    assert plc_s7_reader.encode_data(data, 'string', "troppo lunga", 0, 4)
+    assert plc_s7_reader.parse_data(data, 'string', 0, 4) == "trop"
+
+
+def test_pack_write_items_respects_pdu():
+    # 12 byte di intestazione e 16 + 10 byte per variabile: in un PDU da 240 ne stanno 8
+    writes = [(Area.DB, 1, index * 10, bytes(10)) for index in range(10)]
+    batches = plc_s7_reader.pack_write_items(writes, 240)
+    assert [len(batch) for batch in batches] == [8, 2]
+    assert [write for batch in batches for write in batch] == writes
+
+
+def test_pack_write_items_respects_item_limit():
+    writes = [(Area.DB, 1, index * 2, bytes(1)) for index in range(25)]
+    batches = plc_s7_reader.pack_write_items(writes, 960)
+    assert [len(batch) for batch in batches] == [plc_s7_reader.MAX_WRITE_ITEMS, 5]
+
+
+def test_pack_write_items_keeps_large_write_alone():
+    writes = [(Area.DB, 1, 0, bytes(4)), (Area.DB, 1, 10, bytes(300)), (Area.DB, 1, 400, bytes(4))]
+    batches = plc_s7_reader.pack_write_items(writes, 240)
+    assert [len(batch) for batch in batches] == [1, 1, 1]
+
+
+def test_write_multi_reports_each_item(s7_client, s7_server):
+    _, db1 = s7_server
+    results = plc_s7_reader.write_multi_plc_data(
+        s7_client, [(Area.DB, 1, 0, b"\x01\x02"), (Area.DB, 99, 0, b"\x03\x04")], verbose=False)
+    assert results == [True, False]
+    assert bytes(db1[0:2]) == b"\x01\x02"
+
+
+def test_write_multi_all_items_good(s7_client, s7_server):
+    _, db1 = s7_server
+    results = plc_s7_reader.write_multi_plc_data(
+        s7_client, [(Area.DB, 1, 0, b"\x01\x02"), (Area.DB, 1, 10, b"\x05")], verbose=False)
+    assert results == [True, True]
+    assert bytes(db1[0:2]) == b"\x01\x02" and db1[10] == 5
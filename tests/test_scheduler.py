@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Scheduler adattivo: gruppi per priorità, rallentamento, scarto delle letture e letture a blocchi."""
+import threading
+
+import pytest
+
+import plc_collector
+import plc_scheduler
+from plc_collector import QUALITY_BAD, QUALITY_GOOD
+from plc_scheduler import (MAX_CONSECUTIVE_SHEDS, MAX_STRETCH, OVERLOAD_UTILIZATION, STRETCH_UP,
+                           AdaptiveDevicePoller, group_tags_by_class)
+
+
+class FakeDevice:
+    """Dispositivo finto: registra i gruppi di tag letti in ogni transazione."""
+
+    def __init__(self, config):
+        self.config = config
+        self.reads = []
+        self.quality = QUALITY_GOOD
+
+    def connect(self):
+        return True
+
+    def close(self):
+        pass
+
+    def read(self, tags):
+        self.reads.append([tag["name"] for tag in tags])
+        return [(0, self.quality)] * len(tags)
+
+
+def tag(name, rate, priority="normal"):
+    return {"name": name, "rate": rate, "priority": priority}
+
+
+@pytest.fixture
+def make_poller(monkeypatch):
+    monkeypatch.setitem(plc_collector.DEVICE_CLASSES, "s7", FakeDevice)
+    samples = []
+
+    def _make(tags):
+        poller = AdaptiveDevicePoller({"name": "dev", "protocol": "s7", "tags": tags}, samples.extend,
+                                      threading.Event())
+        poller.connected = True
+        return poller
+
+    _make.samples = samples
+    return _make
+
+
+def groups_by_priority(poller):
+    return {group.priority: group for group in poller.poll_groups}
+
+
+def test_groups_sorted_by_priority_then_rate():
+    groups = group_tags_by_class([tag("energy", 60, "low"), tag("alarm", 0.1, "high"), tag("temp", 1),
+                                  tag("flow", 0.5), {"name": "default"}, tag("alarm2", 0.1, "high")])
+    assert [(group.priority, group.rate, [item["name"] for item in group.tags]) for group in groups] == [
+        ("high", 0.1, ["alarm", "alarm2"]),
+        ("normal", 0.5, ["flow"]),
+        ("normal", 1.0, ["temp", "default"]),
+        ("low", 60.0, ["energy"]),
+    ]
+
+
+def test_period_stretches_by_priority(make_poller):
+    poller = make_poller([tag("alarm", 0.1, "high"), tag("temp", 1), tag("energy", 10, "low")])
+    poller.stretch = 2.0
+    groups = groups_by_priority(poller)
+    assert poller.period(groups["high"]) == pytest.approx(0.1)
+    assert poller.period(groups["normal"]) == pytest.approx(2.0)
+    assert poller.period(groups["low"]) == pytest.approx(40.0)
+
+
+def test_adapt_stretches_under_load_and_recovers(make_poller):
+    poller = make_poller([tag("temp", 1)])
+    poller._busy = 0.95
+    poller._adapt(1.0)
+    assert poller.utilization == pytest.approx(0.95)
+    assert poller.stretch == pytest.approx(STRETCH_UP)
+
+    # Dispositivo scarico ma con molti errori: si continua a rallentare
+    poller.error_rate = 0.5
+    poller._adapt(2.0)
+    assert poller.stretch == pytest.approx(STRETCH_UP ** 2)
+
+    poller.error_rate = 0.0
+    for second in range(3, 40):
+        poller._adapt(float(second))
+    assert poller.stretch == 1.0
+
+    poller.stretch = MAX_STRETCH
+    poller._busy = 1.0
+    poller._adapt(41.0)
+    assert poller.stretch == MAX_STRETCH
+
+
+def test_adapt_waits_for_a_full_interval(make_poller):
+    poller = make_poller([tag("temp", 1)])
+    poller._busy = 0.5
+    poller._adapt(0.5)
+    assert poller.stretch == 1.0
+    assert poller._busy == 0.5
+
+
+def test_overload_sheds_low_priority_first(make_poller):
+    poller = make_poller([tag("alarm", 0.1, "high"), tag("temp", 1), tag("energy", 10, "low")])
+    poller.utilization = OVERLOAD_UTILIZATION
+    selected = poller._select(poller.poll_groups, 0.0)
+    assert [group.priority for group in selected] == ["high", "normal"]
+
+
+def test_deadline_sheds_from_the_lowest_priority(make_poller):
+    poller = make_poller([tag("alarm", 0.1, "high")] + [tag(f"t{i}", 1) for i in range(5)]
+                         + [tag(f"e{i}", 10, "low") for i in range(10)])
+    groups = groups_by_priority(poller)
+    # Scadenza dell'allarme: 0.1 * (1 + DEADLINE_TOLERANCE) = 0.15 s dopo la lettura
+    poller.tag_latency = 0.01
+    assert [group.priority for group in poller._select(poller.poll_groups, 0.0)] == ["high", "normal"]
+
+    poller.tag_latency = 0.03
+    assert poller._select(poller.poll_groups, 0.0) == [groups["high"]]
+
+    # Se la lettura rientra nella scadenza non si scarta nulla
+    poller.tag_latency = 0.001
+    assert poller._select(poller.poll_groups, 0.0) == poller.poll_groups
+
+
+def test_high_priority_and_starved_groups_are_never_shed(make_poller):
+    poller = make_poller([tag(f"a{i}", 0.1, "high") for i in range(50)] + [tag("energy", 10, "low")])
+    groups = groups_by_priority(poller)
+    poller.utilization = 1.0
+    poller.tag_latency = 1.0
+    assert poller._select(poller.poll_groups, 0.0) == [groups["high"]]
+
+    groups["low"].skipped = MAX_CONSECUTIVE_SHEDS
+    assert poller._select(poller.poll_groups, 0.0) == poller.poll_groups
+
+
+def test_transaction_merges_due_groups_and_counts_sheds(make_poller):
+    poller = make_poller([tag("alarm", 0.1, "high"), tag("temp", 1), tag("energy", 10, "low"),
+                          tag("energy2", 10, "low")])
+    groups = groups_by_priority(poller)
+    poller.utilization = 1.0
+
+    for expected_skipped in range(1, MAX_CONSECUTIVE_SHEDS + 1):
+        poller._transaction(poller.poll_groups, 0.0)
+        assert groups["low"].skipped == expected_skipped
+    assert poller.device.reads == [["alarm", "temp"]] * MAX_CONSECUTIVE_SHEDS
+    assert poller.shed == {"high": 0, "normal": 0, "low": 2 * MAX_CONSECUTIVE_SHEDS}
+
+    # Dopo MAX_CONSECUTIVE_SHEDS scarti il gruppo viene letto comunque, nella stessa transazione
+    poller._transaction(poller.poll_groups, 0.0)
+    assert poller.device.reads[-1] == ["alarm", "temp", "energy", "energy2"]
+    assert groups["low"].skipped == 0
+    assert poller.transactions == MAX_CONSECUTIVE_SHEDS + 1
+    assert {sample["tag"] for sample in make_poller.samples} == {"alarm", "temp", "energy", "energy2"}
+
+
+def test_transaction_tracks_error_rate_and_latency(make_poller):
+    poller = make_poller([tag("temp", 1)])
+    poller.device.quality = QUALITY_BAD
+    poller._transaction(poller.poll_groups, 0.0)
+    assert poller.error_rate == pytest.approx(plc_scheduler.EWMA_ALPHA)
+    assert poller.tag_latency is not None
+    assert poller.stats()["transactions"] == 1
+
+
+def test_disconnected_transaction_does_not_adapt(make_poller):
+    poller = make_poller([tag("temp", 1)])
+    poller.connected = False
+    poller._transaction(poller.poll_groups, 0.0)
+    assert poller.device.reads == []
+    assert poller.tag_latency is None
+    assert [sample["quality"] for sample in make_poller.samples] == [plc_collector.QUALITY_NOT_CONNECTED]
+
+
+def test_schedule_skips_missed_cycles(make_poller):
+    poller = make_poller([tag("temp", 1)])
+    group = poller.poll_groups[0]
+    group.next_due = 10.0
+    poller._schedule(group, 10.5)
+    assert group.next_due == 11.0
+    assert poller.overruns == 0
+    poller._schedule(group, 13.5)
+    assert group.next_due == 14.0
+    assert poller.overruns == 2
+
+
+class CountingPlc:
+    """Inoltra le letture al client snap7 e ne registra gli intervalli."""
+
+    def __init__(self, plc):
+        self.plc = plc
+        self.reads = []
+
+    def read_area(self, area, db_number, start, size):
+        self.reads.append((db_number, start, size))
+        return self.plc.read_area(area, db_number, start, size)
+
+
+def test_s7_read_coalesces_nearby_tags_into_one_block(s7_client, s7_server):
+    from plc_collector import S7Device
+
+    _, db1 = s7_server
+    db1[1] = 1
+    db1[5] = 2
+    db1[41] = 3
+    device = S7Device({"name": "plc", "ip": "127.0.0.1"})
+    device.plc = CountingPlc(s7_client)
+    tags = [{"name": "a", "db": 1, "offset": 0, "type": "int"},
+            {"name": "b", "db": 1, "offset": 4, "type": "int"},
+            {"name": "c", "db": 1, "offset": 40, "type": "int"}]
+    assert device.read(tags) == [(1, QUALITY_GOOD), (2, QUALITY_GOOD), (3, QUALITY_GOOD)]
+    # a e b distano meno di S7_MAX_GAP_BYTES: un blocco; c è lontano e viene letto da solo
+    assert device.plc.reads == [(1, 0, 6), (1, 40, 2)]
+
+
+def test_s7_failed_block_falls_back_to_single_tags(s7_client):
+    from plc_collector import S7Device
+
+    device = S7Device({"name": "plc", "ip": "127.0.0.1"})
+    device.plc = CountingPlc(s7_client)
+    # Il blocco esce dal DB1 di 64 byte: fallisce, e ogni tag viene riletto da solo
+    tags = [{"name": "a", "db": 1, "offset": 60, "type": "int"},
+            {"name": "b", "db": 1, "offset": 70, "type": "int"}]
+    assert device.read(tags) == [(0, QUALITY_GOOD), (None, QUALITY_BAD)]
+    assert device.plc.reads == [(1, 60, 12), (1, 60, 2), (1, 70, 2)]
+
+
+class FakeRegisters:
+    def __init__(self, registers=None):
+        self.registers = registers
+
+    def isError(self):
+        return self.registers is None
+
+
+class FakeModbusClient:
+    """Registri di holding 0..size-1 con valore pari all'indirizzo; le richieste oltre size falliscono."""
+
+    def __init__(self, size=300):
+        self.size = size
+        self.requests = []
+
+    def read_holding_registers(self, address, count, device_id=1):
+        self.requests.append((address, count))
+        if address + count > self.size:
+            return FakeRegisters()
+        return FakeRegisters(list(range(address, address + count)))
+
+
+@pytest.fixture
+def modbus_device():
+    pytest.importorskip("pymodbus")
+    from plc_collector import ModbusDevice
+
+    device = ModbusDevice({"name": "mb", "ip": "127.0.0.1"})
+    device.client = FakeModbusClient()
+    return device
+
+
+def test_modbus_read_packs_blocks_up_to_the_protocol_maximum(modbus_device):
+    tags = [{"name": f"r{address}", "table": "holding", "address": address} for address in range(0, 250, 5)]
+    readings = modbus_device.read(tags)
+    assert readings == [(address, QUALITY_GOOD) for address in range(0, 250, 5)]
+    assert modbus_device.client.requests == [(0, 121), (125, 121)]
+
+
+def test_modbus_failed_block_falls_back_to_single_tags(modbus_device):
+    tags = [{"name": "ok", "table": "holding", "address": 295},
+            {"name": "bad", "table": "holding", "address": 300}]
+    assert modbus_device.read(tags) == [(295, QUALITY_GOOD), (None, QUALITY_BAD)]
+    assert modbus_device.client.requests == [(295, 6), (295, 1), (300, 1)]
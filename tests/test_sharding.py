@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Ripartizione dei dispositivi tra i worker e collector multi-processo."""
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+import plc_metrics
+import plc_sharding
+from plc_collector import make_sample
+from plc_sharding import ShardedCollector, ShardForwarder, device_load, shard_devices
+
+
+def device(name, *rates):
+    return {"name": name, "tags": [{"name": f"t{index}", "rate": rate} for index, rate in enumerate(rates)]}
+
+
+def test_device_load_is_reads_per_second():
+    assert device_load(device("a", 0.1, 0.5, 1)) == pytest.approx(13.0)
+    assert device_load({"name": "b", "tags": [{"name": "t"}]}) == 1.0
+
+
+def test_shard_devices_balances_load():
+    devices = [device("a", 0.1), device("b", 0.2), device("c", 0.25), device("d", 0.5), device("e", 1), device("f", 1)]
+    shards = shard_devices(devices, 2)
+    loads = sorted(sum(device_load(item) for item in shard) for shard in shards)
+    # Carichi 10, 5, 4, 2, 1, 1: LPT li divide in 11 + 12
+    assert loads == [11.0, 12.0]
+    assert sorted(item["name"] for shard in shards for item in shard) == list("abcdef")
+
+
+def test_shard_count_is_capped_by_devices():
+    assert len(shard_devices([device("a", 1), device("b", 1)], 8)) == 2
+    assert len(shard_devices([device("a", 1)], 0)) == 1
+
+
+def receive_all(connection, timeout=5.0):
+    messages = []
+    while connection.poll(timeout):
+        try:
+            messages.append(connection.recv())
+        except EOFError:
+            break
+    return messages
+
+
+def test_forwarder_sends_tuples_and_metrics():
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    registry = plc_metrics.enable_metrics()
+    try:
+        forwarder = ShardForwarder(sender, batch_size=3, flush_interval=0.05)
+        forwarder([make_sample("dev", "a", 1, "Good", 10.0), make_sample("dev", "b", [1, 2], "Good", 10.0)])
+        registry.record_request("s7", "read_area", 0.001, 4, "bytes")
+        forwarder.close()
+    finally:
+        plc_metrics.disable_metrics()
+    messages = receive_all(receiver)
+    samples = [item for kind, payload in messages if kind == "samples" for item in payload]
+    assert samples == [(10.0, "dev", "a", 1, "Good"), (10.0, "dev", "b", [1, 2], "Good")]
+    [metrics] = [payload for kind, payload in messages if kind == "metrics"]
+    assert metrics[("s7", "read_area")].items == 4
+
+
+def test_forwarder_drops_oldest_samples_when_main_process_lags(monkeypatch):
+    monkeypatch.setattr(plc_sharding, "MAX_SHARD_BUFFER", 4)
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    forwarder = ShardForwarder(sender, batch_size=100, flush_interval=60)
+    forwarder([make_sample("dev", f"t{index}", index, "Good", 1.0) for index in range(6)])
+    forwarder.close()
+    [(kind, batch)] = receive_all(receiver)
+    assert forwarder.dropped == 2
+    assert [item[2] for item in batch] == ["t2", "t3", "t4", "t5"]
+
+
+def test_sharded_collector_merges_samples_metrics_and_restarts_workers(opcua_server):
+    config = {"devices": [
+        {"name": f"linea{index}", "protocol": "opcua", "endpoint": opcua_server,
+         "tags": [{"name": "velocita", "node_id": f"ns=2;s=Tag{index}", "rate": 0.1}]}
+        for index in (1, 2)]}
+    registry = plc_metrics.enable_metrics()
+    received = {}
+    lock = threading.Lock()
+
+    def _listener(samples):
+        with lock:
+            for sample in samples:
+                received.setdefault(sample["device"], []).append(sample)
+
+    collector = ShardedCollector(config, workers=2)
+    collector.add_listener(_listener)
+    try:
+        collector.start()
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and len(received) < 2:
+            time.sleep(0.1)
+        assert {name: samples[-1]["value"] for name, samples in received.items()} == {"linea1": 1.0, "linea2": 2.0}
+
+        collector._processes[0].kill()
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and not (collector.restarts[0] and collector._processes[0].is_alive()):
+            time.sleep(0.1)
+        assert collector.restarts == [1, 0]
+    finally:
+        collector.stop()
+        plc_metrics.disable_metrics()
+    assert registry.operations[("opcua", "read")].requests > 0
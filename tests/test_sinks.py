@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Sink a lotti: batching, backpressure, codifica dei valori e rotazione dei CSV."""
+import argparse
+import csv
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+import pytest
+
+import plc_sinks
+from plc_collector import create_sinks, make_sample
+from plc_sinks import BatchingSink, RotatingCsvSink, SqliteSink, encode_value
+
+
+class RecordingSink(BatchingSink):
+    """Sink che memorizza i lotti; write_batch può essere trattenuto con un Event."""
+
+    def __init__(self, **kwargs):
+        self.batches_written = []
+        self.release = threading.Event()
+        self.release.set()
+        super().__init__(**kwargs)
+
+    def write_batch(self, samples):
+        self.release.wait()
+        self.batches_written.append(list(samples))
+
+
+def samples(count, tag="t"):
+    return [make_sample("dev", tag, index, "Good", float(index)) for index in range(count)]
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not condition():
+        time.sleep(0.01)
+    return condition()
+
+
+def test_batches_flush_by_size_and_by_time():
+    sink = RecordingSink(batch_size=5, flush_interval=0.2)
+    sink(samples(3))
+    sink(samples(3))
+    # 6 campioni superano batch_size: un lotto subito
+    assert wait_until(lambda: len(sink.batches_written) == 1)
+    assert len(sink.batches_written[0]) == 6
+    sink(samples(2))
+    assert wait_until(lambda: len(sink.batches_written) == 2)
+    assert len(sink.batches_written[1]) == 2
+    sink.close()
+    assert (sink.written, sink.batches, sink.dropped) == (8, 2, 0)
+
+
+def test_close_writes_pending_samples():
+    sink = RecordingSink(batch_size=1000, flush_interval=60)
+    sink(samples(4))
+    sink.close()
+    assert [len(batch) for batch in sink.batches_written] == [4]
+
+
+def test_full_queue_drops_without_block_timeout():
+    sink = RecordingSink(batch_size=1, queue_size=1)
+    sink.release.clear()
+    sink(samples(1))
+    assert wait_until(lambda: sink.pending() == 0)
+    sink(samples(1))
+    started = time.monotonic()
+    sink(samples(2))
+    assert time.monotonic() - started < 0.1
+    assert sink.dropped == 2
+    sink.release.set()
+    sink.close()
+    assert sink.written == 2
+
+
+def test_block_timeout_waits_for_room():
+    sink = RecordingSink(batch_size=1, queue_size=1, block_timeout=5.0)
+    sink.release.clear()
+    sink(samples(1))
+    assert wait_until(lambda: sink.pending() == 0)
+    sink(samples(1))
+    threading.Timer(0.2, sink.release.set).start()
+    started = time.monotonic()
+    sink(samples(2))
+    assert 0.1 < time.monotonic() - started < 5.0
+    sink.close()
+    assert (sink.written, sink.dropped) == (4, 0)
+
+
+def test_encode_value_writes_arrays_as_json_lists():
+    assert encode_value(3) == 3 and encode_value(None) is None and encode_value("a") == "a"
+    assert json.loads(encode_value(array('d', [1.5, 2.0]))) == [1.5, 2.0]
+    assert json.loads(encode_value([1, 2])) == [1, 2]
+    np = pytest.importorskip("numpy")
+    wave = np.arange(1500, dtype=np.float32)
+    assert json.loads(encode_value(wave)) == wave.tolist()
+
+
+def test_sqlite_sink_stores_scalars_and_arrays(tmp_path):
+    path = str(tmp_path / "samples.db")
+    sink = SqliteSink(path, flush_interval=0.05)
+    sink([make_sample("dev", "speed", 1.5, "Good", 10.0),
+          make_sample("dev", "wave", array('h', [1, 2, 3]), "Good", 10.0)])
+    sink.close()
+    with sqlite3.connect(path) as connection:
+        rows = connection.execute("SELECT tag, value FROM samples ORDER BY tag").fetchall()
+    assert rows[0] == ("speed", 1.5)
+    assert rows[1][0] == "wave" and json.loads(rows[1][1]) == [1, 2, 3]
+
+
+def test_csv_sink_rotates_by_size(tmp_path):
+    sink = RotatingCsvSink(str(tmp_path), max_bytes=200, batch_size=1, flush_interval=0.01)
+    for index in range(6):
+        sink(samples(3, tag=f"tag{index}"))
+        assert wait_until(lambda: sink.batches == index + 1)
+    sink.close()
+    files = sorted(glob.glob(os.path.join(str(tmp_path), "samples_*.csv")))
+    assert len(files) > 1
+    rows = []
+    for path in files:
+        with open(path, encoding="utf-8", newline="") as csv_file:
+            reader = csv.reader(csv_file)
+            assert next(reader) == plc_sinks.SAMPLE_COLUMNS
+            rows.extend(reader)
+    assert len(rows) == 18
+
+
+def test_create_sinks_passes_block_timeout(tmp_path):
+    args = argparse.Namespace(sqlite=str(tmp_path / "a.db"), csv_dir=str(tmp_path / "csv"), parquet=None,
+                              sink_block_timeout=2.5)
+    sinks = create_sinks(args)
+    try:
+        assert [sink.block_timeout for sink in sinks] == [2.5, 2.5]
+    finally:
+        for sink in sinks:
+            sink.close()
+
+
+def test_parquet_sink_splits_numeric_and_text_values(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "samples.parquet")
+    sink = plc_sinks.ParquetSink(path, flush_interval=0.05)
+    sink([make_sample("dev", "speed", 2, "Good", 1.0), make_sample("dev", "wave", array('d', [1.0]), "Good", 1.0)])
+    sink.close()
+    table = pq.read_table(path).to_pydict()
+    assert table["value"] == [2.0, None]
+    assert table["value_text"] == [None, "[1.0]"]
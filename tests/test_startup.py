@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Budget di import di plc-utils e import pigri degli stack dei protocolli."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+# Tempo massimo degli import causati da plc-utils, misurato con -X importtime (esclusa la
+# partenza dell'interprete): l'import tipico è di poche decine di ms, il margine copre una CI carica
+IMPORT_BUDGET_MS = 150.0
+PROTOCOL_STACKS = ("snap7", "pymodbus", "asyncua", "numpy", "pyarrow", "yaml")
+
+
+def loaded_modules(code):
+    """Esegue code in un interprete nuovo e restituisce gli stack importati."""
+    probe = (f"import json, sys\nsys.path.insert(0, {SRC!r})\n{code}\n"
+             f"print(json.dumps([name for name in {PROTOCOL_STACKS!r} if name in sys.modules]))")
+    result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def top_level_imports(code):
+    """Moduli importati direttamente da code con il loro tempo cumulativo (ms), da -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True, check=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # I moduli annidati sono indentati: il loro tempo è già nel cumulativo del padre
+        if not name.startswith("  ") and cumulative.strip().isdigit():
+            imports[name.strip()] = int(cumulative) / 1000.0
+    return imports
+
+
+@pytest.mark.parametrize("argv", [["--help"], ["poll", "--help"]])
+def test_help_imports_within_budget(argv):
+    interpreter = top_level_imports("pass")
+    code = f"import sys\nsys.path.insert(0, {SRC!r})\nimport plc_utils\n" \
+           f"try:\n    plc_utils.main({argv!r})\nexcept SystemExit:\n    pass"
+    imports = {name: ms for name, ms in top_level_imports(code).items() if name not in interpreter}
+    assert "plc_utils" in imports
+    assert sum(imports.values()) <= IMPORT_BUDGET_MS, imports
+
+
+def test_import_does_not_load_protocol_stacks():
+    assert loaded_modules("import plc_utils") == []
+
+
+@pytest.mark.parametrize("argv", [["--help"], ["scan", "--help"], ["poll", "--help"]])
+def test_help_does_not_load_protocol_stacks(argv):
+    code = f"import plc_utils\ntry:\n    plc_utils.main({argv!r})\nexcept SystemExit:\n    pass"
+    assert loaded_modules(code) == []
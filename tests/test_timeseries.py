@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Buffer circolari dei tag, statistiche e sottocampionamento."""
+import json
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import plc_collector
+from plc_timeseries import (QUALITY_BAD_CODE, QUALITY_GOOD_CODE, StatsDumper, TagRingBuffer, TimeSeriesStore)
+
+
+def test_wraparound_keeps_latest_samples_in_order():
+    buffer = TagRingBuffer(capacity=4)
+    for second in range(10):
+        buffer.append(float(second), second * 10)
+    timestamps, values, qualities = buffer.window()
+    assert len(buffer) == 4
+    assert timestamps.tolist() == [6.0, 7.0, 8.0, 9.0]
+    assert values.tolist() == [60.0, 70.0, 80.0, 90.0]
+    assert buffer.last() == (9.0, 90.0, QUALITY_GOOD_CODE)
+
+
+def test_window_searches_across_the_wrap_point():
+    buffer = TagRingBuffer(capacity=5)
+    for second in range(7):
+        buffer.append(float(second), second)
+    # Il buffer contiene 2..6, con 5 e 6 all'inizio della memoria fisica
+    assert buffer.window(2.5)[0].tolist() == [4.0, 5.0, 6.0]
+    assert buffer.window(10, now=100.0)[0].tolist() == []
+    assert TagRingBuffer(3).window(5)[1].tolist() == []
+
+
+def test_stats_ignore_bad_and_non_numeric_samples():
+    buffer = TagRingBuffer(capacity=8)
+    buffer.append(1.0, 4)
+    buffer.append(2.0, 100, "Bad")
+    buffer.append(3.0, "testo")
+    buffer.append(4.0, True)
+    buffer.append(5.0, None, "BadNotConnected")
+    stats = buffer.stats()
+    assert stats == {'count': 5, 'good': 2, 'min': 1.0, 'max': 4.0, 'mean': 2.5, 'last': 1.0,
+                     'last_timestamp': 4.0}
+    assert buffer.window()[2].tolist()[1] == QUALITY_BAD_CODE
+    assert TagRingBuffer(2).stats()['mean'] is None
+
+
+def test_downsample_buckets_aligned_to_epoch():
+    buffer = TagRingBuffer(capacity=16)
+    for second, value in [(10.0, 1), (11.0, 3), (14.9, 2), (15.0, 8), (16.0, math.nan), (21.0, 5)]:
+        buffer.append(second, value)
+    result = buffer.downsample(5)
+    assert result['timestamp'].tolist() == [10, 15, 20]
+    assert result['min'].tolist() == [1.0, 8.0, 5.0]
+    assert result['max'].tolist() == [3.0, 8.0, 5.0]
+    assert result['mean'].tolist() == [2.0, 8.0, 5.0]
+    assert result['last'].tolist() == [2.0, 8.0, 5.0]
+    assert result['count'].tolist() == [3, 1, 1]
+    with pytest.raises(ValueError):
+        buffer.downsample(0)
+
+
+def test_store_sizes_buffers_from_rates_and_dumps_summary(tmp_path):
+    config = {"devices": [{"name": "linea1", "tags": [{"name": "veloce", "rate": 0.5}, {"name": "lento"}]}]}
+    store = TimeSeriesStore.for_config(config, retention=60)
+    assert store.get("linea1", "veloce").capacity == 120
+    assert store.get("linea1", "lento").capacity == 60
+
+    store([plc_collector.make_sample("linea1", "veloce", 2.0, "Good", 100.0),
+           plc_collector.make_sample("linea1", "nuovo", 7, "Good", 100.0)])
+    assert store.get("linea1", "nuovo").capacity == store.default_capacity
+
+    path = tmp_path / "stats.json"
+    StatsDumper(store, str(path), window=30).dump()
+    summary = json.loads(path.read_text(encoding="utf-8"))
+    # Campioni più vecchi della finestra rispetto all'ora corrente: nessun valore
+    assert summary["linea1"]["veloce"]["count"] == 0
+    assert store.summary(30, now=110.0)["linea1"]["veloce"]["last"] == 2.0
+
+
+def test_collector_cli_writes_stats_file(tmp_path, monkeypatch, opcua_server):
+    config_path = tmp_path / "tags.json"
+    config_path.write_text(json.dumps({"devices": [{
+        "name": "linea1", "protocol": "opcua", "endpoint": opcua_server,
+        "tags": [{"name": "velocita", "node_id": "ns=2;s=Tag1", "rate": 0.05}]}]}), encoding="utf-8")
+    stats_path = tmp_path / "stats.json"
+
+    def _run_briefly(self):
+        self.start()
+        self.stop_event.wait(0.5)
+        self.stop()
+
+    monkeypatch.setattr(plc_collector.Collector, "run_forever", _run_briefly)
+    assert plc_collector.main([str(config_path), "--output", str(tmp_path / "samples.jsonl"),
+                               "--stats-json", str(stats_path), "--stats-window", "5"]) == 0
+    stats = json.loads(stats_path.read_text(encoding="utf-8"))["linea1"]["velocita"]
+    assert stats["good"] >= 1 and stats["last"] == 1.0